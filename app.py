@@ -1,253 +1,248 @@
 #!/usr/bin/python3
 
-import re
 import sys
-import subprocess
 import os
 import tempfile
-import urllib.request
-import shutil
+import bisect
 #import pkg_resources
-import multiprocessing
 
-# Now import PyQt classes
-from PyQt6.QtCore import QCoreApplication
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                           QPushButton, QMessageBox, QListWidget,
+                           QPushButton, QMessageBox, QListWidget, QListWidgetItem,
                            QHBoxLayout, QProgressBar, QLabel, QFileDialog,
-                           QMenuBar, QMenu, QStatusBar)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
-from PyQt6.QtGui import QAction
+                           QListView, QInputDialog)
+from PyQt6.QtCore import Qt, QThread, QObject, pyqtSignal, QAbstractListModel, QModelIndex, QTimer, QUrl
+from PyQt6.QtGui import QAction, QActionGroup, QDesktopServices
+
+# The render pipeline lives in videothing.py next to this file, every release ships the two together
+engine_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "videothing.py")
+if not os.path.exists(engine_path):
+    # Never fetched here, code only comes through the updater which checks it against the release hashes
+    missing_engine_app = QApplication(sys.argv)
+    QMessageBox.critical(None, "Video Thing", f"The render engine is missing:\n{engine_path}\n\n"
+                         "Please reinstall Video Thing from the latest release.")
+    sys.exit(1)
+
+import videothing
+from videothing import (Renderer, RenderJob, JobScheduler, RENDER_MODES, AUDIO_MODES, OUTPUT_FORMATS, DEFAULT_PROFILE,
+                        DEFAULT_LOUDNESS, get_encoding_profile, get_encoding_profiles, get_media_info_cache, get_artifact_cache, get_trace_path,
+                        get_cache_dir, natural_sort_key, parse_rendition, format_duration, RenderPlanner,
+                        get_scratch_root, load_settings, save_settings, Updater, get_final_output_path,
+                        ServerClient, ProgressEvent)
 
 class MergeWorker(QThread):
     progress = pyqtSignal(int)
+    progress_event = pyqtSignal(object)
+    message = pyqtSignal(str)
     finished = pyqtSignal(bool, str)
 
-    def __init__(self, video_paths, audio_paths, output_path):
+    def __init__(self, video_paths, audio_paths, output_path, render_mode="loop_tile", audio_mode="cached",
+                 profile=DEFAULT_PROFILE, preview=False, renditions=(), output_format="mp4"):
+        super().__init__()
+        self.output_path = get_final_output_path(output_path, output_format)
+        self.preview = preview
+        self.renderer = None
+        self.error = None
+        try:
+            self.renderer = Renderer(video_paths, audio_paths, output_path, render_mode,
+                                     on_progress=self.progress.emit, on_event=self.progress_event.emit,
+                                     audio_mode=audio_mode, trace_path=get_trace_path(output_path),
+                                     on_message=self.message.emit, profile=profile, renditions=renditions,
+                                     output_format=output_format)
+        except ValueError as e:
+            self.error = str(e)
+
+    def run(self):
+        if self.error:
+            self.finished.emit(False, self.error)
+            return
+        try:
+            completed = self.renderer.run_preview() if self.preview else self.renderer.run()
+            if completed:
+                self.finished.emit(True, self.output_path)
+        except Exception as e:
+            self.finished.emit(False, str(e))
+
+    def cancel(self):
+        if self.renderer:
+            self.renderer.cancel()
+
+class UpdateWorker(QThread):
+    """Checks for an update, or installs the files a check found, off the GUI thread."""
+    checked = pyqtSignal(list)
+    installed = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, updater, install=None):
+        super().__init__()
+        self.updater = updater
+        self.install = install
+
+    def run(self):
+        try:
+            if self.install:
+                self.updater.apply(self.install)
+                self.installed.emit()
+            else:
+                self.checked.emit(self.updater.check())
+        except (OSError, ValueError, RuntimeError) as e:
+            self.failed.emit(str(e))
+
+class PlanWorker(QThread):
+    """Predicts a render off the GUI thread, inputs that are not cached yet are probed with ffprobe."""
+    planned = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, video_paths, audio_paths, output_path, render_mode, audio_mode, profile, renditions, output_format):
         super().__init__()
         self.video_paths = video_paths
         self.audio_paths = audio_paths
         self.output_path = output_path
-        self.is_cancelled = False
-        self.caffeinate_process = None
+        self.render_mode = render_mode
+        self.audio_mode = audio_mode
+        self.profile = profile
+        self.renditions = renditions
+        self.output_format = output_format
 
     def run(self):
         try:
-            # Start caffeinate to prevent sleep (macOS only)
-            self.caffeinate_process = subprocess.Popen(
-                ['caffeinate', '-i', '-m', '-s', '-d'],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
-            if debug:
-                print("Started caffeinate process to prevent sleep")
-
-            self.progress.emit(1)
-            if self.is_cancelled:
-                return
-
-            # Step 1: Merge audio files
-            merged_audio = self.get_temp_path("merged_audio.mp3")
-            self.merge_audio_files(merged_audio)
-            self.progress.emit(5)
+            self.planned.emit(RenderPlanner(self.video_paths, self.audio_paths, self.output_path, self.audio_mode,
+                                            self.profile, self.renditions,
+                                            output_format=self.output_format).plan(self.render_mode))
+        except (OSError, ValueError, RuntimeError) as e:
+            self.failed.emit(str(e))
+
+class ServerCall(QThread):
+    """One request to the render server, made off the GUI thread since the server may be slow or gone."""
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, call):
+        super().__init__()
+        self.call = call
 
-            if self.is_cancelled:
-                return
+    def run(self):
+        try:
+            self.done.emit(self.call())
+        except (OSError, ValueError, RuntimeError) as e:
+            self.failed.emit(str(e))
 
-            # Step 2: Create final video
-            self.create_final_video(merged_audio)
+class SchedulerBridge(QObject):
+    # Carries job updates from the scheduler threads to the GUI thread
+    job_updated = pyqtSignal(object)
 
-            self.finished.emit(True, self.output_path)
+class MediaListModel(QAbstractListModel):
+    """Paths shown in a drop zone, with a set for duplicate checks and the sort key of every row cached."""
 
-        except Exception as e:
-            self.finished.emit(False, str(e))
-        finally:
-            # Cleanup
-            if os.path.exists(merged_audio):
-                os.remove(merged_audio)
-
-            # Stop caffeinate process to allow system to sleep again
-            if self.caffeinate_process:
-                self.caffeinate_process.terminate()
-                if debug:
-                    print("Terminated caffeinate process")
-
-    def get_binary_path(self, binary_name):
-        """Find the path to a bundled binary (ffmpeg or ffprobe)."""
-        # py2app specific - check if running as a bundled .app
-        if hasattr(sys, "frozen") and sys.frozen:
-            # Get the Resources directory in the app bundle
-            if getattr(sys, 'frozen', False) and getattr(sys, '_MEIPASS', False):
-                # PyInstaller case (fallback)
-                base_path = sys._MEIPASS
+    def __init__(self):
+        super().__init__()
+        self.paths = []
+        self.sort_keys = []
+        self.path_set = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return os.path.basename(self.paths[index.row()])
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self.paths[index.row()]
+        return None
+
+    def add_paths(self, entries, keep_sorted):
+        """Add (sort key, path) pairs that are not listed yet. Returns the new paths."""
+        new_entries = []
+        for key, path in entries:
+            if path not in self.path_set:
+                self.path_set.add(path)
+                new_entries.append((key, path))
+
+        if not new_entries:
+            return []
+
+        if not keep_sorted:
+            self.insert_entries(len(self.paths), new_entries)
+            return [path for _, path in new_entries]
+
+        # Rows found against the current list, equal rows go in as one block
+        new_entries.sort()
+        rows = [bisect.bisect_right(self.sort_keys, key) for key, _ in new_entries]
+        blocks = []
+        for row, entry in zip(rows, new_entries):
+            if blocks and blocks[-1][0] == row:
+                blocks[-1][1].append(entry)
             else:
-                # py2app case - use the resource path of the .app bundle
-                base_path = os.path.join(os.path.dirname(os.path.dirname(sys.executable)), 'Resources')
-
-            # Return the full path to the binary
-            binary_path = os.path.join(base_path, binary_name)
-            if os.path.exists(binary_path):
-                return binary_path
-
-        # Fallback - look for the binary in the current directory
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        binary_path = os.path.join(current_dir, binary_name)
-        if os.path.exists(binary_path):
-            return binary_path
-
-        # Final fallback - assume it's in the PATH
-        return binary_name
-
-    def get_temp_path(self, relative_path=''):
-        temp_dir = tempfile.gettempdir()
-        return os.path.join(temp_dir, relative_path)
-
-    def merge_audio_files(self, output_audio):
-        files_path = self.get_temp_path('files.txt')
-        with open(files_path, "w") as f:
-            for audio_path in self.audio_paths:
-                f.write(f"file '{audio_path}'\n")
-
-        # Get the path to the embedded ffmpeg binary
-        ffmpeg_path = self.get_binary_path("ffmpeg")
-
-        # Make sure ffmpeg is executable (if it's a file that we can access)
-        if os.path.isfile(ffmpeg_path):
-            try:
-                os.chmod(ffmpeg_path, 0o755)
-            except OSError:
-                # If we can't chmod, it's probably already executable or we don't have permission
-                pass
-
-        cmd = [
-            ffmpeg_path,
-            "-f", "concat",
-            "-safe", "0",
-            "-i", files_path,
-            "-c", "copy",
-            "-y",
-            output_audio
-        ]
-
-        if debug:
-            print(' '.join(cmd))
-
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        for line in process.stderr:
-            if self.is_cancelled:
-                process.terminate()
-                return
+                blocks.append((row, [entry]))
 
-        process.wait()
-        os.remove(files_path)
+        # Last block first, so the rows of the earlier ones stay valid
+        for row, block in reversed(blocks):
+            self.insert_entries(row, block)
 
-    def create_final_video(self, merged_audio):
-        # Get CPU count safely (multiprocessing might not be available)
-        try:
-            num_cores = multiprocessing.cpu_count()
-            num_threads = max(2, num_cores - 1)  # Use all cores except one
-        except:
-            num_threads = 2  # Fallback to a reasonable default
+        return [path for _, path in new_entries]
 
-        # Get the path to the embedded ffmpeg binary
-        ffmpeg_path = self.get_binary_path("ffmpeg")
+    def insert_entries(self, row, entries):
+        self.beginInsertRows(QModelIndex(), row, row + len(entries) - 1)
+        self.sort_keys[row:row] = [key for key, _ in entries]
+        self.paths[row:row] = [path for _, path in entries]
+        self.endInsertRows()
 
-        # Make sure ffmpeg is executable (if it's a file that we can access)
-        if os.path.isfile(ffmpeg_path):
-            try:
-                os.chmod(ffmpeg_path, 0o755)
-            except OSError:
-                # If we can't chmod, it's probably already executable or we don't have permission
-                pass
-
-        cmd = [
-            ffmpeg_path,
-            "-stats",
-            "-i", self.video_paths[0],  # Intro video (plays once)
-            "-stream_loop", "-1",
-            "-i", self.video_paths[1] if len(self.video_paths) > 1 else self.video_paths[0],  # Main body or repeat intro
-            "-i", merged_audio,
-            "-filter_complex",
-            "[0:v]scale=-1:720[v0];[1:v]scale=-1:720[v1];[v0][v1]concat=n=2:v=1:a=0[v]",
-            "-map", "[v]",
-            "-map", "2:a",
-            "-c:v", "libx264",
-            "-c:a", "aac",
-            "-shortest",
-            #"-threads", str(num_threads),
-            "-y",
-            self.output_path
-        ]
-
-        if debug:
-            print(' '.join(cmd))
-
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        duration = self.get_video_duration(merged_audio)
-
-        for line in process.stderr:
-            if self.is_cancelled:
-                process.terminate()
-                return
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.path_set.discard(self.paths.pop(row))
+        self.sort_keys.pop(row)
+        self.endRemoveRows()
 
-            if debug:
-                print(line)
+    def swap_rows(self, row, other):
+        first, second = min(row, other), max(row, other)
+        # Moving the upper row below the lower one, Qt wants the row after the destination
+        self.beginMoveRows(QModelIndex(), first, first, QModelIndex(), second + 1)
+        self.paths[first], self.paths[second] = self.paths[second], self.paths[first]
+        self.sort_keys[first], self.sort_keys[second] = self.sort_keys[second], self.sort_keys[first]
+        self.endMoveRows()
 
-            if "time=" in line:
-                time = line.split("time=")[1].split()[0]
+    def sort(self, column=0, order=Qt.SortOrder.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        entries = sorted(zip(self.sort_keys, self.paths))
+        self.sort_keys = [key for key, _ in entries]
+        self.paths = [path for _, path in entries]
+        self.layoutChanged.emit()
 
-                if debug:
-                    print(time)
+def media_sort_entry(path):
+    return (natural_sort_key(os.path.basename(path)), path)
 
-                # Try to handle different time formats
-                time_parts = time.split(':')
-                if len(time_parts) == 3:
-                    hours, minutes, seconds = time_parts
-                    current_time = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
-                    progress = int((current_time / duration) * 95) + 5
-                    self.progress.emit(progress)
+class DirectoryLoader(QThread):
+    """Lists the media files of dropped folders off the GUI thread, handing them over in batches."""
 
-        process.wait()
+    # Files per batch, the list fills in while a large folder is still being read
+    BATCH_SIZE = 500
 
-    def get_video_duration(self, video_path):
-        ffprobe_path = self.get_binary_path("ffprobe")
-        if os.path.isfile(ffprobe_path):
-            try:
-                os.chmod(ffprobe_path, 0o755)
-            except OSError:
-                # If we can't chmod, it's probably already executable or we don't have permission
-                pass
+    loaded = pyqtSignal(list)
 
-        cmd = [
-            ffprobe_path,
-            "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1",
-            video_path
-        ]
-
-        if debug:
-            print(' '.join(cmd))
+    def __init__(self, directories, file_type):
+        super().__init__()
+        self.directories = directories
+        self.file_type = file_type
 
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    def run(self):
+        batch = []
+        for directory in self.directories:
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
 
-        try:
-            duration = float(result.stdout.strip())
-            if duration <= 0:
-                raise ValueError("Invalid duration")
-            return duration
-        except (ValueError, TypeError):
-            print(f"Error getting duration. ffprobe output: {result.stdout}")
-            print(f"ffprobe error: {result.stderr}")
-            raise RuntimeError("Failed to get video duration")
+            # Same files the command line's --audio-dir picks up
+            for entry in entries:
+                if entry.name.lower().endswith(f'.{self.file_type}') and not entry.name.startswith('.'):
+                    batch.append(media_sort_entry(entry.path))
+                    if len(batch) >= self.BATCH_SIZE:
+                        self.loaded.emit(batch)
+                        batch = []
 
-    def cancel(self):
-        self.is_cancelled = True
-        # Make sure to terminate caffeinate process when cancelling
-        if self.caffeinate_process:
-            self.caffeinate_process.terminate()
-            if debug:
-                print("Terminated caffeinate process due to cancellation")
+        if batch:
+            self.loaded.emit(batch)
 
 class FileDropZone(QWidget):
     def __init__(self, file_type):
@@ -257,10 +252,14 @@ class FileDropZone(QWidget):
         self.layout = QVBoxLayout(self)
         self.layout.setContentsMargins(0, 0, 0, 0)
 
-        self.list_widget = QListWidget()
-        self.list_widget.setAcceptDrops(True)
-        self.list_widget.setStyleSheet("""
-            QListWidget {
+        self.model = MediaListModel()
+        self.list_view = QListView()
+        self.list_view.setModel(self.model)
+        # Every row is one line of text, so the view never has to measure them one by one
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setAcceptDrops(True)
+        self.list_view.setStyleSheet("""
+            QListView {
                 border: 2px dashed #666;
                 border-radius: 5px;
                 padding: 5px;
@@ -268,9 +267,9 @@ class FileDropZone(QWidget):
                 color: palette(text);
             }
         """)
-        self.list_widget.setMinimumHeight(100)
-        self.list_widget.mousePressEvent = self.list_widget_clicked
-        self.layout.addWidget(self.list_widget)
+        self.list_view.setMinimumHeight(100)
+        self.list_view.mousePressEvent = self.list_view_clicked
+        self.layout.addWidget(self.list_view)
 
         button_layout = QHBoxLayout()
         self.move_up_button = QPushButton("Move Up")
@@ -306,13 +305,17 @@ class FileDropZone(QWidget):
         button_layout.addWidget(self.remove_button)
         self.layout.addLayout(button_layout)
 
-        self.filepaths = []
+        self.loaders = []
         self.setAcceptDrops(True)
 
+    @property
+    def filepaths(self):
+        return list(self.model.paths)
+
     def dragEnterEvent(self, event):
-        # Check if there are any valid files in the drag operation
+        # Check if there are any valid files or folders in the drag operation
         if event.mimeData().hasUrls():
-            valid_files = any(u.toLocalFile().lower().endswith(f'.{self.file_type}')
+            valid_files = any(u.toLocalFile().lower().endswith(f'.{self.file_type}') or os.path.isdir(u.toLocalFile())
                               for u in event.mimeData().urls())
             if valid_files:
                 event.acceptProposedAction()
@@ -324,86 +327,84 @@ class FileDropZone(QWidget):
         # Always accept the event first to prevent the bounce-back animation
         event.accept()
 
-        # Then process the files
-        files = [u.toLocalFile() for u in event.mimeData().urls()
-            if u.toLocalFile().lower().endswith(f'.{self.file_type}')]
-
-        for file in files:
-            if file not in self.filepaths:
-                self.filepaths.append(file)
-                self.list_widget.addItem(os.path.basename(file))
-
-        # Call sort_items after adding new files
-        if self.should_sort:
-            self.sort_items()
-
-    def list_widget_clicked(self, event):
-        if self.list_widget.count() == 0:
+        # Then process the files, folders are listed in the background
+        files = []
+        directories = []
+        for url in event.mimeData().urls():
+            path = url.toLocalFile()
+            if path.lower().endswith(f'.{self.file_type}'):
+                files.append(path)
+            elif os.path.isdir(path):
+                directories.append(path)
+
+        self.add_files([media_sort_entry(path) for path in files])
+
+        if directories:
+            loader = DirectoryLoader(directories, self.file_type)
+            loader.loaded.connect(self.add_files)
+            loader.finished.connect(lambda: self.loaders.remove(loader))
+            self.loaders.append(loader)
+            loader.start()
+
+    def add_files(self, entries):
+        # New rows go straight to their sorted place, unless the order was arranged by hand
+        new_files = self.model.add_paths(entries, self.should_sort)
+
+        # Probe in the background so the metadata is ready before rendering
+        get_media_info_cache().prefetch(new_files)
+
+    def list_view_clicked(self, event):
+        if self.model.rowCount() == 0:
             self.browse_files()
-        super(QListWidget, self.list_widget).mousePressEvent(event)
+        super(QListView, self.list_view).mousePressEvent(event)
 
     def browse_files(self):
         file_dialog = QFileDialog()
         # Get user's Desktop directory
         documents_dir = os.path.expanduser("~/Desktop")
         files, _ = file_dialog.getOpenFileNames(self, f"Select {self.file_type.upper()} Files", documents_dir, f"{self.file_type.upper()} Files (*.{self.file_type})")
-        for file in files:
-            if file not in self.filepaths:
-                self.filepaths.append(file)
-                self.list_widget.addItem(os.path.basename(file))
+        new_files = self.model.add_paths([media_sort_entry(path) for path in files], self.should_sort)
+
+        # Probe in the background so the metadata is ready before rendering
+        get_media_info_cache().prefetch(new_files)
+
+    def current_row(self):
+        index = self.list_view.currentIndex()
+        return index.row() if index.isValid() else -1
+
+    def set_current_row(self, row):
+        self.list_view.setCurrentIndex(self.model.index(row))
 
     def move_item_up(self):
-        current_row = self.list_widget.currentRow()
+        current_row = self.current_row()
         if current_row > 0:
             self.should_sort = False
-            item = self.list_widget.takeItem(current_row)
-            self.list_widget.insertItem(current_row - 1, item)
-            self.list_widget.setCurrentRow(current_row - 1)
-            self.filepaths[current_row], self.filepaths[current_row - 1] = \
-                self.filepaths[current_row - 1], self.filepaths[current_row]
+            self.model.swap_rows(current_row, current_row - 1)
+            self.set_current_row(current_row - 1)
 
     def move_item_down(self):
-        current_row = self.list_widget.currentRow()
-        if current_row < self.list_widget.count() - 1:
+        current_row = self.current_row()
+        if 0 <= current_row < self.model.rowCount() - 1:
             self.should_sort = False
-            item = self.list_widget.takeItem(current_row)
-            self.list_widget.insertItem(current_row + 1, item)
-            self.list_widget.setCurrentRow(current_row + 1)
-            self.filepaths[current_row], self.filepaths[current_row + 1] = \
-                self.filepaths[current_row + 1], self.filepaths[current_row]
+            self.model.swap_rows(current_row, current_row + 1)
+            self.set_current_row(current_row + 1)
 
     def remove_selected(self):
-        current_row = self.list_widget.currentRow()
+        current_row = self.current_row()
         if current_row >= 0:
-            self.list_widget.takeItem(current_row)
-            self.filepaths.pop(current_row)
+            self.model.remove_row(current_row)
 
     def sort_items(self):
-        def natural_sort_key(s):
-            lower_s = s.lower()
-            if lower_s == "opening.mp3":
-                return (0, )  # Ensures it's always first
-            elif lower_s == "closing.mp3":
-                return (float('inf'), )  # Ensures it's always last
-
-            # For other files, use natural sorting
-            return tuple(
-                (1, ) +  # Normal files come after "Opening.mp3" but before "Closing.mp3"
-                tuple(
-                    "".join((
-                        "0" * (8 - len(c)),  # Zero-pad numbers to 8 digits
-                        c if c.isdigit() else c.lower()
-                    )) for c in re.split(r'(\d+)', s)
-                )
-            )
-
-        # Sort the filepaths using the custom key function
-        self.filepaths.sort(key=lambda x: natural_sort_key(os.path.basename(x)))
-
-        # Clear and repopulate the list widget
-        self.list_widget.clear()
-        for filepath in self.filepaths:
-            self.list_widget.addItem(os.path.basename(filepath))
+        # Same ordering as the command line, from the keys cached when the files were added
+        self.model.sort()
+        self.should_sort = True
+
+# How often the app asks the updater whether a scheduled check is due, and the delay before the first one
+UPDATE_TIMER_INTERVAL_MS = 15 * 60 * 1000
+UPDATE_FIRST_CHECK_DELAY_MS = 10 * 1000
+
+# How often jobs sent to a render server are refreshed while any of them is unfinished
+SERVER_POLL_INTERVAL_MS = 2000
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -449,10 +450,59 @@ class MainWindow(QMainWindow):
         self.set_button_style(is_abort=False)
         self.merge_button.clicked.connect(self.handle_merge_button)
 
+        # Quick low resolution render of the cut and a middle sample, opened in the default player
+        self.preview_button = QPushButton("Preview")
+        self.preview_button.clicked.connect(self.handle_preview_button)
+
         layout.addWidget(self.progress_bar)
         layout.addWidget(self.merge_button)
+        layout.addWidget(self.preview_button)
 
         self.merge_worker = None
+        self.preview_worker = None
+        self.plan_worker = None
+        self.render_messages = []
+
+        # Render queue, jobs run in the background as slots free up
+        queue_label = QLabel("Render queue...")
+        queue_label.setAlignment(Qt.AlignmentFlag.AlignLeft)
+        layout.addWidget(queue_label)
+
+        self.queue_list = QListWidget()
+        self.queue_list.setMinimumHeight(80)
+        layout.addWidget(self.queue_list)
+
+        queue_button_layout = QHBoxLayout()
+        self.queue_button = QPushButton("Add to Queue")
+        self.priority_button = QPushButton("Raise Priority")
+        self.cancel_job_button = QPushButton("Cancel Job")
+        self.queue_button.clicked.connect(self.add_to_queue)
+        self.priority_button.clicked.connect(self.raise_job_priority)
+        self.cancel_job_button.clicked.connect(self.cancel_selected_job)
+        queue_button_layout.addWidget(self.queue_button)
+        queue_button_layout.addWidget(self.priority_button)
+        queue_button_layout.addWidget(self.cancel_job_button)
+        layout.addLayout(queue_button_layout)
+
+        self.scheduler_bridge = SchedulerBridge()
+        self.scheduler_bridge.job_updated.connect(self.update_job_row)
+        self.scheduler = JobScheduler(on_update=self.scheduler_bridge.job_updated.emit)
+        self.queue_items = {}
+
+        # With a render server set, queued jobs go to its workers and are tracked by polling
+        self.server_url = load_settings().get("server_url")
+        self.server_jobs = {}
+        self.server_calls = set()
+        self.server_poll_timer = QTimer(self)
+        self.server_poll_timer.timeout.connect(self.poll_server_jobs)
+
+        # The application files live next to sys.argv[0], checked once a day with backoff after failures
+        self.updater = Updater(os.path.dirname(os.path.abspath(sys.argv[0])))
+        self.update_worker = None
+        self.update_timer = QTimer(self)
+        self.update_timer.timeout.connect(lambda: self.check_for_updates(scheduled=True))
+        self.update_timer.start(UPDATE_TIMER_INTERVAL_MS)
+        QTimer.singleShot(UPDATE_FIRST_CHECK_DELAY_MS, lambda: self.check_for_updates(scheduled=True))
 
     def create_menu_bar(self):
         # Create the main menu bar
@@ -464,126 +514,292 @@ class MainWindow(QMainWindow):
 
         # Add "Check for Updates" action
         update_action = QAction("Check for Updates", self)
-        update_action.triggered.connect(self.check_for_updates)
+        update_action.triggered.connect(lambda: self.check_for_updates())
         app_menu.addAction(update_action)
 
-    def check_for_updates(self):
-        """Check for updates and update the application in-place by writing to sys.argv[0]."""
+        # Drop every cached intermediate (merged audio, scaled tiles)
+        clear_cache_action = QAction("Clear Render Cache", self)
+        clear_cache_action.triggered.connect(self.clear_render_cache)
+        app_menu.addAction(clear_cache_action)
+
+        # Stage timings of recent renders, one Chrome trace file per render
+        traces_action = QAction("Show Render Traces", self)
+        traces_action.triggered.connect(self.show_render_traces)
+        app_menu.addAction(traces_action)
+
+        # Scratch files go to the system temp dir unless a faster or larger disk is picked
+        scratch_action = QAction("Set Scratch Folder...", self)
+        scratch_action.triggered.connect(self.choose_scratch_folder)
+        app_menu.addAction(scratch_action)
+
+        # Queue on a render server instead of this machine
+        server_action = QAction("Use Render Server...", self)
+        server_action.triggered.connect(self.choose_render_server)
+        app_menu.addAction(server_action)
+
+        # Render mode selection, loop tile is the fast default
+        self.render_mode = "loop_tile"
+        render_menu = menu_bar.addMenu("Render Mode")
+        render_group = QActionGroup(self)
+        render_group.setExclusive(True)
+        for mode, label in RENDER_MODES.items():
+            mode_action = QAction(label, self, checkable=True)
+            mode_action.setChecked(mode == self.render_mode)
+            mode_action.triggered.connect(lambda checked, mode=mode: self.set_render_mode(mode))
+            render_group.addAction(mode_action)
+            render_menu.addAction(mode_action)
+
+        # Audio handling, cached parts by default so unchanged chapters are not transcoded again
+        self.audio_mode = "cached"
+        render_menu.addSeparator()
+        audio_group = QActionGroup(self)
+        audio_group.setExclusive(True)
+        for mode, label in AUDIO_MODES.items():
+            mode_action = QAction(label, self, checkable=True)
+            mode_action.setChecked(mode == self.audio_mode)
+            mode_action.triggered.connect(lambda checked, mode=mode: self.set_audio_mode(mode))
+            audio_group.addAction(mode_action)
+            render_menu.addAction(mode_action)
+
+        # Container layout, fragmented files can be played or uploaded before the render ends
+        self.output_format = "mp4"
+        render_menu.addSeparator()
+        format_group = QActionGroup(self)
+        format_group.setExclusive(True)
+        for output_format, label in OUTPUT_FORMATS.items():
+            format_action = QAction(label, self, checkable=True)
+            format_action.setChecked(output_format == self.output_format)
+            format_action.triggered.connect(lambda checked, output_format=output_format: self.set_output_format(output_format))
+            format_group.addAction(format_action)
+            render_menu.addAction(format_action)
+
+        # Encoder settings, calibrated profiles show up after the built-in ones
+        self.profile_name = DEFAULT_PROFILE
+        encoding_menu = menu_bar.addMenu("Encoding")
+        profile_group = QActionGroup(self)
+        profile_group.setExclusive(True)
+        for name, profile in get_encoding_profiles().items():
+            profile_action = QAction(profile.label, self, checkable=True)
+            profile_action.setChecked(name == self.profile_name)
+            profile_action.triggered.connect(lambda checked, name=name: self.set_profile(name))
+            profile_group.addAction(profile_action)
+            encoding_menu.addAction(profile_action)
+
+        # Extra outputs, written by the same pass as the main video
+        self.rendition_specs = []
+        encoding_menu.addSeparator()
+        for spec, label in (("1080p", "Also Write 1080p Master"), ("audio", "Also Write Audio Only (M4A)")):
+            rendition_action = QAction(label, self, checkable=True)
+            rendition_action.triggered.connect(lambda checked, spec=spec: self.set_rendition(spec, checked))
+            encoding_menu.addAction(rendition_action)
+
+        # Chapters from different sources brought to one level, measured once per file
+        self.loudness = None
+        encoding_menu.addSeparator()
+        loudness_action = QAction(f"Normalize Loudness ({DEFAULT_LOUDNESS} LUFS)", self, checkable=True)
+        loudness_action.triggered.connect(self.set_loudness)
+        encoding_menu.addAction(loudness_action)
+
+    def set_profile(self, name):
+        self.profile_name = name
+
+    def set_loudness(self, enabled):
+        self.loudness = DEFAULT_LOUDNESS if enabled else None
+
+    def get_profile(self):
+        return get_encoding_profile(self.profile_name).with_overrides(loudness=self.loudness)
+
+    def set_rendition(self, spec, enabled):
+        if enabled:
+            self.rendition_specs.append(spec)
+        else:
+            self.rendition_specs.remove(spec)
 
-        # Get the target path from sys.argv[0]
-        target_path = os.path.abspath(sys.argv[0])
+    def get_renditions(self):
+        return [parse_rendition(spec, self.profile_name) for spec in self.rendition_specs]
 
-        try:
-            update_url = "https://raw.githubusercontent.com/corecoding/Video-Thing/refs/heads/main/app.py"
+    def set_render_mode(self, mode):
+        self.render_mode = mode
 
-            # Set the app_script_path to sys.argv[0]
-            app_script_path = target_path
+    def set_audio_mode(self, mode):
+        self.audio_mode = mode
 
-            # Check if the target file exists and is writable
-            if not os.path.exists(app_script_path):
-                QMessageBox.critical(self, "Update Error", f"The target file does not exist: {app_script_path}")
-                return
+    def set_output_format(self, output_format):
+        self.output_format = output_format
 
-            if not os.access(app_script_path, os.W_OK):
-                # Try to make it writable
-                try:
-                    os.chmod(app_script_path, 0o755)
-                except Exception as e:
-                    QMessageBox.critical(self, "Update Error",
-                        f"The target file is not writable: {app_script_path}\nError: {str(e)}")
-                    return
-
-            # Create a backup before updating
-            backup_path = app_script_path + ".backup"
-            try:
-                shutil.copy2(app_script_path, backup_path)
-            except Exception as e:
-                QMessageBox.critical(self, "Update Error",
-                    f"Cannot create backup: {str(e)}")
+    def clear_render_cache(self):
+        try:
+            get_artifact_cache().clear()
+            QMessageBox.information(self, "Render Cache", "The render cache has been cleared.")
+        except OSError as e:
+            QMessageBox.critical(self, "Render Cache", f"Could not clear the render cache:\n{str(e)}")
+
+    def show_render_traces(self):
+        trace_dir = os.path.join(get_cache_dir(), "traces")
+        os.makedirs(trace_dir, exist_ok=True)
+        QDesktopServices.openUrl(QUrl.fromLocalFile(trace_dir))
+
+    def choose_scratch_folder(self):
+        scratch_dir = QFileDialog.getExistingDirectory(self, "Scratch Folder for Temporary Render Files", get_scratch_root())
+        if not scratch_dir:
+            return
+        settings = load_settings()
+        settings["scratch_dir"] = scratch_dir
+        try:
+            save_settings(settings)
+        except OSError as e:
+            QMessageBox.critical(self, "Scratch Folder", f"Could not save the scratch folder:\n{str(e)}")
+            return
+        self.statusBar().showMessage(f"Scratch files now go to {scratch_dir}")
+
+    def choose_render_server(self):
+        server_url, accepted = QInputDialog.getText(self, "Render Server",
+                                                    "URL of the render server for queued jobs, "
+                                                    "empty to render them on this machine:",
+                                                    text=self.server_url or "")
+        if not accepted:
+            return
+        self.server_url = server_url.strip() or None
+        settings = load_settings()
+        settings["server_url"] = self.server_url
+        try:
+            save_settings(settings)
+        except OSError as e:
+            QMessageBox.critical(self, "Render Server", f"Could not save the render server:\n{str(e)}")
+            return
+        self.statusBar().showMessage(f"Queued jobs now go to {self.server_url}" if self.server_url
+                                     else "Queued jobs now render on this machine")
+
+    def call_server(self, call, on_done=None, on_failed=None):
+        """Run call on a ServerCall thread, reporting failures in the status bar unless on_failed is given."""
+        server_call = ServerCall(call)
+        if on_done:
+            server_call.done.connect(on_done)
+        server_call.failed.connect(on_failed or (lambda message: self.statusBar().showMessage(message)))
+        server_call.finished.connect(lambda: self.server_calls.discard(server_call))
+        self.server_calls.add(server_call)
+        server_call.start()
+
+    def get_job_spec(self, output_path):
+        """Batch manifest entry of the current settings, what a render server queues."""
+        spec = {"intro": self.video_zone.filepaths[0], "audio": self.audio_zone.filepaths, "output": output_path,
+                "mode": self.render_mode, "audio_mode": self.audio_mode, "profile": self.profile_name,
+                "renditions": self.rendition_specs, "output_format": self.output_format}
+        if len(self.video_zone.filepaths) > 1:
+            spec["body"] = self.video_zone.filepaths[1]
+        if self.loudness is not None:
+            spec["loudness"] = self.loudness
+        return spec
+
+    def submit_to_server(self, output_path):
+        client = ServerClient(self.server_url)
+        spec = self.get_job_spec(output_path)
+        self.call_server(lambda: client.submit(spec), self.handle_server_job_submitted,
+                         lambda message: QMessageBox.critical(self, "Render Server", f"Could not queue the job:\n{message}"))
+
+    def handle_server_job_submitted(self, job):
+        key = ("server", job["id"])
+        item = QListWidgetItem()
+        item.setData(Qt.ItemDataRole.UserRole, key)
+        self.queue_list.addItem(item)
+        self.queue_items[key] = item
+        self.update_server_job_row(job)
+        self.server_poll_timer.start(SERVER_POLL_INTERVAL_MS)
+
+    def poll_server_jobs(self):
+        unfinished = [job for job in self.server_jobs.values()
+                      if job["state"] in (RenderJob.QUEUED, RenderJob.RUNNING)]
+        if not unfinished:
+            self.server_poll_timer.stop()
+            return
+        # One poll at a time, a server that is slow to answer is not asked again meanwhile
+        if self.server_calls:
+            return
+
+        client = ServerClient(self.server_url)
+        self.call_server(client.list_jobs, self.handle_server_jobs)
+
+    def handle_server_jobs(self, jobs):
+        for job in jobs:
+            self.update_server_job_row(job)
+
+    def check_render_plan(self, output_path):
+        """Predict the render in the background, it starts from handle_render_plan once the plan is in."""
+        self.merge_button.setEnabled(False)
+        self.preview_button.setEnabled(False)
+        self.statusBar().showMessage("Estimating the render...")
+
+        self.plan_worker = PlanWorker(self.video_zone.filepaths, self.audio_zone.filepaths, output_path,
+                                      self.render_mode, self.audio_mode, self.get_profile(), self.get_renditions(),
+                                      self.output_format)
+        self.plan_worker.planned.connect(lambda plan: self.handle_render_plan(output_path, plan))
+        self.plan_worker.failed.connect(lambda message: self.handle_render_plan_failed(output_path, message))
+        self.plan_worker.start()
+
+    def handle_render_plan_failed(self, output_path, message):
+        # The render reports unreadable inputs itself, the plan is only advice
+        self.statusBar().showMessage(f"Could not estimate the render: {message}")
+        self.start_merge(output_path)
+
+    def handle_render_plan(self, output_path, plan):
+        """Show the predicted render time and size, and stop renders that will not fit on disk."""
+        self.merge_button.setEnabled(True)
+        self.preview_button.setEnabled(True)
+        if plan.problems:
+            self.statusBar().clearMessage()
+            QMessageBox.critical(self, "Not Enough Disk Space",
+                                 "\n".join(plan.problems) + "\n\nFree some space or pick another scratch folder or destination.")
+            return
+        if plan.warnings:
+            answer = QMessageBox.warning(self, "Low Disk Space", "\n".join(plan.warnings) + "\n\nRender anyway?",
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+            if answer != QMessageBox.StandardButton.Yes:
+                self.statusBar().clearMessage()
                 return
 
-            # Download and compare with current version
-            try:
-                # Create a request with no-cache headers to prevent GitHub from serving cached content
-                req = urllib.request.Request(update_url)
-                req.add_header('Pragma', 'no-cache')
-                req.add_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-                req.add_header('Expires', '0')
-
-                with urllib.request.urlopen(req) as response:
-                    latest_version = response.read()
-
-                    with open(app_script_path, 'rb') as current_file:
-                        current_version = current_file.read()
-
-                    # Only update if versions are different
-                    if latest_version != current_version:
-                        # Create a temporary file first, then move it to replace the original
-                        temp_file = app_script_path + ".tmp"
-                        with open(temp_file, 'wb') as out_file:
-                            out_file.write(latest_version)
-
-                        # On Windows, we need to remove the target file first
-                        if sys.platform == 'win32' and os.path.exists(app_script_path):
-                            os.remove(app_script_path)
-
-                        # Replace the original file with the update
-                        shutil.move(temp_file, app_script_path)
-
-                        # On Unix systems, make sure the file is executable
-                        if sys.platform != 'win32':
-                            os.chmod(app_script_path, 0o755)
-
-                        # Show success message
-                        QMessageBox.information(self, "Update Successful",
-                            "The application has been updated successfully.\n"
-                            "Please restart the application to apply the changes.")
-
-                        # Clean up the backup
-                        if os.path.exists(backup_path):
-                            try:
-                                os.remove(backup_path)
-                            except:
-                                pass  # Not critical if cleanup fails
-                    else:
-                        # Versions are the same
-                        QMessageBox.information(self, "No Updates", "You already have the latest version.")
-
-                        # Clean up the backup
-                        if os.path.exists(backup_path):
-                            try:
-                                os.remove(backup_path)
-                            except:
-                                pass  # Not critical if cleanup fails
-
-            except Exception as e:
-                # Restore from backup if update failed
-                if os.path.exists(backup_path):
-                    try:
-                        # On Windows, we need to remove the target file first
-                        if sys.platform == 'win32' and os.path.exists(app_script_path):
-                            os.remove(app_script_path)
-
-                        # Restore from backup
-                        shutil.copy2(backup_path, app_script_path)
-
-                        # On Unix systems, restore executable permissions
-                        if sys.platform != 'win32':
-                            os.chmod(app_script_path, 0o755)
-
-                        # Clean up the backup
-                        os.remove(backup_path)
-                    except:
-                        pass  # Don't add more errors if restore fails
-
-                # Show error message
-                QMessageBox.critical(self, "Update Failed",
-                    f"Failed to update the application.\nError: {str(e)}")
-
-        except Exception as e:
-            # Catch any unexpected errors in the main update logic
-            QMessageBox.critical(self, "Update Check Failed",
-                f"An unexpected error occurred while checking for updates:\n{str(e)}")
+        self.statusBar().showMessage(f"Estimated {plan.describe()}")
+        self.start_merge(output_path)
+
+    def check_for_updates(self, scheduled=False):
+        """Look for a newer release in the background, the window stays responsive while it downloads."""
+        if self.update_worker and self.update_worker.isRunning():
+            return
+        if scheduled and not self.updater.is_due():
+            return
+
+        self.update_worker = UpdateWorker(self.updater)
+        self.update_worker.checked.connect(lambda changed: self.handle_update_checked(changed, scheduled))
+        self.update_worker.failed.connect(lambda message: self.handle_update_failed(message, scheduled))
+        self.update_worker.start()
+
+    def handle_update_checked(self, changed, scheduled):
+        if not changed:
+            if not scheduled:
+                QMessageBox.information(self, "No Updates", "You already have the latest version.")
+            return
+
+        version = f" {self.updater.version}" if self.updater.version else ""
+        answer = QMessageBox.question(self, "Update Available",
+                                      f"Version{version} of Video Thing is available. Install it now?")
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+
+        self.update_worker = UpdateWorker(self.updater, install=changed)
+        self.update_worker.installed.connect(self.handle_update_installed)
+        self.update_worker.failed.connect(lambda message: self.handle_update_failed(message, False))
+        self.update_worker.start()
+
+    def handle_update_installed(self):
+        QMessageBox.information(self, "Update Successful",
+            "The application has been updated successfully.\n"
+            "Please restart the application to apply the changes.")
+
+    def handle_update_failed(self, message, scheduled):
+        # A scheduled check retries later on its own, only a requested one interrupts the user
+        if scheduled:
+            self.statusBar().showMessage(f"Update check failed: {message}")
+            return
+        QMessageBox.critical(self, "Update Failed", f"Failed to update the application.\nError: {message}")
 
     def set_button_style(self, is_abort):
         if is_abort:
@@ -619,33 +835,187 @@ class MainWindow(QMainWindow):
             self.merge_button.setText("Make Video")
             self.set_button_style(is_abort=False)
             self.progress_bar.setVisible(False)
+            self.preview_button.setEnabled(True)
+            if self.render_mode == "parallel":
+                self.statusBar().showMessage("Render stopped. Finished segments are kept, make the same video again to resume.")
         else:
             # Start a new merge operation
-            if not self.video_zone.filepaths or not self.audio_zone.filepaths:
-                QMessageBox.warning(self, "Error", "Please add both video and audio files.")
-                return
+            output_path = self.ask_output_path()
+            if output_path:
+                self.check_render_plan(output_path)
+
+    def start_merge(self, output_path):
+        self.merge_button.setEnabled(True)
+        self.merge_button.setText("Abort")
+        self.set_button_style(is_abort=True)
+        self.preview_button.setEnabled(False)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%p%")
+
+        self.merge_worker = MergeWorker(self.video_zone.filepaths, self.audio_zone.filepaths, output_path, self.render_mode,
+                                        self.audio_mode, self.get_profile(), renditions=self.get_renditions(),
+                                        output_format=self.output_format)
+        self.merge_worker.progress.connect(self.update_progress)
+        self.merge_worker.progress_event.connect(self.update_progress_details)
+        self.merge_worker.message.connect(self.show_render_message)
+        self.render_messages = []
+        self.merge_worker.finished.connect(self.handle_merge_finished)
+        self.merge_worker.start()
+
+    def handle_preview_button(self):
+        if self.preview_worker and self.preview_worker.isRunning():
+            self.preview_worker.cancel()
+            self.preview_worker.wait()
+            self.handle_preview_stopped()
+            return
+
+        if not self.video_zone.filepaths or not self.audio_zone.filepaths:
+            QMessageBox.warning(self, "Error", "Please add both video and audio files.")
+            return
+
+        # Each preview replaces the last one
+        output_path = os.path.join(get_cache_dir(), "preview.mp4")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+        self.preview_button.setText("Stop Preview")
+        self.merge_button.setEnabled(False)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("Preview %p%")
+
+        self.preview_worker = MergeWorker(self.video_zone.filepaths, self.audio_zone.filepaths, output_path,
+                                          audio_mode=self.audio_mode, profile=self.get_profile(), preview=True)
+        self.preview_worker.progress.connect(self.update_progress)
+        self.preview_worker.finished.connect(self.handle_preview_finished)
+        self.preview_worker.start()
+
+    def handle_preview_stopped(self):
+        self.preview_button.setText("Preview")
+        self.merge_button.setEnabled(True)
+        self.progress_bar.setVisible(False)
 
-            # Open file dialog to select output destination
-            documents_dir = os.path.expanduser("~/Desktop")
-            default_file = os.path.join(documents_dir, "youtube.mp4")
-            output_path, _ = QFileDialog.getSaveFileName(self, "Save Video As", default_file, "MP4 Files (*.mp4)")
-            if not output_path:
-                return  # User cancelled the file dialog
+    def handle_preview_finished(self, success, message):
+        self.handle_preview_stopped()
 
-            # Check if the destination is writable
-            if not self.is_path_writable(output_path):
-                QMessageBox.critical(self, "Error", f"Cannot write to the selected destination: {output_path}\nPlease choose a different location.")
-                return
+        if success:
+            QDesktopServices.openUrl(QUrl.fromLocalFile(message))
+        else:
+            QMessageBox.critical(self, "Error", f"Preview failed: {message}")
 
-            self.merge_button.setText("Abort")
-            self.set_button_style(is_abort=True)
-            self.progress_bar.setVisible(True)
-            self.progress_bar.setValue(0)
+    def ask_output_path(self):
+        if not self.video_zone.filepaths or not self.audio_zone.filepaths:
+            QMessageBox.warning(self, "Error", "Please add both video and audio files.")
+            return None
 
-            self.merge_worker = MergeWorker(self.video_zone.filepaths, self.audio_zone.filepaths, output_path)
-            self.merge_worker.progress.connect(self.update_progress)
-            self.merge_worker.finished.connect(self.handle_merge_finished)
-            self.merge_worker.start()
+        # Open file dialog to select output destination
+        documents_dir = os.path.expanduser("~/Desktop")
+        default_file = os.path.join(documents_dir, "youtube.mp4")
+        output_path, _ = QFileDialog.getSaveFileName(self, "Save Video As", default_file, "MP4 Files (*.mp4)")
+        if not output_path:
+            return None  # User cancelled the file dialog
+
+        # Check if the destination is writable
+        if not self.is_path_writable(output_path):
+            QMessageBox.critical(self, "Error", f"Cannot write to the selected destination: {output_path}\nPlease choose a different location.")
+            return None
+
+        return output_path
+
+    def add_to_queue(self):
+        output_path = self.ask_output_path()
+        if not output_path:
+            return
+
+        if self.server_url:
+            self.submit_to_server(output_path)
+            return
+
+        job = RenderJob(self.video_zone.filepaths, self.audio_zone.filepaths, output_path, self.render_mode,
+                        audio_mode=self.audio_mode, trace_path=get_trace_path(output_path),
+                        profile=self.get_profile(), renditions=self.get_renditions(),
+                        output_format=self.output_format)
+        item = QListWidgetItem()
+        item.setData(Qt.ItemDataRole.UserRole, job.id)
+        self.queue_list.addItem(item)
+        self.queue_items[job.id] = item
+        self.scheduler.submit(job)
+
+    def selected_job_id(self):
+        item = self.queue_list.currentItem()
+        return item.data(Qt.ItemDataRole.UserRole) if item else None
+
+    def raise_job_priority(self):
+        job_id = self.selected_job_id()
+        if isinstance(job_id, tuple):
+            job = self.server_jobs[job_id[1]]
+            client = ServerClient(self.server_url)
+            self.call_server(lambda: client.set_priority(job["id"], job["priority"] + 1), self.update_server_job_row)
+        elif job_id is not None:
+            job = self.scheduler.jobs[job_id]
+            self.scheduler.set_priority(job_id, job.priority + 1)
+
+    def cancel_selected_job(self):
+        job_id = self.selected_job_id()
+        if isinstance(job_id, tuple):
+            client = ServerClient(self.server_url)
+            self.call_server(lambda: client.cancel(job_id[1]), self.update_server_job_row)
+        elif job_id is not None:
+            self.scheduler.cancel(job_id)
+
+    def update_job_row(self, job):
+        item = self.queue_items.get(job.id)
+        if item is not None:
+            item.setText(self.describe_job(job.output_path, job.state, job.percent, job.event, job.error, job.priority))
+
+    def update_server_job_row(self, job):
+        item = self.queue_items.get(("server", job["id"]))
+        if item is None:
+            # Jobs other clients queued on the same server
+            return
+
+        self.server_jobs[job["id"]] = job
+        event = ProgressEvent(**job["event"]) if job["event"] else None
+        text = self.describe_job(job["spec"]["output"], job["state"], job["percent"], event, job["error"], job["priority"])
+        if job["worker"]:
+            text += f" on {job['worker']}"
+        item.setText(text)
+
+    def describe_job(self, output_path, state, percent, event, error, priority):
+        text = os.path.basename(output_path)
+        if state == RenderJob.RUNNING:
+            text += f" - {percent}%"
+            if event is not None and event.speed:
+                text += f" - {event.speed:.1f}x"
+            if event is not None and event.eta is not None:
+                text += f" - {format_duration(event.eta)} left"
+        elif state == RenderJob.FAILED:
+            text += f" - failed: {error}"
+        else:
+            text += f" - {state}"
+        if priority and state == RenderJob.QUEUED:
+            text += f" (priority {priority})"
+        return text
+
+    def closeEvent(self, event):
+        # Stop background renders so no ffmpeg process outlives the window
+        self.scheduler.cancel_all()
+        if self.merge_worker and self.merge_worker.isRunning():
+            self.merge_worker.cancel()
+            self.merge_worker.wait()
+        if self.preview_worker and self.preview_worker.isRunning():
+            self.preview_worker.cancel()
+            self.preview_worker.wait()
+        # A plan still being made must not start the render it was for
+        if self.plan_worker and self.plan_worker.isRunning():
+            self.plan_worker.planned.disconnect()
+            self.plan_worker.failed.disconnect()
+            self.plan_worker.wait()
+        # Jobs on a render server keep going, only the requests in flight are waited for
+        for server_call in list(self.server_calls):
+            server_call.wait()
+        super().closeEvent(event)
 
     def is_path_writable(self, path):
         # Check if the directory is writable
@@ -668,10 +1038,25 @@ class MainWindow(QMainWindow):
     def update_progress(self, value):
         self.progress_bar.setValue(value)
 
+    def show_render_message(self, message):
+        # Notes from the engine, such as which clips skip the encode
+        self.render_messages.append(message)
+        self.statusBar().showMessage(" | ".join(self.render_messages))
+
+    def update_progress_details(self, event):
+        # Show encode speed and the smoothed time remaining inside the bar
+        details = "%p%"
+        if event.speed:
+            details += f" - {event.speed:.1f}x"
+        if event.eta is not None:
+            details += f" - {format_duration(event.eta)} left"
+        self.progress_bar.setFormat(details)
+
     def handle_merge_finished(self, success, message):
         self.merge_button.setText("Make Video")
         self.set_button_style(is_abort=False)
         self.progress_bar.setVisible(False)
+        self.preview_button.setEnabled(True)
 
         if success:
             QMessageBox.information(self, "Success", f"Video created successfully!\nSaved as: {message}")
@@ -680,6 +1065,7 @@ class MainWindow(QMainWindow):
 
 if __name__ == '__main__':
     debug = False
+    videothing.debug = debug
 
     # Initialize the application
     app = QApplication(sys.argv)
@@ -0,0 +1,362 @@
+#!/usr/bin/python3
+
+# Benchmarks of the render pipeline over synthetic media, no real audiobooks needed
+
+import sys
+import os
+import json
+import time
+import hashlib
+import shutil
+import argparse
+import statistics
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import videothing
+from videothing import (Renderer, RENDER_MODES, AUDIO_MODES, DEFAULT_PROFILE, configure_artifact_cache, get_cache_dir,
+                        get_executable_path, get_encoding_profiles, format_duration)
+
+# Input sets, from a quick smoke run to a full length book
+SCALES = {
+    "small": {"chapters": 3, "chapter_seconds": 60, "intro_seconds": 5, "body_seconds": 10},
+    "many_chapters": {"chapters": 100, "chapter_seconds": 30, "intro_seconds": 5, "body_seconds": 10},
+    "ten_hours": {"chapters": 10, "chapter_seconds": 3600, "intro_seconds": 5, "body_seconds": 10},
+}
+
+# Same frame rate for intro and body so every render mode can handle the inputs
+BENCH_FRAME_RATE = 30
+BENCH_VIDEO_SIZE = "1280x720"
+
+# Bumped whenever generate_media changes, so stale inputs are regenerated
+MEDIA_VERSION = 1
+
+# Seconds between scratch directory size samples
+DISK_SAMPLE_INTERVAL = 0.5
+
+# App launches timed by --startup, and the milliseconds to the first painted window allowed by default
+STARTUP_RUNS = 5
+STARTUP_BUDGET_MS = 1000
+
+# Imports listed after a startup run, the ones with the most time of their own
+STARTUP_TOP_IMPORTS = 12
+
+# Runs in a fresh interpreter: import the app, build the main window and paint it once
+STARTUP_SCRIPT = """
+import os, sys
+app_path = sys.argv[1]
+sys.argv = [app_path]
+sys.path.insert(0, os.path.dirname(app_path))
+import app
+from PyQt6.QtWidgets import QApplication
+qt_app = QApplication(sys.argv)
+window = app.MainWindow()
+window.show()
+qt_app.processEvents()
+"""
+
+def run_ffmpeg(args):
+    # Bitexact output keeps the generated files identical between runs and machines with the same ffmpeg
+    cmd = [get_executable_path("ffmpeg"), "-hide_banner", "-loglevel", "error"] + args
+    if videothing.debug:
+        print(' '.join(cmd))
+    subprocess.run(cmd, check=True)
+
+def generate_video(path, seconds, pattern):
+    run_ffmpeg([
+        "-f", "lavfi",
+        "-i", f"testsrc2=size={BENCH_VIDEO_SIZE}:rate={BENCH_FRAME_RATE}:duration={seconds}",
+        "-vf", pattern,
+        "-c:v", "libx264",
+        "-preset", "ultrafast",
+        "-pix_fmt", "yuv420p",
+        "-fflags", "+bitexact",
+        "-flags:v", "+bitexact",
+        "-map_metadata", "-1",
+        "-y",
+        path
+    ])
+
+def generate_chapter(path, seconds, index):
+    # Every fourth chapter is mono at a lower rate, like the odd chapter in real books
+    sample_rate, channels = (22050, 1) if index % 4 == 3 else (44100, 2)
+    run_ffmpeg([
+        "-f", "lavfi",
+        "-i", f"sine=frequency={220 + index * 5}:sample_rate={sample_rate}:duration={seconds}",
+        "-ac", str(channels),
+        "-c:a", "libmp3lame",
+        "-b:a", "64k",
+        "-fflags", "+bitexact",
+        "-flags:a", "+bitexact",
+        "-map_metadata", "-1",
+        "-y",
+        path
+    ])
+
+def generate_media(work_dir, scale_name):
+    """Create the inputs of a scale once, later runs reuse them. Returns (video_paths, audio_paths)."""
+    scale = SCALES[scale_name]
+    stamp = hashlib.sha256(json.dumps([MEDIA_VERSION, scale], sort_keys=True).encode()).hexdigest()[:12]
+    media_dir = os.path.join(work_dir, "media", f"{scale_name}-{stamp}")
+
+    video_paths = [os.path.join(media_dir, "intro.mp4"), os.path.join(media_dir, "body.mp4")]
+    audio_paths = [os.path.join(media_dir, f"chapter {index + 1:03d}.mp3") for index in range(scale["chapters"])]
+
+    # The marker is written last, a half generated set is started over
+    complete_path = os.path.join(media_dir, ".complete")
+    if os.path.exists(complete_path):
+        return video_paths, audio_paths
+
+    shutil.rmtree(media_dir, ignore_errors=True)
+    os.makedirs(media_dir)
+    print(f"Generating {scale_name} inputs in {media_dir}", file=sys.stderr)
+
+    generate_video(video_paths[0], scale["intro_seconds"], "hue=h=90")
+    generate_video(video_paths[1], scale["body_seconds"], "null")
+    for index, audio_path in enumerate(audio_paths):
+        generate_chapter(audio_path, scale["chapter_seconds"], index)
+
+    with open(complete_path, "w") as f:
+        f.write(stamp)
+    return video_paths, audio_paths
+
+def get_tree_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                # Temp files come and go while ffmpeg runs
+                pass
+    return total
+
+class DiskSampler(threading.Thread):
+    """Polls the combined size of some directory trees and remembers the largest value."""
+
+    def __init__(self, paths):
+        super().__init__(daemon=True)
+        self.paths = paths
+        self.peak_bytes = 0
+        self.stopped = threading.Event()
+
+    def sample(self):
+        self.peak_bytes = max(self.peak_bytes, sum(get_tree_size(path) for path in self.paths))
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(DISK_SAMPLE_INTERVAL)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+def run_case(work_dir, scale_name, render_mode, audio_mode, profile=DEFAULT_PROFILE):
+    """Render one scale with one combination of modes and measure it."""
+    video_paths, audio_paths = generate_media(work_dir, scale_name)
+
+    scratch_root = os.path.join(work_dir, "scratch")
+    output_dir = os.path.join(work_dir, "output")
+    shutil.rmtree(scratch_root, ignore_errors=True)
+    os.makedirs(scratch_root)
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"{scale_name}-{render_mode}-{audio_mode}-{profile}.mp4")
+
+    # Parallel segments are written next to the output, and segments left by an aborted run must not be reused
+    parts_dir = videothing.get_parts_dir(output_path)
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+    # Synthetic runs go to their own history, the planner must only learn from real renders
+    renderer = Renderer(video_paths, audio_paths, output_path, render_mode,
+                        scratch_root=scratch_root, audio_mode=audio_mode, profile=profile, resume=False,
+                        history_path=os.path.join(work_dir, "render_history.jsonl"))
+    sampler = DiskSampler([scratch_root, parts_dir])
+    sampler.start()
+
+    started = time.monotonic()
+    try:
+        renderer.run()
+    finally:
+        sampler.stop()
+    wall = time.monotonic() - started
+
+    summary = renderer.trace.summary()
+    output_bytes = os.path.getsize(output_path)
+    os.remove(output_path)
+
+    return {
+        "scale": scale_name,
+        "render_mode": render_mode,
+        "audio_mode": audio_mode,
+        "profile": profile,
+        "output_seconds": summary["audio_duration"],
+        "wall": wall,
+        "throughput": summary["audio_duration"] / wall,
+        "peak_rss": summary["peak_rss"],
+        "peak_temp_bytes": sampler.peak_bytes,
+        "output_bytes": output_bytes,
+        "stages": {name: stage["wall"] for name, stage in summary["stages"].items()},
+    }
+
+def merge_repeats(runs):
+    """Median of every measurement over repeated runs of the same case."""
+    result = dict(runs[0])
+    for key in ("wall", "throughput", "peak_rss", "peak_temp_bytes"):
+        result[key] = statistics.median(run[key] for run in runs)
+    result["stages"] = {name: statistics.median(run["stages"][name] for run in runs) for name in runs[0]["stages"]}
+    result["repeats"] = len(runs)
+    return result
+
+def case_key(result):
+    return f"{result['scale']}/{result['render_mode']}/{result['audio_mode']}/{result.get('profile', DEFAULT_PROFILE)}"
+
+def print_result(result):
+    stages = "  ".join(f"{name} {wall:.1f}s" for name, wall in result["stages"].items())
+    print(f"{case_key(result):50s} {format_duration(result['output_seconds']):>9s} in {result['wall']:7.1f}s"
+          f"  {result['throughput']:7.1f}x  {result['peak_rss'] / 1024 ** 2:6.0f} MB RSS"
+          f"  {result['peak_temp_bytes'] / 1024 ** 2:7.0f} MB temp  {stages}")
+
+def compare_results(results, baseline, tolerance):
+    """Print the change against the baseline, returns the number of cases that regressed."""
+    baseline_cases = {case_key(result): result for result in baseline["results"]}
+    regressions = 0
+
+    for result in results:
+        key = case_key(result)
+        base = baseline_cases.get(key)
+        if base is None:
+            print(f"{key:50s} not in baseline")
+            continue
+
+        problems = []
+        throughput_change = (result["throughput"] - base["throughput"]) / base["throughput"] * 100
+        if throughput_change < -tolerance:
+            problems.append("throughput")
+        for field in ("peak_rss", "peak_temp_bytes"):
+            if base[field] and (result[field] - base[field]) / base[field] * 100 > tolerance:
+                problems.append(field)
+
+        line = f"{key:50s} throughput {throughput_change:+6.1f}%"
+        if base["peak_rss"]:
+            line += f"  RSS {(result['peak_rss'] - base['peak_rss']) / base['peak_rss'] * 100:+6.1f}%"
+        if base["peak_temp_bytes"]:
+            line += f"  temp {(result['peak_temp_bytes'] - base['peak_temp_bytes']) / base['peak_temp_bytes'] * 100:+6.1f}%"
+        if problems:
+            regressions += 1
+            line += "  REGRESSION: " + ", ".join(problems)
+        print(line)
+
+    return regressions
+
+def launch_app(app_path, importtime=False):
+    env = dict(os.environ)
+    if sys.platform.startswith("linux") and not env.get("DISPLAY") and not env.get("WAYLAND_DISPLAY"):
+        env["QT_QPA_PLATFORM"] = "offscreen"
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", STARTUP_SCRIPT, app_path]
+    return subprocess.run(cmd, env=env, capture_output=True, text=True, check=True)
+
+def parse_importtime(output):
+    """(self, cumulative, module) in microseconds for every line of -X importtime output."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((int(self_time), int(cumulative), name.strip()))
+    return imports
+
+def run_startup(app_path, runs):
+    """Median milliseconds from starting python to the first painted main window, plus one run's imports."""
+    # The first launch writes bytecode and warms the disk cache, like every launch after installing
+    launch_app(app_path)
+    walls = []
+    for _ in range(runs):
+        started = time.monotonic()
+        launch_app(app_path)
+        walls.append((time.monotonic() - started) * 1000)
+    # Timed separately, -X importtime slows the imports it measures
+    imports = parse_importtime(launch_app(app_path, importtime=True).stderr)
+    return statistics.median(walls), imports
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench", description="Benchmark the render pipeline on generated media.")
+    parser.add_argument("--scale", nargs="+", choices=list(SCALES), default=["small"], help="input sets to render")
+    parser.add_argument("--mode", nargs="+", choices=list(RENDER_MODES), default=list(RENDER_MODES), help="render modes")
+    parser.add_argument("--audio-mode", nargs="+", choices=list(AUDIO_MODES), default=list(AUDIO_MODES),
+                        help="audio modes")
+    parser.add_argument("--profile", nargs="+", default=[DEFAULT_PROFILE], help="encoding profiles")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the median is reported")
+    parser.add_argument("--work-dir", default=os.path.join(get_cache_dir(), "bench"),
+                        help="where generated inputs, scratch files and outputs go")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the artifact cache on, measures re-renders")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--save-baseline", metavar="FILE", help="store the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a baseline, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=15,
+                        help="percent of throughput loss or memory/disk growth allowed against the baseline (default 15)")
+    parser.add_argument("--startup", action="store_true",
+                        help="time app launches to the first painted window instead of rendering")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET_MS, metavar="MS",
+                        help=f"exit 1 when the median launch takes longer (default {STARTUP_BUDGET_MS})")
+    parser.add_argument("--debug", action="store_true", help="print ffmpeg command lines and output")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+        wall, imports = run_startup(app_path, args.repeat if args.repeat > 1 else STARTUP_RUNS)
+        app_import = next((cumulative for _, cumulative, name in imports if name == "app"), 0)
+        print(f"First paint in {wall:.0f} ms (budget {args.startup_budget:.0f} ms), importing app {app_import / 1000:.0f} ms")
+        for self_time, cumulative, name in sorted(imports, reverse=True)[:STARTUP_TOP_IMPORTS]:
+            print(f"  {name:40s} {self_time / 1000:7.1f} ms self  {cumulative / 1000:7.1f} ms total")
+        return 1 if wall > args.startup_budget else 0
+
+    videothing.debug = args.debug
+    # Cold renders by default, a cache hit would hide the cost of the stage being measured
+    configure_artifact_cache(args.warm_cache)
+
+    profiles = get_encoding_profiles()
+    for profile in args.profile:
+        if profile not in profiles:
+            parser.error(f"unknown encoding profile {profile} (choose from {', '.join(profiles)})")
+
+    results = []
+    for scale_name in args.scale:
+        for render_mode in args.mode:
+            for audio_mode in args.audio_mode:
+                for profile in args.profile:
+                    runs = [run_case(args.work_dir, scale_name, render_mode, audio_mode, profile)
+                            for _ in range(args.repeat)]
+                    result = merge_repeats(runs)
+                    print_result(result)
+                    results.append(result)
+
+    report = {
+        "time": time.time(),
+        **videothing.get_build_info(),
+        "cpu_count": os.cpu_count(),
+        "warm_cache": args.warm_cache,
+        "results": results,
+    }
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("cpu_count") != report["cpu_count"]:
+            print(f"Warning: baseline was taken on {baseline.get('cpu_count')} cores, this machine has {report['cpu_count']}",
+                  file=sys.stderr)
+        if compare_results(results, baseline, args.tolerance):
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
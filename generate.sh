@@ -29,18 +29,42 @@ fi
 # Path to Python virtual environment
 VENV_DIR="$DIR/venv"
 
-# Check if the virtual environment exists
-if [ ! -d "$VENV_DIR" ]; then
+# PyQt6 wheels bundled by the release build, listed with their hashes in SHA256SUMS
+WHEELS_DIR="$RESOURCES_DIR/wheels"
+
+# Bytecode goes next to the environment, so the signed bundle is never written to
+export PYTHONPYCACHEPREFIX="$VENV_DIR/pycache"
+
+# The environment is rebuilt when the bundled wheels change or the python it points to is gone
+if [ -f "$WHEELS_DIR/SHA256SUMS" ]; then
+    STAMP=$(cat "$WHEELS_DIR/SHA256SUMS")
+else
+    STAMP="pypi"
+fi
+
+if [ ! -x "$VENV_DIR/bin/python3" ] || [ "$(cat "$VENV_DIR/.stamp" 2>/dev/null)" != "$STAMP" ]; then
     # Create a fresh environment
+    rm -rf "$VENV_DIR"
     python3 -m venv "$VENV_DIR"
 
-    # Install required packages
-    "$VENV_DIR/bin/pip" install --upgrade pip
-    "$VENV_DIR/bin/pip" install PyQt6 setuptools
+    # Install offline from the bundled wheels when they verify, from PyPI otherwise
+    if [ "$STAMP" != "pypi" ] && (cd "$WHEELS_DIR" && shasum -a 256 --status -c SHA256SUMS) &&
+        "$VENV_DIR/bin/pip" install --no-index --find-links "$WHEELS_DIR" PyQt6; then
+        :
+    else
+        "$VENV_DIR/bin/pip" install --upgrade pip
+        "$VENV_DIR/bin/pip" install PyQt6
+    fi
+
+    # Compile the app now rather than on the first window
+    "$VENV_DIR/bin/python3" -m compileall -q "$RESOURCES_DIR"
+
+    # Written last, an interrupted setup starts over on the next launch
+    echo "$STAMP" > "$VENV_DIR/.stamp"
 fi
 
 # Run the app from the virtual environment
-cd "$DIR" && "$VENV_DIR/bin/python3" "$RESOURCES_DIR/app.py"
+cd "$DIR" && exec "$VENV_DIR/bin/python3" "$RESOURCES_DIR/app.py"
 EOF
 
 chmod +x "$MACOS_DIR/$APP_NAME"
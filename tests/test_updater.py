@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+# Updater against a local release server, run with python3 -m unittest discover tests
+
+import hashlib
+import http.server
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import videothing
+
+ETAG = '"release-1"'
+LAST_MODIFIED = "Sat, 17 Oct 2026 10:00:00 GMT"
+
+class ReleaseHandler(http.server.BaseHTTPRequestHandler):
+    """Serves server.files, answering 304 when the validators of the request match."""
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        body = self.server.files.get(self.path.lstrip("/"))
+        if body is None:
+            self.send_error(404)
+            return
+
+        if self.headers.get("If-None-Match") == ETAG or self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class UpdaterTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.app_dir = os.path.join(self.temp_dir, "app")
+        os.makedirs(self.app_dir)
+        with open(os.path.join(self.app_dir, "app.py"), "wb") as f:
+            f.write(b"old app\n")
+        self.state_path = os.path.join(self.temp_dir, "update_state.json")
+
+        self.httpd = http.server.HTTPServer(("127.0.0.1", 0), ReleaseHandler)
+        self.httpd.requests = []
+        self.httpd.files = {}
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+        thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        thread.start()
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        shutil.rmtree(self.temp_dir)
+
+    def publish(self, body, sha256=None):
+        self.httpd.files["app.py"] = body
+        self.httpd.files[videothing.UPDATE_MANIFEST] = json.dumps({
+            "version": "1.0",
+            "files": {"app.py": {"sha256": sha256 or hashlib.sha256(body).hexdigest()}},
+        }).encode()
+
+    def make_updater(self):
+        return videothing.Updater(self.app_dir, self.base_url, ["app.py"], self.state_path)
+
+    def read_app(self):
+        with open(os.path.join(self.app_dir, "app.py"), "rb") as f:
+            return f.read()
+
+    def test_unchanged_manifest_is_revalidated(self):
+        self.publish(b"new app\n")
+        self.assertEqual(self.make_updater().check(), ["app.py"])
+        self.assertNotIn("If-None-Match", self.httpd.requests[0])
+
+        # A new instance reads the validators back from the state file
+        with open(self.state_path) as f:
+            state = json.load(f)
+        self.assertEqual(state["etag"], ETAG)
+        self.assertEqual(state["last_modified"], LAST_MODIFIED)
+
+        updater = self.make_updater()
+        self.assertEqual(updater.check(), ["app.py"])
+        self.assertEqual(self.httpd.requests[1].get("If-None-Match"), ETAG)
+        self.assertEqual(self.httpd.requests[1].get("If-Modified-Since"), LAST_MODIFIED)
+        self.assertEqual(updater.version, "1.0")
+
+        updater.apply(["app.py"])
+        self.assertEqual(self.read_app(), b"new app\n")
+
+    def test_missing_file_is_restored_only_through_the_manifest(self):
+        # The app no longer fetches a missing engine itself, the updater is the only way back
+        engine = b"engine\n"
+        self.httpd.files["videothing.py"] = engine
+        self.publish(b"old app\n")
+        manifest = json.loads(self.httpd.files[videothing.UPDATE_MANIFEST])
+        manifest["files"]["videothing.py"] = {"sha256": hashlib.sha256(engine).hexdigest()}
+        self.httpd.files[videothing.UPDATE_MANIFEST] = json.dumps(manifest).encode()
+
+        updater = videothing.Updater(self.app_dir, self.base_url, ["app.py", "videothing.py"], self.state_path)
+        self.assertEqual(updater.check(), ["videothing.py"])
+
+        self.httpd.files["videothing.py"] = b"tampered engine\n"
+        with self.assertRaises(RuntimeError):
+            updater.apply(["videothing.py"])
+        self.assertFalse(os.path.exists(os.path.join(self.app_dir, "videothing.py")))
+
+        self.httpd.files["videothing.py"] = engine
+        updater.apply(["videothing.py"])
+        with open(os.path.join(self.app_dir, "videothing.py"), "rb") as f:
+            self.assertEqual(f.read(), engine)
+
+    def test_download_with_wrong_hash_is_refused(self):
+        self.publish(b"tampered app\n", sha256=hashlib.sha256(b"new app\n").hexdigest())
+        updater = self.make_updater()
+        self.assertEqual(updater.check(), ["app.py"])
+
+        with self.assertRaises(RuntimeError):
+            updater.apply(["app.py"])
+        self.assertEqual(self.read_app(), b"old app\n")
+        self.assertEqual(os.listdir(self.app_dir), ["app.py"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,4311 @@
+#!/usr/bin/python3
+
+# Video Thing render engine and command line interface, usable without PyQt6
+
+import re
+import sys
+import subprocess
+import os
+import tempfile
+import shutil
+import heapq
+import itertools
+import math
+import threading
+import json
+import time
+import selectors
+import collections
+import signal
+import contextlib
+try:
+    import resource
+except ImportError:
+    resource = None
+
+debug = False
+
+# Render modes offered in the "Render Mode" menu
+RENDER_MODES = {
+    "loop_tile": "Loop Tile (encode once, copy)",
+    "parallel": "Parallel Segments (all cores)",
+    "standard": "Standard (re-encode everything)",
+}
+
+# How the chapters reach the final mux, offered below the render modes
+AUDIO_MODES = {
+    "cached": "Cached Audio (reuse unchanged chapters)",
+    "stream": "Streamed Audio (no merged file on disk)",
+}
+
+# Containers the output is written in, offered below the audio modes
+OUTPUT_FORMATS = {
+    "mp4": "Regular MP4",
+    "fragmented": "Fragmented MP4 (playable while rendering)",
+    "hls": "HLS Segments (upload while rendering)",
+}
+
+# Length of the fragments and HLS segments of a streaming output, at most this much is lost on an abort
+FRAGMENT_SECONDS = 6
+
+# Output video profile, clips that already match it are copied instead of re-encoded
+TARGET_HEIGHT = 720
+TARGET_VIDEO_CODEC = "h264"
+TARGET_PIX_FMT = "yuv420p"
+
+# Filter applied to every source clip before it lands in the output timeline
+VIDEO_FILTER = f"scale=-1:{TARGET_HEIGHT}"
+
+# H.264 profiles as ffprobe names them, and the libx264 profile that produces a stream joinable to them
+X264_PROFILES = {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high"}
+
+# Stream parameters two copied clips must share to be joined by the concat demuxer
+PASSTHROUGH_MATCH_FIELDS = [
+    ("video_profile", "profile"),
+    ("video_level", "level"),
+    ("width", "width"),
+    ("extradata_hash", "parameter sets"),
+]
+
+# Time base every tile is written with, copied clips are remuxed to it
+TILE_TIMESCALE = 90000
+
+# Default keyframe spacing of the output, identical for intro and body tiles
+TILE_GOP_SECONDS = 2
+
+# Output encoder settings offered in the "Encoding" menu, balanced matches ffmpeg's defaults
+ENCODING_PROFILES = {
+    "draft": {"label": "Fast Draft", "preset": "ultrafast", "crf": 28, "max_frame_rate": 15, "audio_bitrate": "96k"},
+    "balanced": {"label": "Balanced", "preset": "medium", "crf": 23, "audio_bitrate": "128k"},
+    "archive": {"label": "Archive", "preset": "slow", "crf": 18, "audio_bitrate": "192k"},
+    "static": {"label": "Static Loop (low motion)", "preset": "veryfast", "crf": 23, "tune": "stillimage",
+               "keyint_seconds": 10, "max_frame_rate": 10, "audio_bitrate": "128k"},
+}
+DEFAULT_PROFILE = "balanced"
+
+# Loudness target the app normalizes to, usual for spoken word online
+DEFAULT_LOUDNESS = -16
+
+# Loudness range and true peak ceiling of normalized chapters. The range is wide enough that most speech
+# is corrected by a constant gain instead of being compressed
+LOUDNESS_RANGE = 11
+LOUDNESS_TRUE_PEAK = -1.5
+
+# Preview clips: height, seconds shown around the intro to body cut and of the middle sample
+PREVIEW_HEIGHT = 360
+PREVIEW_WINDOW_SECONDS = 16
+
+# libx264 presets from fastest to slowest, the order calibration tries them in
+X264_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+
+# Every chapter is resampled to this layout so the AAC parts can be joined by stream copy
+AUDIO_SAMPLE_RATE = 44100
+AUDIO_CHANNELS = 2
+
+# Probe results kept on disk, least recently used entries are dropped beyond this
+MEDIA_CACHE_MAX_ENTRIES = 20000
+
+# Bumped whenever run_ffprobe returns new fields, older cache entries are probed again
+MEDIA_INFO_VERSION = 3
+
+# Bumped whenever the loudness measurement changes, older measurements are taken again
+LOUDNESS_INFO_VERSION = 1
+
+def get_binary_path(binary_name):
+    """Find the path to a bundled binary (ffmpeg or ffprobe)."""
+    # py2app specific - check if running as a bundled .app
+    if hasattr(sys, "frozen") and sys.frozen:
+        # Get the Resources directory in the app bundle
+        if getattr(sys, 'frozen', False) and getattr(sys, '_MEIPASS', False):
+            # PyInstaller case (fallback)
+            base_path = sys._MEIPASS
+        else:
+            # py2app case - use the resource path of the .app bundle
+            base_path = os.path.join(os.path.dirname(os.path.dirname(sys.executable)), 'Resources')
+
+        # Return the full path to the binary
+        binary_path = os.path.join(base_path, binary_name)
+        if os.path.exists(binary_path):
+            return binary_path
+
+    # Fallback - look for the binary in the current directory
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    binary_path = os.path.join(current_dir, binary_name)
+    if os.path.exists(binary_path):
+        return binary_path
+
+    # Final fallback - assume it's in the PATH
+    return binary_name
+
+def get_executable_path(binary_name):
+    binary_path = get_binary_path(binary_name)
+
+    # Make sure the binary is executable (if it's a file that we can access)
+    if os.path.isfile(binary_path):
+        try:
+            os.chmod(binary_path, 0o755)
+        except OSError:
+            # If we can't chmod, it's probably already executable or we don't have permission
+            pass
+
+    return binary_path
+
+def get_cache_dir():
+    """Per-user cache directory, created on first use."""
+    if sys.platform == 'darwin':
+        cache_dir = os.path.expanduser("~/Library/Caches/Video Thing")
+    else:
+        base_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        cache_dir = os.path.join(base_dir, "video-thing")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+class MediaInfoCache:
+    """ffprobe results stored in SQLite, keyed by path, size and modification time."""
+
+    def __init__(self, db_path, max_entries=MEDIA_CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.executor = None
+
+        with self.connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS media_info (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    info TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS media_info_last_used ON media_info (last_used)")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS content_hash (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    hash TEXT NOT NULL
+                )
+            """)
+            # Keyed by content, so a renamed or copied chapter is not measured again
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS loudness (
+                    hash TEXT PRIMARY KEY,
+                    info TEXT NOT NULL
+                )
+            """)
+
+    @contextlib.contextmanager
+    def connect(self):
+        """Connection for one transaction, committed on success and always closed."""
+        import sqlite3
+        # The connection's own context manager only commits or rolls back, it never closes
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=30)) as db, db:
+            yield db
+
+    def get(self, path):
+        """Return the cached info for path, or None if it is unknown or the file changed."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        with self.lock, self.connect() as db:
+            row = db.execute("SELECT info FROM media_info WHERE path = ? AND size = ? AND mtime = ?",
+                             (path, stat.st_size, stat.st_mtime)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE media_info SET last_used = ? WHERE path = ?", (time.time(), path))
+
+        info = json.loads(row[0])
+        if info.get("version") != MEDIA_INFO_VERSION:
+            return None
+        return info
+
+    def probe(self, path, remember=True):
+        """Return media info for path, running ffprobe only on a cache miss."""
+        info = self.get(path) if remember else None
+        if info is not None:
+            return info
+
+        stat = os.stat(path)
+        info = self.run_ffprobe(path)
+        if remember:
+            self.put(path, stat, info)
+        return info
+
+    def put(self, path, stat, info):
+        with self.lock, self.connect() as db:
+            db.execute("INSERT OR REPLACE INTO media_info (path, size, mtime, info, last_used) VALUES (?, ?, ?, ?, ?)",
+                       (path, stat.st_size, stat.st_mtime, json.dumps(info), time.time()))
+
+            # Evict the least recently used entries beyond the limit
+            count = db.execute("SELECT COUNT(*) FROM media_info").fetchone()[0]
+            if count > self.max_entries:
+                db.execute("DELETE FROM media_info WHERE path IN "
+                           "(SELECT path FROM media_info ORDER BY last_used LIMIT ?)",
+                           (count - self.max_entries,))
+
+    def get_content_hash(self, path):
+        """Hash of the file contents, recomputed only when size or mtime change."""
+        stat = os.stat(path)
+        with self.lock, self.connect() as db:
+            row = db.execute("SELECT hash FROM content_hash WHERE path = ? AND size = ? AND mtime = ?",
+                             (path, stat.st_size, stat.st_mtime)).fetchone()
+        if row is not None:
+            return row[0]
+
+        content_hash = hash_file(path)
+        with self.lock, self.connect() as db:
+            db.execute("INSERT OR REPLACE INTO content_hash (path, size, mtime, hash) VALUES (?, ?, ?, ?)",
+                       (path, stat.st_size, stat.st_mtime, content_hash))
+            # Keep as many hashes as probe results, oldest first out
+            db.execute("DELETE FROM content_hash WHERE rowid <= "
+                       "(SELECT MAX(rowid) FROM content_hash) - ?", (self.max_entries,))
+        return content_hash
+
+    def get_loudness(self, content_hash):
+        """Loudness measured earlier for these contents, or None."""
+        with self.lock, self.connect() as db:
+            row = db.execute("SELECT info FROM loudness WHERE hash = ?", (content_hash,)).fetchone()
+        if row is None:
+            return None
+
+        info = json.loads(row[0])
+        if info.get("version") != LOUDNESS_INFO_VERSION:
+            return None
+        return info
+
+    def put_loudness(self, content_hash, info):
+        with self.lock, self.connect() as db:
+            db.execute("INSERT OR REPLACE INTO loudness (hash, info) VALUES (?, ?)", (content_hash, json.dumps(info)))
+            db.execute("DELETE FROM loudness WHERE rowid <= "
+                       "(SELECT MAX(rowid) FROM loudness) - ?", (self.max_entries,))
+
+    def prefetch(self, paths):
+        """Probe paths on a background pool so the results are ready before rendering."""
+        if self.executor is None:
+            import concurrent.futures
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 2))
+
+        for path in paths:
+            self.executor.submit(self.prefetch_one, path)
+
+    def prefetch_one(self, path):
+        try:
+            self.probe(path)
+        except Exception as e:
+            if debug:
+                print(f"Background probe failed for {path}: {e}")
+
+    def run_ffprobe(self, path):
+        cmd = [
+            get_executable_path("ffprobe"),
+            "-v", "error",
+            "-show_data_hash", "sha256",
+            "-show_entries",
+            "format=duration,bit_rate:stream=codec_type,codec_name,profile,level,width,height,pix_fmt,field_order,"
+            "r_frame_rate,avg_frame_rate,time_base,extradata_hash,sample_rate,channels,channel_layout",
+            "-of", "json",
+            path
+        ]
+
+        if debug:
+            print(' '.join(cmd))
+
+        try:
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                                    timeout=PROBE_TIMEOUT_SECONDS)
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f"Timed out probing {path}")
+
+        try:
+            probed = json.loads(result.stdout)
+        except ValueError:
+            print(f"Error probing media. ffprobe output: {result.stdout}")
+            print(f"ffprobe error: {result.stderr}")
+            raise RuntimeError(f"Failed to probe {path}")
+
+        info = {
+            "version": MEDIA_INFO_VERSION,
+            "duration": None,
+            "bit_rate": None,
+            "video_codec": None,
+            "video_profile": None,
+            "video_level": None,
+            "width": None,
+            "height": None,
+            "pix_fmt": None,
+            "interlaced": False,
+            "frame_rate": None,
+            "variable_frame_rate": False,
+            "time_base": None,
+            "extradata_hash": None,
+            "audio_codec": None,
+            "sample_rate": None,
+            "channels": None,
+            "channel_layout": None,
+        }
+
+        try:
+            info["duration"] = float(probed.get("format", {}).get("duration"))
+        except (TypeError, ValueError):
+            pass
+
+        try:
+            info["bit_rate"] = int(probed.get("format", {}).get("bit_rate"))
+        except (TypeError, ValueError):
+            pass
+
+        for stream in probed.get("streams", []):
+            if stream.get("codec_type") == "video" and info["video_codec"] is None:
+                info["video_codec"] = stream.get("codec_name")
+                info["video_profile"] = stream.get("profile")
+                info["video_level"] = stream.get("level")
+                info["width"] = stream.get("width")
+                info["height"] = stream.get("height")
+                info["pix_fmt"] = stream.get("pix_fmt")
+                info["interlaced"] = stream.get("field_order", "progressive") not in ("progressive", "unknown")
+                info["time_base"] = stream.get("time_base")
+                info["extradata_hash"] = stream.get("extradata_hash")
+                # A container frame rate that differs from the average means frames are not evenly spaced
+                info["variable_frame_rate"] = stream.get("avg_frame_rate") not in (None, "0/0", stream.get("r_frame_rate"))
+                try:
+                    numerator, denominator = stream.get("r_frame_rate", "").split('/')
+                    info["frame_rate"] = round(float(numerator) / float(denominator), 3)
+                except (ValueError, ZeroDivisionError):
+                    pass
+            elif stream.get("codec_type") == "audio" and info["audio_codec"] is None:
+                info["audio_codec"] = stream.get("codec_name")
+                info["channels"] = stream.get("channels")
+                info["channel_layout"] = stream.get("channel_layout")
+                try:
+                    info["sample_rate"] = int(stream.get("sample_rate"))
+                except (TypeError, ValueError):
+                    pass
+
+        return info
+
+media_info_cache = None
+
+def get_media_info_cache():
+    global media_info_cache
+    if media_info_cache is None:
+        media_info_cache = MediaInfoCache(os.path.join(get_cache_dir(), "media_info.sqlite"))
+    return media_info_cache
+
+# Slice of a memory-mapped file fed to the hash at a time
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+def hash_file(path):
+    """SHA-256 of a file, streamed through a memory map so large files are never read into memory."""
+    import hashlib
+    import mmap
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return digest.hexdigest()
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            for offset in range(0, size, HASH_CHUNK_SIZE):
+                digest.update(view[offset:offset + HASH_CHUNK_SIZE])
+
+    return digest.hexdigest()
+
+def parse_loudness(lines):
+    """Input statistics from the JSON that a loudnorm measurement pass logs when it finishes."""
+    try:
+        start = max(index for index, line in enumerate(lines) if line == "{")
+        stats = json.loads("\n".join(lines[start:]))
+        info = {key: float(stats[f"input_{key}"]) for key in ("i", "tp", "lra", "thresh")}
+    except (ValueError, KeyError):
+        raise RuntimeError("ffmpeg did not report the loudness")
+
+    info["version"] = LOUDNESS_INFO_VERSION
+    return info
+
+def link_or_copy(source, destination):
+    # A hard link costs nothing and keeps the data alive if the other name is deleted
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+# Size limit of the intermediate artifact cache, least recently used artifacts go first
+ARTIFACT_CACHE_MAX_BYTES = 10 * 1024 * 1024 * 1024
+
+# Bump when the way intermediates are produced changes, so stale artifacts are never reused
+ARTIFACT_CACHE_VERSION = 1
+
+class ArtifactCache:
+    """Intermediate render outputs stored under a hash of their inputs and encode parameters."""
+
+    def __init__(self, cache_dir, max_bytes=ARTIFACT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, kind, input_hashes, params):
+        import hashlib
+        description = json.dumps({
+            "version": ARTIFACT_CACHE_VERSION,
+            "inputs": input_hashes,
+            "params": params,
+        }, sort_keys=True)
+        return f"{kind}-{hashlib.sha256(description.encode()).hexdigest()}"
+
+    def fetch(self, key, destination):
+        """Place the cached artifact at destination. Returns False on a miss."""
+        path = os.path.join(self.cache_dir, key)
+        try:
+            # Touch for LRU, then link it so eviction can't pull it away mid-render
+            os.utime(path)
+            link_or_copy(path, destination)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def store(self, key, source):
+        path = os.path.join(self.cache_dir, key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            link_or_copy(source, temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.evict()
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+    def clear(self):
+        with self.lock:
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file():
+                    os.remove(entry.path)
+
+artifact_cache = None
+artifact_cache_enabled = True
+
+def configure_artifact_cache(enabled=True, limit_gb=None):
+    global artifact_cache_enabled
+    artifact_cache_enabled = enabled
+    if enabled and limit_gb is not None:
+        get_artifact_cache().max_bytes = int(limit_gb * 1024 ** 3)
+        get_artifact_cache().evict()
+
+def get_artifact_cache():
+    """Shared artifact cache, or None when caching is turned off."""
+    global artifact_cache
+    if not artifact_cache_enabled:
+        return None
+    if artifact_cache is None:
+        artifact_cache = ArtifactCache(os.path.join(get_cache_dir(), "artifacts"))
+    return artifact_cache
+
+scratch_root_override = None
+
+def get_settings_path():
+    return os.path.join(get_cache_dir(), "settings.json")
+
+def load_settings():
+    """Preferences shared by the app and the command line, such as the scratch folder."""
+    try:
+        with open(get_settings_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_settings(settings):
+    settings_path = get_settings_path()
+    temp_path = settings_path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(settings, f, indent=1)
+    os.replace(temp_path, settings_path)
+
+def configure_scratch_root(path):
+    """Put the scratch files of this process in path instead of the saved scratch folder."""
+    global scratch_root_override
+    scratch_root_override = path
+
+def get_scratch_root():
+    """Where renders put their scratch files: --scratch-dir, the saved scratch folder or the system temp dir."""
+    scratch_root = scratch_root_override or load_settings().get("scratch_dir")
+    if scratch_root and os.path.isdir(scratch_root):
+        return scratch_root
+    if scratch_root and debug:
+        # An unplugged external drive, fall back rather than fail every render
+        print(f"Scratch folder {scratch_root} is missing, using the system temp dir")
+    return tempfile.gettempdir()
+
+# Parallel renders are cut into segments of at most this length, the most an abort can lose per worker
+RESUME_SEGMENT_SECONDS = 300
+
+# Segments of a short book, enough to keep every core of a big machine busy
+PARALLEL_MIN_SEGMENTS = 16
+
+# Bump when the manifest layout changes, older manifests are then started over
+RENDER_MANIFEST_VERSION = 1
+
+def get_partial_path(output_path):
+    """Where a render writes before the finished file is moved to output_path."""
+    stem, extension = os.path.splitext(output_path)
+    return f"{stem}.partial{extension}"
+
+def get_final_output_path(output_path, output_format="mp4"):
+    """The file a render of output_path produces, the playlist for HLS."""
+    if output_format == "hls":
+        return os.path.splitext(output_path)[0] + ".m3u8"
+    return output_path
+
+def get_muxer_args(output_path, output_format):
+    """Muxer options placed before the output path of the final mux."""
+    if output_format == "fragmented":
+        # Fragments start at keyframes, and each is flushed so a killed ffmpeg leaves a valid file
+        return ["-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+                "-min_frag_duration", str(FRAGMENT_SECONDS * 1000000), "-flush_packets", "1"]
+    if output_format == "hls":
+        # Segments land under a temporary name and are renamed once complete, so an uploader never sees half a one
+        stem = os.path.splitext(output_path)[0]
+        return ["-f", "hls", "-hls_time", str(FRAGMENT_SECONDS), "-hls_segment_type", "fmp4",
+                "-hls_playlist_type", "event", "-hls_flags", "independent_segments+temp_file",
+                "-hls_fmp4_init_filename", os.path.basename(stem) + "_init.mp4",
+                "-hls_segment_filename", stem.replace("%", "%%") + "_%05d.m4s"]
+    return []
+
+def get_hls_files(playlist_path):
+    """The playlist plus the init segment and media segments it lists."""
+    paths = [playlist_path]
+    playlist_dir = os.path.dirname(playlist_path)
+    with open(playlist_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXT-X-MAP:URI="):
+                paths.append(os.path.join(playlist_dir, line.split("=", 1)[1].strip('"')))
+            elif line and not line.startswith("#"):
+                paths.append(os.path.join(playlist_dir, line))
+    return paths
+
+def get_parts_dir(output_path):
+    # Next to the output, on the disk that has to hold the result anyway
+    directory, name = os.path.split(os.path.abspath(output_path))
+    return os.path.join(directory, f".{name}.parts")
+
+class RenderManifest:
+    """Finished segments of a resumable render, kept on disk so a restart only encodes what is missing."""
+
+    def __init__(self, parts_dir, key, segments, frame_rate):
+        self.parts_dir = parts_dir
+        self.key = key
+        self.segments = segments
+        self.frame_rate = frame_rate
+        self.path = os.path.join(parts_dir, "manifest.json")
+        self.done = {}
+        self.lock = threading.Lock()
+
+    def load(self, resume=True):
+        """Keep the verified segments of an earlier attempt at the same job. Returns how many were kept."""
+        data = None
+        if resume:
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+        if not data or data.get("version") != RENDER_MANIFEST_VERSION or data.get("key") != self.key:
+            # Other inputs or settings, nothing from the old attempt fits
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+            os.makedirs(self.parts_dir)
+        else:
+            for index, entry in data["done"].items():
+                if self.verify(int(index), entry):
+                    self.done[int(index)] = entry
+
+            # Leftovers of the segments that were being encoded when the render stopped
+            for entry in os.scandir(self.parts_dir):
+                if entry.name.endswith(".tmp.mp4"):
+                    os.remove(entry.path)
+
+        self.save()
+        return len(self.done)
+
+    def verify(self, index, entry):
+        path = self.get_segment_path(index)
+        try:
+            if os.path.getsize(path) != entry["size"]:
+                return False
+            info = get_media_info_cache().probe(path, remember=False)
+        except (OSError, RuntimeError):
+            return False
+
+        # The size was recorded after the rename, but a damaged disk or a copied folder can still lie
+        _, length = self.segments[index]
+        return info["duration"] is not None and abs(info["duration"] - length) < 1.5 / self.frame_rate
+
+    def get_segment_path(self, index):
+        return os.path.join(self.parts_dir, f"segment_{index:05d}.mp4")
+
+    def get_temp_segment_path(self, index):
+        return os.path.join(self.parts_dir, f"segment_{index:05d}.tmp.mp4")
+
+    def complete(self, index):
+        """Move a finished segment into place and record it."""
+        temp_path = self.get_temp_segment_path(index)
+        path = self.get_segment_path(index)
+
+        # Data on disk before the rename, and the rename before the manifest names the segment
+        with open(temp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+        with self.lock:
+            self.done[index] = {"size": os.path.getsize(path)}
+            self.save()
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({
+                "version": RENDER_MANIFEST_VERSION,
+                "key": self.key,
+                "segments": self.segments,
+                "done": {str(index): entry for index, entry in sorted(self.done.items())},
+            }, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+# Minimum spacing between progress events sent to the GUI thread
+PROGRESS_EVENT_INTERVAL = 0.25
+
+class ProgressEvent:
+    """Snapshot of a render stage built from ffmpeg's -progress key/value stream."""
+
+    def __init__(self, frame=0, fps=0.0, speed=0.0, bitrate=0.0, out_time=0.0, total=None, eta=None, done=False):
+        self.frame = frame            # Frames written so far
+        self.fps = fps                # Encoding frames per second
+        self.speed = speed            # Output seconds per wall-clock second
+        self.bitrate = bitrate        # Output bitrate in kbit/s
+        self.out_time = out_time      # Seconds of output written
+        self.total = total            # Expected output length in seconds, if known
+        self.eta = eta                # Smoothed seconds remaining, if known
+        self.done = done              # True on the final block of a process
+
+    @property
+    def fraction(self):
+        if not self.total:
+            return 0.0
+        return max(0.0, min(1.0, self.out_time / self.total))
+
+    def __repr__(self):
+        return (f"ProgressEvent(frame={self.frame}, fps={self.fps}, speed={self.speed}, "
+                f"bitrate={self.bitrate}, out_time={self.out_time:.2f}, total={self.total}, "
+                f"eta={self.eta}, done={self.done})")
+
+class EtaEstimator:
+    """Exponentially smoothed rate of progress, turned into a remaining-time estimate."""
+
+    def __init__(self, smoothing=0.2):
+        self.smoothing = smoothing
+        self.rate = None
+        self.last_position = None
+        self.last_time = None
+
+    def update(self, position, total, now=None):
+        now = time.monotonic() if now is None else now
+        if self.last_time is not None and now > self.last_time and position >= self.last_position:
+            rate = (position - self.last_position) / (now - self.last_time)
+            if self.rate is None:
+                self.rate = rate
+            else:
+                self.rate = self.smoothing * rate + (1 - self.smoothing) * self.rate
+        self.last_position = position
+        self.last_time = now
+
+        if not total or not self.rate:
+            return None
+        return max(0.0, total - position) / self.rate
+
+class FFmpegProgressReader:
+    """Parses the -progress stream of one ffmpeg process into ProgressEvents."""
+
+    def __init__(self, total=None):
+        self.total = total
+        self.buffer = b""
+        self.block = {}
+        self.eta = EtaEstimator()
+
+    def feed(self, data):
+        """Consume raw bytes and return the events for every completed block."""
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b"\n")
+
+        events = []
+        for line in lines:
+            key, _, value = line.decode("utf-8", "replace").strip().partition("=")
+            if not key:
+                continue
+            self.block[key] = value
+            # Every block ends with progress=continue or progress=end
+            if key == "progress":
+                events.append(self.make_event(self.block))
+                self.block = {}
+        return events
+
+    def make_event(self, block):
+        out_time = self.parse_float(block.get("out_time_us")) / 1000000
+        event = ProgressEvent(
+            frame=int(self.parse_float(block.get("frame"))),
+            fps=self.parse_float(block.get("fps")),
+            speed=self.parse_float(block.get("speed", "").rstrip("x")),
+            bitrate=self.parse_float(block.get("bitrate", "").replace("kbits/s", "")),
+            out_time=max(0.0, out_time),
+            total=self.total,
+            done=block.get("progress") == "end",
+        )
+        event.eta = 0.0 if event.done else self.eta.update(event.out_time, self.total)
+        return event
+
+    def parse_float(self, value):
+        # ffmpeg reports N/A until it knows a value
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+
+class ProgressAggregator:
+    """Combines the events of concurrent ffmpeg processes into one stream over a shared total."""
+
+    def __init__(self, total, callback):
+        self.total = total
+        self.callback = callback
+        self.parts = {}
+        self.lock = threading.Lock()
+        self.eta = EtaEstimator()
+
+    def update(self, key, event):
+        with self.lock:
+            self.parts[key] = event
+            parts = list(self.parts.values())
+            out_time = sum(part.out_time for part in parts)
+            combined = ProgressEvent(
+                frame=sum(part.frame for part in parts),
+                fps=sum(part.fps for part in parts if not part.done),
+                speed=sum(part.speed for part in parts if not part.done),
+                bitrate=sum(part.bitrate for part in parts if not part.done),
+                out_time=out_time,
+                total=self.total,
+                eta=self.eta.update(out_time, self.total),
+            )
+        self.callback(combined)
+
+def natural_sort_key(s):
+    lower_s = s.lower()
+    if lower_s == "opening.mp3":
+        return (0, )  # Ensures it's always first
+    elif lower_s == "closing.mp3":
+        return (float('inf'), )  # Ensures it's always last
+
+    # For other files, use natural sorting
+    return tuple(
+        (1, ) +  # Normal files come after "Opening.mp3" but before "Closing.mp3"
+        tuple(
+            "".join((
+                "0" * (8 - len(c)),  # Zero-pad numbers to 8 digits
+                c if c.isdigit() else c.lower()
+            )) for c in re.split(r'(\d+)', s)
+        )
+    )
+
+def sort_media_paths(paths):
+    """Order files the way the drop zones do: Opening.mp3 first, Closing.mp3 last, natural sort between."""
+    return sorted(paths, key=lambda x: natural_sort_key(os.path.basename(x)))
+
+def list_media_files(directory, file_type):
+    files = [os.path.join(directory, name) for name in os.listdir(directory)
+             if name.lower().endswith(f'.{file_type}') and not name.startswith('.')]
+    return sort_media_paths(files)
+
+# Rough peak memory of one ffmpeg process encoding 720p, used to cap concurrency on small machines
+FFMPEG_PROCESS_MEMORY = 512 * 1024 * 1024
+
+def get_total_memory():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+class ProcessSlots:
+    """Caps the number of ffmpeg processes running at once across all renders."""
+
+    def __init__(self, capacity=None):
+        if capacity is None:
+            capacity = os.cpu_count() or 2
+
+            total_memory = get_total_memory()
+            if total_memory:
+                capacity = min(capacity, total_memory // FFMPEG_PROCESS_MEMORY)
+
+        self.capacity = max(1, capacity)
+        self.semaphore = threading.Semaphore(self.capacity)
+
+    def acquire(self, should_stop):
+        """Block until a slot is free. Returns False if should_stop() became true while waiting."""
+        while not self.semaphore.acquire(timeout=0.1):
+            if should_stop():
+                return False
+        return True
+
+    def release(self):
+        self.semaphore.release()
+
+process_slots = ProcessSlots()
+
+# Seconds ffmpeg gets to finish up after SIGTERM before its process group is killed
+PROCESS_KILL_GRACE = 2
+
+# Cancelled output is thrown away, so ffmpeg gets next to no time to flush it
+CANCEL_KILL_GRACE = 0.05
+
+# An ffmpeg whose output position has not moved for this long is treated as hung
+PROCESS_STALL_SECONDS = 120
+
+# ffprobe only reads headers, anything slower is a stuck mount or a broken file
+PROBE_TIMEOUT_SECONDS = 60
+
+def get_process_group_args():
+    """Popen arguments that start a child in its own process group, so it can be stopped with its helpers."""
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+def signal_process_group(process, kill=False):
+    try:
+        if sys.platform == "win32":
+            # TerminateProcess is immediate already, there is no gentler signal to send first
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+    except OSError:
+        # Exited in the meantime
+        pass
+
+def stop_process(process, grace=PROCESS_KILL_GRACE):
+    """Terminate a child's process group, killing it if it has not exited after grace seconds."""
+    if process.poll() is not None:
+        return
+
+    signal_process_group(process)
+    try:
+        process.wait(grace)
+    except subprocess.TimeoutExpired:
+        if debug:
+            print(f"Process {process.pid} ignored SIGTERM, killing it")
+        signal_process_group(process, kill=True)
+        process.wait()
+
+class SleepInhibitor:
+    """Keeps the machine from sleeping while a render runs, the lock goes away even if this process dies."""
+
+    ES_CONTINUOUS = 0x80000000
+    ES_SYSTEM_REQUIRED = 0x00000001
+
+    def __init__(self):
+        self.process = None
+        self.windows_state = False
+
+    def start(self):
+        try:
+            if sys.platform == "darwin":
+                # -w ends caffeinate together with this process
+                self.process = subprocess.Popen(['caffeinate', '-i', '-m', '-s', '-d', '-w', str(os.getpid())],
+                                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            elif sys.platform == "win32":
+                import ctypes
+                # Per thread, stop() runs on the same thread at the end of the render
+                ctypes.windll.kernel32.SetThreadExecutionState(self.ES_CONTINUOUS | self.ES_SYSTEM_REQUIRED)
+                self.windows_state = True
+            elif shutil.which("systemd-inhibit"):
+                # cat holds the lock until its stdin closes, which also happens when this process dies
+                self.process = subprocess.Popen(
+                    ["systemd-inhibit", "--what=sleep:idle", "--who=Video Thing", "--why=Rendering a video",
+                     "--mode=block", "cat"],
+                    stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            if debug:
+                print(f"Could not keep the system awake: {e}")
+            return
+
+        if debug and (self.process or self.windows_state):
+            print("Preventing system sleep during the render")
+
+    def stop(self):
+        if self.process:
+            if self.process.stdin:
+                self.process.stdin.close()
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+        if self.windows_state:
+            import ctypes
+            ctypes.windll.kernel32.SetThreadExecutionState(self.ES_CONTINUOUS)
+            self.windows_state = False
+
+# Seconds between /proc samples of a running ffmpeg
+RESOURCE_SAMPLE_INTERVAL = 0.2
+
+# Render summaries kept in the history file, older lines are dropped
+TRACE_HISTORY_MAX_ENTRIES = 2000
+
+# Per-job trace files kept for the app, oldest are removed first
+TRACE_FILES_MAX = 50
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+HAS_PROC = os.path.exists("/proc/self/status")
+
+build_info = None
+history_lock = threading.Lock()
+
+def get_build_info():
+    """Hash of this engine plus the ffmpeg version line, so history can be compared across versions."""
+    global build_info
+    import hashlib
+    if build_info is None:
+        with open(os.path.abspath(__file__), "rb") as f:
+            engine = hashlib.sha256(f.read()).hexdigest()[:12]
+        try:
+            result = subprocess.run([get_executable_path("ffmpeg"), "-version"], capture_output=True, text=True)
+            ffmpeg = result.stdout.split("\n")[0]
+        except OSError:
+            ffmpeg = "unknown"
+        build_info = {"engine": engine, "ffmpeg": ffmpeg}
+    return build_info
+
+def sample_process(pid):
+    """Peak RSS in bytes and CPU seconds of a running process, None where /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            peak_rss = 0
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peak_rss = int(line.split()[1]) * 1024
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces, the numeric fields start after its closing parenthesis
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, ValueError, IndexError):
+        return None
+    return peak_rss, cpu
+
+def get_child_usage():
+    """CPU seconds and peak RSS of every child process reaped so far."""
+    if resource is None:
+        return 0.0, 0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return usage.ru_utime + usage.ru_stime, peak_rss
+
+def get_history_path():
+    return os.path.join(get_cache_dir(), "render_history.jsonl")
+
+def get_trace_path(output_path):
+    """New trace file in the cache dir for a render of output_path, pruning the oldest ones."""
+    import datetime
+    trace_dir = os.path.join(get_cache_dir(), "traces")
+    os.makedirs(trace_dir, exist_ok=True)
+
+    traces = sorted(os.path.join(trace_dir, name) for name in os.listdir(trace_dir) if name.endswith(".json"))
+    for old_path in traces[:max(0, len(traces) - TRACE_FILES_MAX + 1)]:
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    name = os.path.splitext(os.path.basename(output_path))[0]
+    return os.path.join(trace_dir, f"{stamp}-{name}.json")
+
+def append_history(entry, history_path=None, max_entries=TRACE_HISTORY_MAX_ENTRIES):
+    history_path = history_path or get_history_path()
+    with history_lock:
+        with open(history_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+        # Trim only once the file is well past the limit, so most renders just append a line
+        with open(history_path) as f:
+            lines = f.readlines()
+        if len(lines) > max_entries * 1.25:
+            temp_path = history_path + ".tmp"
+            with open(temp_path, "w") as f:
+                f.writelines(lines[-max_entries:])
+            os.replace(temp_path, history_path)
+
+def read_history(history_path=None):
+    entries = []
+    try:
+        with open(history_path or get_history_path()) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by a crash, skip it
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+class RenderTrace:
+    """Wall time, child CPU, peak memory and speed of every stage and ffmpeg process of one render."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.origin = time.monotonic()
+        self.stages = []
+        self.processes = []
+        self.current_stage = None
+        self.metadata = {}
+        self.lock = threading.Lock()
+        self.thread_ids = {}
+
+    def now(self):
+        return time.monotonic() - self.origin
+
+    @contextlib.contextmanager
+    def stage(self, name, media_duration=None):
+        # Child CPU is process wide, concurrent jobs in one process each see the other's children
+        start = self.now()
+        start_cpu, start_rss = get_child_usage()
+        self.current_stage = name
+        try:
+            yield
+        finally:
+            end = self.now()
+            end_cpu, end_rss = get_child_usage()
+            with self.lock:
+                processes = [p for p in self.processes if p["stage"] == name]
+                peak_rss = max((p["peak_rss"] for p in processes), default=0)
+                if not HAS_PROC and end_rss > start_rss:
+                    # Without /proc, a new high of the reaped children must have come from this stage
+                    peak_rss = end_rss
+                self.stages.append({
+                    "name": name,
+                    "start": start,
+                    "wall": end - start,
+                    "child_cpu": end_cpu - start_cpu,
+                    "peak_rss": peak_rss,
+                    "processes": len(processes),
+                    "speed": media_duration / (end - start) if media_duration and end > start else None,
+                })
+            self.current_stage = None
+
+    def add_process(self, label, start, peak_rss, cpu, speed, returncode):
+        with self.lock:
+            tid = self.thread_ids.setdefault(threading.get_ident(), len(self.thread_ids) + 1)
+            self.processes.append({
+                "name": label,
+                "stage": self.current_stage,
+                "tid": tid,
+                "start": start,
+                "wall": self.now() - start,
+                "cpu": cpu,
+                "peak_rss": peak_rss,
+                "speed": speed,
+                "returncode": returncode,
+            })
+
+    def summary(self):
+        """One history line: build, render settings and per-stage totals."""
+        with self.lock:
+            stages = {stage["name"]: {key: value for key, value in stage.items() if key not in ("name", "start")}
+                      for stage in self.stages}
+        return {
+            "time": self.started,
+            **get_build_info(),
+            **self.metadata,
+            "wall": sum(stage["wall"] for stage in stages.values()),
+            "peak_rss": max((stage["peak_rss"] for stage in stages.values()), default=0),
+            "stages": stages,
+        }
+
+    def to_chrome_trace(self):
+        """Trace Event Format, loadable in chrome://tracing or Perfetto."""
+        events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": "pipeline"}}]
+        with self.lock:
+            for tid in self.thread_ids.values():
+                events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": f"worker {tid}"}})
+            for stage in self.stages:
+                events.append({"name": stage["name"], "cat": "stage", "ph": "X", "pid": 1, "tid": 0,
+                               "ts": stage["start"] * 1e6, "dur": stage["wall"] * 1e6,
+                               "args": {key: stage[key] for key in ("child_cpu", "peak_rss", "processes", "speed")}})
+            for process in self.processes:
+                events.append({"name": process["name"], "cat": "ffmpeg", "ph": "X", "pid": 1, "tid": process["tid"],
+                               "ts": process["start"] * 1e6, "dur": process["wall"] * 1e6,
+                               "args": {key: process[key] for key in ("stage", "cpu", "peak_rss", "speed", "returncode")}})
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": self.summary()}
+
+    def save(self, trace_path):
+        temp_path = trace_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.to_chrome_trace(), f, indent=1)
+        os.replace(temp_path, trace_path)
+
+class EncodingProfile:
+    """Encoder settings for the output: x264 preset, CRF and tune, keyframe interval, frame rate cap and audio bitrate."""
+
+    def __init__(self, name, label=None, preset="medium", crf=23, tune=None, keyint_seconds=TILE_GOP_SECONDS,
+                 max_frame_rate=None, audio_bitrate="128k", loudness=None):
+        self.name = name
+        self.label = label or name
+        self.preset = preset
+        self.crf = crf
+        self.tune = tune
+        self.keyint_seconds = keyint_seconds
+        self.max_frame_rate = max_frame_rate
+        self.audio_bitrate = audio_bitrate
+        # Integrated loudness target in LUFS, None leaves the chapters as they are
+        self.loudness = loudness
+
+    def to_dict(self):
+        return {"label": self.label, "preset": self.preset, "crf": self.crf, "tune": self.tune,
+                "keyint_seconds": self.keyint_seconds, "max_frame_rate": self.max_frame_rate,
+                "audio_bitrate": self.audio_bitrate, "loudness": self.loudness}
+
+    def with_overrides(self, **overrides):
+        """Copy of the profile with every setting that is not None replaced."""
+        settings = self.to_dict()
+        settings.update({key: value for key, value in overrides.items() if value is not None})
+        return EncodingProfile(self.name, **settings)
+
+    def get_frame_rate(self, source_frame_rate):
+        # Static visuals lose nothing at a lower rate, and every dropped frame is one less to encode
+        if self.max_frame_rate and source_frame_rate > self.max_frame_rate:
+            return self.max_frame_rate
+        return source_frame_rate
+
+    def get_gop(self, frame_rate):
+        return max(1, round(frame_rate * self.keyint_seconds))
+
+    def get_video_args(self, frame_rate, stream=None):
+        # With a stream index the options only reach that output stream, for several encodes in one ffmpeg
+        suffix = "" if stream is None else f":v:{stream}"
+        gop = self.get_gop(frame_rate)
+        args = ["-c:v" if stream is None else f"-c:v:{stream}", "libx264",
+                f"-preset{suffix}", self.preset, f"-crf{suffix}", str(self.crf)]
+        if self.tune:
+            args += [f"-tune{suffix}", self.tune]
+        return args + [f"-g{suffix}", str(gop), f"-keyint_min{suffix}", str(gop), f"-sc_threshold{suffix}", "0"]
+
+    def get_video_params(self):
+        # What changes the encoded video, used in artifact cache keys
+        return {"preset": self.preset, "crf": self.crf, "tune": self.tune, "keyint_seconds": self.keyint_seconds}
+
+    def get_audio_args(self):
+        return ["-c:a", "aac", "-b:a", self.audio_bitrate]
+
+    def get_loudness_filter(self, info):
+        """Second loudnorm pass bringing a chapter with the measured info to the target, None for silence."""
+        # A silent chapter measures as -inf and has nothing to correct
+        if not all(math.isfinite(info[key]) for key in ("i", "tp", "lra", "thresh")):
+            return None
+        return (f"loudnorm=I={self.loudness}:TP={LOUDNESS_TRUE_PEAK}:LRA={LOUDNESS_RANGE}"
+                f":measured_I={info['i']}:measured_TP={info['tp']}:measured_LRA={info['lra']}"
+                f":measured_thresh={info['thresh']}:linear=true")
+
+def get_profiles_path():
+    return os.path.join(get_cache_dir(), "profiles.json")
+
+def load_saved_profiles():
+    """Profiles written by the calibrate command, by name."""
+    try:
+        with open(get_profiles_path()) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    profiles = {}
+    for name, settings in saved.items():
+        # Calibration notes are kept in the file but are not encoder settings
+        settings = {key: value for key, value in settings.items() if key in EncodingProfile(name).to_dict()}
+        profiles[name] = EncodingProfile(name, **settings)
+    return profiles
+
+def save_profile(profile, notes=None):
+    profiles_path = get_profiles_path()
+    try:
+        with open(profiles_path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+
+    saved[profile.name] = {**profile.to_dict(), **(notes or {})}
+    temp_path = profiles_path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(saved, f, indent=1)
+    os.replace(temp_path, profiles_path)
+
+def get_encoding_profiles():
+    profiles = {name: EncodingProfile(name, **settings) for name, settings in ENCODING_PROFILES.items()}
+    profiles.update(load_saved_profiles())
+    return profiles
+
+def get_encoding_profile(name):
+    if isinstance(name, EncodingProfile):
+        return name
+    profiles = get_encoding_profiles()
+    if name not in profiles:
+        raise ValueError(f"Unknown encoding profile: {name} (choose from {', '.join(profiles)})")
+    return profiles[name]
+
+class Rendition:
+    """Extra output of a render: the video at another height with its own profile, or the audio alone."""
+
+    def __init__(self, name, height=None, profile=None):
+        self.name = name
+        self.height = height
+        self.profile = profile
+
+    def get_output_path(self, output_path):
+        stem, extension = os.path.splitext(output_path)
+        if self.height is None:
+            return f"{stem}.m4a"
+        return f"{stem}-{self.name}{extension}"
+
+def parse_rendition(spec, default_profile):
+    """Rendition from a spec such as 1080p, 480p:draft or audio."""
+    name, _, profile_name = spec.strip().lower().partition(":")
+    if name == "audio":
+        return Rendition("audio")
+
+    match = re.fullmatch(r"(\d+)p", name)
+    if not match or int(match.group(1)) % 2:
+        raise ValueError(f"Unknown rendition {spec}, use an even height such as 1080p, or audio")
+    profile = get_encoding_profile(profile_name) if profile_name else get_encoding_profile(default_profile)
+    return Rendition(name, int(match.group(1)), profile)
+
+def escape_tee_path(path):
+    # The tee muxer splits on | and reads quotes and backslashes as escapes
+    return re.sub(r"([\\'|])", r"\\\1", path)
+
+def check_output_profile(info, frame_rate):
+    """Reasons a clip cannot be copied into the output timeline as it is, empty when it can."""
+    reasons = []
+    if info["video_codec"] != TARGET_VIDEO_CODEC:
+        reasons.append(f"codec {info['video_codec']}, output is {TARGET_VIDEO_CODEC}")
+    if info["height"] != TARGET_HEIGHT:
+        reasons.append(f"height {info['height']}, output is {TARGET_HEIGHT}")
+    if info["pix_fmt"] != TARGET_PIX_FMT:
+        reasons.append(f"pixel format {info['pix_fmt']}, output is {TARGET_PIX_FMT}")
+    if info["frame_rate"] != frame_rate:
+        reasons.append(f"frame rate {info['frame_rate']} fps, timeline is {frame_rate} fps")
+    if info["variable_frame_rate"]:
+        reasons.append("variable frame rate")
+    if info["interlaced"]:
+        reasons.append("interlaced")
+    return reasons
+
+class PassthroughPlan:
+    """Decides for every source clip whether it is stream-copied or re-encoded, and records why."""
+
+    def __init__(self, video_paths, infos, frame_rate):
+        self.video_paths = video_paths
+        self.infos = infos
+        self.frame_rate = frame_rate
+        self.reasons = [check_output_profile(info, frame_rate) for info in infos]
+        self.copy = [not reasons for reasons in self.reasons]
+        # Encoder settings that make a re-encoded clip joinable to the copied one
+        self.match = None
+
+        # Copied clips are joined by the concat demuxer, which needs identical stream parameters
+        if len(infos) > 1 and all(self.copy):
+            differences = [self.describe_difference(field, label, infos[0][field], infos[1][field])
+                           for field, label in PASSTHROUGH_MATCH_FIELDS if infos[0][field] != infos[1][field]]
+            if differences:
+                # Keep the longer clip as it is, the shorter one is cheaper to re-encode
+                keep = 0 if (infos[0]["duration"] or 0) > (infos[1]["duration"] or 0) else 1
+                self.copy[1 - keep] = False
+                self.reasons[1 - keep] = [f"differs from {os.path.basename(video_paths[keep])} in " + ", ".join(differences)]
+
+        if any(self.copy) and not all(self.copy):
+            source = infos[self.copy.index(True)]
+            profile = X264_PROFILES.get(source["video_profile"])
+            if profile is None or not source["video_level"]:
+                # libx264 cannot produce a stream that joins this clip, so nothing is copied
+                for index in range(len(self.copy)):
+                    if self.copy[index]:
+                        self.copy[index] = False
+                        self.reasons[index] = [f"profile {source['video_profile']} cannot be matched by the encoder"]
+            else:
+                self.match = {"profile": profile, "level": f"{source['video_level'] / 10:g}"}
+
+    def describe_difference(self, field, label, first, second):
+        if field == "extradata_hash":
+            return label
+        if field == "video_level" and first and second:
+            return f"{label} {first / 10:g} vs {second / 10:g}"
+        return f"{label} {first} vs {second}"
+
+    def describe(self):
+        """One line per clip with the chosen path and the reason for it."""
+        lines = []
+        for path, info, copy, reasons in zip(self.video_paths, self.infos, self.copy, self.reasons):
+            name = os.path.basename(path)
+            if copy:
+                line = (f"{name}: copied, {info['video_codec']} {info['video_profile']} {info['width']}x{info['height']} "
+                        f"{info['pix_fmt']} {info['frame_rate']} fps matches the output")
+                if info["time_base"] != f"1/{TILE_TIMESCALE}":
+                    line += f", time base {info['time_base']} rewritten to 1/{TILE_TIMESCALE}"
+            else:
+                line = f"{name}: re-encoded, " + "; ".join(reasons)
+                if self.match:
+                    line += f", as {self.match['profile']} level {self.match['level']} to join the copied clip"
+            lines.append(line)
+        return lines
+
+class AudioSource:
+    """Audio input of the final mux, a merged file on disk or a stream piped in by a producer process."""
+
+    def __init__(self, duration, input_args, codec_args, producer_cmd=None, producer_log=None):
+        self.duration = duration
+        self.input_args = input_args
+        self.codec_args = codec_args
+        self.producer_cmd = producer_cmd
+        self.producer_log = producer_log
+
+class Renderer:
+    """Runs the whole render pipeline for one book, reporting progress through callbacks."""
+
+    def __init__(self, video_paths, audio_paths, output_path, render_mode="loop_tile",
+                 on_progress=None, on_event=None, scratch_root=None, audio_mode="cached", trace_path=None,
+                 on_message=None, profile=DEFAULT_PROFILE, resume=True, renditions=(), output_format="mp4",
+                 history_path=None):
+        if output_format == "hls" and renditions:
+            raise ValueError("HLS output cannot be combined with renditions")
+        self.video_paths = video_paths
+        self.audio_paths = audio_paths
+        self.output_format = output_format
+        self.output_path = get_final_output_path(output_path, output_format)
+        # A playlist is readable while it grows, so HLS is written in place
+        self.partial_path = self.output_path if output_format == "hls" else get_partial_path(self.output_path)
+        self.resume = resume
+        self.renditions = list(renditions)
+        self.render_mode = render_mode
+        self.audio_mode = audio_mode
+        self.profile = get_encoding_profile(profile)
+        self.audio_duration = None
+        self.trace = RenderTrace()
+        self.trace_path = trace_path
+        # The planner estimates from this file, None means the shared history in the cache directory
+        self.history_path = history_path
+        self.scratch_root = scratch_root or get_scratch_root()
+        self.scratch_dir = None
+        self.artifact_cache = get_artifact_cache()
+        self.is_cancelled = False
+        self.sleep_inhibitor = SleepInhibitor()
+        # Written to on cancel, every ffmpeg loop selects on it and wakes up at once
+        self.wakeup_fds = None
+        self.wakeup_lock = threading.Lock()
+        self.worker_error = None
+        self.progress_lock = threading.Lock()
+        self.last_percent = None
+        self.last_event_time = 0
+        self.on_progress = on_progress
+        self.on_event = on_event
+        self.on_message = on_message
+
+    def run(self):
+        """Render the book. Returns False if cancelled, raises if ffmpeg fails."""
+        return self.run_pipeline(self.run_stages)
+
+    def run_preview(self, window_seconds=PREVIEW_WINDOW_SECONDS):
+        """Render a short low resolution clip of the intro to body cut and of the middle of the book."""
+        self.render_mode = "preview"
+        self.renditions = []
+        return self.run_pipeline(lambda: self.run_preview_stages(window_seconds))
+
+    def run_pipeline(self, run_stages):
+        # Every render gets its own scratch directory so concurrent jobs never share temp files
+        self.scratch_dir = tempfile.mkdtemp(prefix="videothing-", dir=self.scratch_root)
+        self.trace.metadata.update({
+            "output": os.path.basename(self.output_path),
+            "render_mode": self.render_mode,
+            "audio_mode": self.audio_mode,
+            "profile": self.profile.name,
+            "chapters": len(self.audio_paths),
+            "renditions": [rendition.name for rendition in self.renditions],
+            "output_format": self.output_format,
+            "loudness": self.profile.loudness,
+        })
+        completed = False
+
+        with self.wakeup_lock:
+            self.wakeup_fds = os.pipe()
+            if self.is_cancelled:
+                os.write(self.wakeup_fds[1], b"x")
+
+        try:
+            self.sleep_inhibitor.start()
+            completed = run_stages()
+            if completed:
+                # Only a finished render ever appears under the output name
+                for partial_path, output_path in self.get_outputs():
+                    os.replace(partial_path, output_path)
+                # Size per second of audio, what the planner predicts the next output size from
+                output_files = get_hls_files(self.output_path) if self.output_format == "hls" else \
+                    [output_path for _, output_path in self.get_outputs()]
+                self.trace.metadata["output_bytes"] = sum(os.path.getsize(path) for path in output_files)
+            return completed
+
+        finally:
+            # Cleanup
+            with self.trace.stage("cleanup"):
+                shutil.rmtree(self.scratch_dir, ignore_errors=True)
+                # Streaming outputs are valid up to their last fragment, an aborted render keeps what it wrote
+                if self.output_format == "mp4":
+                    for partial_path, _ in self.get_outputs():
+                        if os.path.exists(partial_path):
+                            os.remove(partial_path)
+
+            # Allow the system to sleep again
+            self.sleep_inhibitor.stop()
+
+            with self.wakeup_lock:
+                for fd in self.wakeup_fds:
+                    os.close(fd)
+                self.wakeup_fds = None
+
+            self.finish_trace(completed)
+
+    def run_stages(self):
+        self.report_progress(1)
+        if self.is_cancelled:
+            return False
+
+        with self.trace.stage("probe"):
+            self.probe_inputs()
+
+        if self.is_cancelled:
+            return False
+
+        # Step 1: Merge audio files, or set up the stream that feeds the final mux
+        with self.trace.stage("audio", self.audio_duration):
+            audio = self.prepare_audio()
+        self.report_progress(10)
+
+        if self.is_cancelled:
+            return False
+
+        # Step 2: Create final video
+        with self.trace.stage("video", self.audio_duration):
+            if self.renditions:
+                self.create_rendition_videos(audio)
+            elif self.render_mode == "loop_tile":
+                self.create_tiled_video(audio)
+            elif self.render_mode == "parallel":
+                self.create_parallel_video(audio)
+            else:
+                self.create_final_video(audio)
+
+        if self.is_cancelled:
+            return False
+
+        self.report_progress(100)
+        return True
+
+    def run_preview_stages(self, window_seconds):
+        self.report_progress(1)
+        with self.trace.stage("probe"):
+            self.probe_inputs()
+
+        if self.is_cancelled:
+            return False
+
+        windows = self.plan_preview_windows(window_seconds)
+        loudness_infos = None
+        if self.profile.loudness is not None:
+            # Only the chapters the windows play from are measured
+            indexes = sorted({index for start, length in windows for index, _ in self.get_chapters_between(start, start + length)})
+            loudness_infos = self.measure_chapters(indexes, 1, 5)
+            if self.should_stop():
+                return False
+
+        preview_duration = sum(length for _, length in windows)
+        with self.trace.stage("preview", preview_duration):
+            part_paths = [self.get_temp_path(f"preview_{index}.mp4") for index in range(len(windows))]
+            aggregator = ProgressAggregator(preview_duration, lambda event: self.report_stage(event, 5, 95))
+
+            def encode(index):
+                start, length = windows[index]
+                self.run_ffmpeg(self.build_preview_command(start, length, part_paths[index], loudness_infos), length,
+                                on_progress=lambda event: aggregator.update(index, event))
+
+            self.run_pool(encode, range(len(windows)))
+
+            if self.should_stop():
+                return False
+
+            # Both parts come from the same encoder settings, so they join by stream copy
+            parts_path = self.get_temp_path("preview.txt")
+            with open(parts_path, "w") as f:
+                f.write("ffconcat version 1.0\n")
+                for part_path in part_paths:
+                    f.write(f"file '{self.escape_concat_path(part_path)}'\n")
+
+            cmd = [
+                self.get_ffmpeg_path(),
+                "-f", "concat",
+                "-safe", "0",
+                "-i", parts_path,
+                "-c", "copy",
+                "-y",
+                self.partial_path
+            ]
+            self.run_ffmpeg(cmd, preview_duration, progress_start=95)
+
+        if self.is_cancelled:
+            return False
+
+        self.report_progress(100)
+        return True
+
+    def plan_preview_windows(self, window_seconds):
+        """Timeline ranges (start, length) around the intro to body cut and in the middle of the audio."""
+        intro_duration = self.get_video_duration(self.video_paths[0])
+        half = window_seconds / 2
+        windows = [(max(0, intro_duration - half), window_seconds),
+                   (max(0, self.audio_duration / 2 - half), window_seconds)]
+
+        # Clip to the audio, and merge the two when a short book makes them touch
+        clipped = []
+        for start, length in windows:
+            length = min(length, self.audio_duration - start)
+            if length <= 0:
+                continue
+            if clipped and start <= clipped[-1][0] + clipped[-1][1]:
+                previous_start, previous_length = clipped.pop()
+                length = max(previous_start + previous_length, start + length) - previous_start
+                start = previous_start
+            clipped.append((start, length))
+        return clipped
+
+    def build_preview_command(self, start, length, part_path, loudness_infos=None):
+        frame_rate = self.get_timeline_frame_rate()
+        intro_duration = self.get_video_duration(self.video_paths[0])
+        body_duration = self.get_video_duration(self.get_body_path())
+        # Straight to the preview size, and no deblocking, decoding the sources is most of the cost
+        video_args = self.get_timeline_video_args(start, intro_duration, body_duration, frame_rate,
+                                                  f"scale=-2:{PREVIEW_HEIGHT}:flags=fast_bilinear",
+                                                  ["-skip_loop_filter", "all"])
+        audio_input = video_args.count("-i")
+        if loudness_infos:
+            audio_args = self.get_normalized_audio_args(audio_input, loudness_infos, start, length)
+            audio_map = "[a]"
+        else:
+            # The chapters are seeked as one timeline, the same way the final render lays them out
+            audio_args = ["-ss", f"{start:.6f}", "-f", "concat", "-safe", "0", "-i", self.write_chapter_list()]
+            audio_map = f"{audio_input}:a:0"
+
+        return [
+            self.get_ffmpeg_path(),
+            *video_args,
+            *audio_args,
+            "-map", "[v]",
+            "-map", audio_map,
+            "-t", f"{length:.6f}",
+            "-c:v", "libx264",
+            "-preset", "ultrafast",
+            "-crf", "28",
+            "-ar", str(AUDIO_SAMPLE_RATE),
+            "-ac", str(AUDIO_CHANNELS),
+            "-c:a", "aac",
+            "-b:a", "96k",
+            "-video_track_timescale", str(TILE_TIMESCALE),
+            "-y",
+            part_path
+        ]
+
+    def write_chapter_list(self):
+        """Concat demuxer list of the original chapters, in playing order."""
+        files_path = self.get_temp_path("chapters.txt")
+        with open(files_path, "w") as f:
+            for audio_path in self.audio_paths:
+                f.write(f"file '{self.escape_concat_path(audio_path)}'\n")
+        return files_path
+
+    def probe_inputs(self):
+        """Probe every input up front, mostly answered by the media info cache."""
+        for video_path in self.video_paths:
+            self.get_media_info(video_path)
+        self.audio_duration = sum(self.get_video_duration(audio_path) for audio_path in self.audio_paths)
+        self.trace.metadata["audio_duration"] = self.audio_duration
+
+    def finish_trace(self, completed):
+        self.trace.metadata["result"] = "done" if completed else "cancelled" if self.is_cancelled else "failed"
+        summary = self.trace.summary()
+        if debug:
+            print(json.dumps(summary, indent=1))
+
+        # A trace that cannot be written must not fail the render itself
+        try:
+            if self.trace_path:
+                self.trace.save(self.trace_path)
+            append_history(summary, self.history_path)
+        except OSError as e:
+            if debug:
+                print(f"Could not write render trace: {e}")
+
+    def get_outputs(self):
+        """(partial path, output path) of the main output and every rendition."""
+        outputs = [(self.partial_path, self.output_path)]
+        for rendition in self.renditions:
+            output_path = rendition.get_output_path(self.output_path)
+            outputs.append((get_partial_path(output_path), output_path))
+        return outputs
+
+    def get_muxer_args(self, duration):
+        """Options ending the final mux at the audio's end, plus those of the output format."""
+        # -shortest does not cut HLS output of copied tiles whose timestamps start below zero, and it truncates
+        # the audio there, the known length works for both
+        length_args = ["-t", f"{duration:.3f}"] if self.output_format == "hls" else ["-shortest"]
+        return length_args + get_muxer_args(self.partial_path, self.output_format)
+
+    def get_temp_path(self, relative_path=''):
+        return os.path.join(self.scratch_dir, relative_path)
+
+    def prepare_audio(self):
+        if self.audio_mode == "stream":
+            return self.stream_audio_files()
+
+        merged_audio = self.get_temp_path("merged_audio.m4a")
+        self.merge_audio_files(merged_audio)
+        if self.should_stop():
+            # Cancelled mid-merge, there is no merged file to describe
+            return None
+        return AudioSource(self.get_video_duration(merged_audio), ["-i", merged_audio], ["-c:a", "copy"])
+
+    def stream_audio_files(self):
+        """Describe a producer that decodes the chapters to raw PCM while the final mux encodes them."""
+        # Nothing is merged up front, so the total comes from the chapters' cached probes
+        duration = self.audio_duration
+
+        if self.profile.loudness is not None:
+            # Corrections differ per chapter, so they are decoded as separate inputs and joined after the filters
+            infos = self.measure_chapters(range(len(self.audio_paths)), 1, 10)
+            if self.should_stop():
+                return None
+            source_args = self.get_normalized_audio_args(0, infos) + ["-map", "[a]"]
+        else:
+            source_args = ["-f", "concat", "-safe", "0", "-i", self.write_chapter_list(), "-map", "0:a:0"]
+
+        # Chapters may differ in rate and layout, the resampler evens them out on the fly
+        producer_cmd = [
+            self.get_ffmpeg_path(),
+            "-hide_banner",
+            "-nostats",
+            "-loglevel", "error",
+            *source_args,
+            "-vn",
+            "-ar", str(AUDIO_SAMPLE_RATE),
+            "-ac", str(AUDIO_CHANNELS),
+            "-f", "s16le",
+            "pipe:1"
+        ]
+
+        # Raw samples carry exact timestamps, a piped ADTS stream throws off -shortest
+        input_args = ["-f", "s16le", "-ar", str(AUDIO_SAMPLE_RATE), "-ac", str(AUDIO_CHANNELS), "-i", "pipe:0"]
+        return AudioSource(duration, input_args, self.profile.get_audio_args(), producer_cmd,
+                           self.get_temp_path("audio_stream.log"))
+
+    def merge_audio_files(self, output_audio):
+        """Transcode every chapter to AAC in parallel, then join the parts by stream copy."""
+        # The whole merged track is reused when no chapter changed
+        self.cached_artifact("merged_audio", self.audio_paths, self.get_audio_params(), output_audio,
+                             lambda: self.build_merged_audio(output_audio))
+
+    def build_merged_audio(self, output_audio):
+        part_paths = []
+        for index in range(len(self.audio_paths)):
+            part_path = self.get_temp_path(f"audio_part_{index:04d}.m4a")
+            part_paths.append(part_path)
+
+        # Progress is measured against the summed chapter lengths, read twice when they are measured first
+        durations = [self.get_video_duration(audio_path) for audio_path in self.audio_paths]
+        passes = 1 if self.profile.loudness is None else 2
+        aggregator = ProgressAggregator(passes * sum(durations), lambda event: self.report_stage(event, 1, 9))
+
+        def build(index):
+            audio_filter = None
+            if self.profile.loudness is not None:
+                info = self.measure_loudness(index, lambda event: aggregator.update((index, "loudness"), event))
+                if info is None:
+                    return
+                audio_filter = self.profile.get_loudness_filter(info)
+            self.transcode_audio(self.audio_paths[index], part_paths[index], durations[index],
+                                 lambda event: aggregator.update(index, event), audio_filter)
+
+        def transcode(index):
+            # Only chapters that changed since an earlier render get measured and transcoded again
+            self.cached_artifact("audio_part", [self.audio_paths[index]], self.get_audio_params(), part_paths[index],
+                                 lambda: build(index))
+            done = ProgressEvent(out_time=durations[index], total=durations[index], done=True)
+            aggregator.update(index, done)
+            if passes > 1:
+                aggregator.update((index, "loudness"), done)
+
+        self.run_pool(transcode, range(len(part_paths)))
+
+        if self.should_stop():
+            return
+
+        files_path = self.get_temp_path('files.txt')
+        with open(files_path, "w") as f:
+            for part_path in part_paths:
+                f.write(f"file '{self.escape_concat_path(part_path)}'\n")
+
+        cmd = [
+            self.get_ffmpeg_path(),
+            "-f", "concat",
+            "-safe", "0",
+            "-i", files_path,
+            "-c", "copy",
+            "-y",
+            output_audio
+        ]
+
+        self.run_ffmpeg(cmd, progress_start=9, progress_end=10)
+
+    def get_audio_params(self):
+        return {"codec": "aac", "sample_rate": AUDIO_SAMPLE_RATE, "channels": AUDIO_CHANNELS,
+                "bitrate": self.profile.audio_bitrate, "loudness": self.profile.loudness}
+
+    def transcode_audio(self, audio_path, part_path, duration=None, on_progress=None, audio_filter=None):
+        # Resample per file, mismatched rates or layouts would break the copy concat otherwise
+        cmd = [
+            self.get_ffmpeg_path(),
+            "-i", audio_path,
+            "-map", "0:a:0",
+            "-vn",
+            *(["-af", audio_filter] if audio_filter else []),
+            "-ar", str(AUDIO_SAMPLE_RATE),
+            "-ac", str(AUDIO_CHANNELS),
+            *self.profile.get_audio_args(),
+            "-threads", "1",
+            "-y",
+            part_path
+        ]
+
+        self.run_ffmpeg(cmd, duration, on_progress=on_progress)
+
+    def measure_loudness(self, index, on_progress=None):
+        """First loudnorm pass over a chapter, answered from the cache when the same contents were measured."""
+        audio_path = self.audio_paths[index]
+        media_info_cache = get_media_info_cache()
+        content_hash = media_info_cache.get_content_hash(audio_path)
+        info = media_info_cache.get_loudness(content_hash)
+        if info is not None:
+            return info
+
+        cmd = [
+            self.get_ffmpeg_path(),
+            "-i", audio_path,
+            "-map", "0:a:0",
+            "-vn",
+            "-af", "loudnorm=print_format=json",
+            "-threads", "1",
+            "-f", "null",
+            "-"
+        ]
+        stderr_lines = self.run_ffmpeg(cmd, self.get_video_duration(audio_path), on_progress=on_progress)
+        if self.should_stop():
+            return None
+
+        info = parse_loudness(stderr_lines)
+        media_info_cache.put_loudness(content_hash, info)
+        return info
+
+    def measure_chapters(self, indexes, progress_start, progress_end):
+        """Measure chapters in parallel, for the audio paths that decode several chapters in one ffmpeg."""
+        durations = {index: self.get_video_duration(self.audio_paths[index]) for index in indexes}
+        aggregator = ProgressAggregator(sum(durations.values()),
+                                        lambda event: self.report_stage(event, progress_start, progress_end))
+        infos = {}
+
+        def measure(index):
+            infos[index] = self.measure_loudness(index, lambda event: aggregator.update(index, event))
+
+        self.run_pool(measure, indexes)
+        return infos
+
+    def get_chapters_between(self, start, end):
+        """(index, timeline offset) of every chapter playing between start and end."""
+        chapters = []
+        offset = 0.0
+        for index, audio_path in enumerate(self.audio_paths):
+            duration = self.get_video_duration(audio_path)
+            if offset < end and offset + duration > start:
+                chapters.append((index, offset))
+            offset += duration
+        return chapters
+
+    def get_normalized_audio_args(self, first_input, infos, start=0.0, length=None):
+        """Inputs and filter graph playing the chapters from start with their loudness corrected, labelled [a]."""
+        end = self.audio_duration if length is None else start + length
+        input_args = []
+        filters = []
+        labels = []
+        for index, offset in self.get_chapters_between(start, end):
+            if start > offset:
+                input_args += ["-ss", f"{start - offset:.6f}"]
+            input_args += ["-i", self.audio_paths[index]]
+
+            # Each chapter is brought to the output layout on its own, concat needs them all alike
+            chain = [f"aresample={AUDIO_SAMPLE_RATE}",
+                     f"aformat=sample_rates={AUDIO_SAMPLE_RATE}:channel_layouts={AUDIO_CHANNELS}c"]
+            loudness_filter = self.profile.get_loudness_filter(infos[index])
+            if loudness_filter:
+                chain.insert(0, loudness_filter)
+            label = f"[a{len(labels)}]"
+            filters.append(f"[{first_input + len(labels)}:a:0]{','.join(chain)}{label}")
+            labels.append(label)
+
+        filters.append(f"{''.join(labels)}concat=n={len(labels)}:v=0:a=1[a]")
+        return input_args + ["-filter_complex", ";".join(filters)]
+
+    def cached_artifact(self, kind, input_paths, params, destination, build):
+        """Fill destination from the artifact cache, or build it and store the result."""
+        if self.artifact_cache is None:
+            build()
+            return
+
+        input_hashes = [get_media_info_cache().get_content_hash(path) for path in input_paths]
+        key = self.artifact_cache.make_key(kind, input_hashes, params)
+        if self.artifact_cache.fetch(key, destination):
+            if debug:
+                print(f"Reusing cached {kind} {key}")
+            return
+
+        build()
+        if not self.should_stop():
+            self.artifact_cache.store(key, destination)
+
+    def run_pool(self, task, items, num_workers=None):
+        """Run task for every item on a pool of worker threads, each driving its own ffmpeg process."""
+        if num_workers is None:
+            num_workers = self.get_cpu_count()
+
+        def guarded(item):
+            try:
+                task(item)
+            except Exception as e:
+                # Stop the remaining work, there is no point finishing it
+                self.worker_error = self.worker_error or e
+
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            try:
+                list(executor.map(guarded, items))
+            except BaseException:
+                # Interrupted while waiting, the pool only shuts down once its ffmpeg processes are stopped
+                self.cancel()
+                raise
+
+        if self.worker_error:
+            raise self.worker_error
+
+    def get_cpu_count(self):
+        # os.cpu_count() is None when the count cannot be determined
+        return os.cpu_count() or 2
+
+    def escape_concat_path(self, path):
+        # The concat demuxer reads single-quoted paths, so quotes inside need escaping
+        return path.replace("'", "'\\''")
+
+    def create_final_video(self, audio):
+        # A single encoder is left to pick its own thread count, x264 already uses every core
+        ffmpeg_path = self.get_ffmpeg_path()
+
+        # Only a profile with a frame rate cap changes the rate the concat filter puts out
+        frame_rate = self.get_timeline_frame_rate()
+        rate_filter = f",fps={frame_rate}" if frame_rate != self.get_frame_rate(self.video_paths[0]) else ""
+
+        cmd = [
+            ffmpeg_path,
+            "-i", self.video_paths[0],  # Intro video (plays once)
+            "-stream_loop", "-1",
+            "-i", self.get_body_path(),  # Main body or repeat intro
+            *audio.input_args,
+            "-filter_complex",
+            f"[0:v]{VIDEO_FILTER}[v0];[1:v]{VIDEO_FILTER}[v1];[v0][v1]concat=n=2:v=1:a=0{rate_filter}[v]",
+            "-map", "[v]",
+            "-map", "2:a",
+            *self.profile.get_video_args(frame_rate),
+            *audio.codec_args,
+            *self.get_muxer_args(audio.duration),
+            "-y",
+            self.partial_path
+        ]
+
+        self.run_ffmpeg(cmd, audio.duration, progress_start=10, audio=audio)
+
+    def create_rendition_videos(self, audio):
+        """Decode the inputs once, split the video to every rendition and share one audio encode through tee."""
+        if self.render_mode != "standard":
+            self.report_message(f"Renditions are rendered in a single split pass, {RENDER_MODES[self.render_mode]} is not used")
+
+        source_rate = self.get_frame_rate(self.video_paths[0])
+        outputs = [(TARGET_HEIGHT, self.profile, self.partial_path)]
+        outputs += [(rendition.height, rendition.profile, get_partial_path(rendition.get_output_path(self.output_path)))
+                    for rendition in self.renditions if rendition.height]
+
+        # Inputs meet at the largest height, every branch scales down from there
+        top_height = max(height for height, _, _ in outputs)
+        graph = [f"[0:v]scale=-2:{top_height}[v0];[1:v]scale=-2:{top_height}[v1];"
+                 f"[v0][v1]concat=n=2:v=1:a=0,split={len(outputs)}" + "".join(f"[s{i}]" for i in range(len(outputs)))]
+        video_args = []
+        for index, (height, profile, _) in enumerate(outputs):
+            frame_rate = profile.get_frame_rate(source_rate)
+            graph.append(f"[s{index}]scale=-2:{height},fps={frame_rate},format={TARGET_PIX_FMT}[o{index}]")
+            video_args += ["-map", f"[o{index}]", *profile.get_video_args(frame_rate, stream=index)]
+
+        # Each file picks its video stream and the one shared audio stream
+        video_options = audio_options = ""
+        if self.output_format == "fragmented":
+            # Audio alone has no keyframes to cut at, its fragments are cut by length
+            video_options = (":movflags=+frag_keyframe+empty_moov+default_base_moof"
+                             f":min_frag_duration={FRAGMENT_SECONDS * 1000000}:flush_packets=1")
+            audio_options = f":movflags=+empty_moov+default_base_moof:frag_duration={FRAGMENT_SECONDS * 1000000}:flush_packets=1"
+        slaves = [f"[select=\\'v:{index},a\\':f=mp4{video_options}]{escape_tee_path(path)}"
+                  for index, (_, _, path) in enumerate(outputs)]
+        slaves += [f"[select=a:f=ipod{audio_options}]{escape_tee_path(get_partial_path(rendition.get_output_path(self.output_path)))}"
+                   for rendition in self.renditions if rendition.height is None]
+
+        cmd = [
+            self.get_ffmpeg_path(),
+            "-i", self.video_paths[0],
+            "-stream_loop", "-1",
+            "-i", self.get_body_path(),
+            *audio.input_args,
+            "-filter_complex", ";".join(graph),
+            *video_args,
+            "-map", "2:a",
+            *audio.codec_args,
+            # tee does not ask encoders for global headers, and a fragmented MP4 writes its moov before the first frame
+            "-flags", "+global_header",
+            "-shortest",
+            "-f", "tee",
+            "-y",
+            "|".join(slaves)
+        ]
+
+        self.run_ffmpeg(cmd, audio.duration, progress_start=10, audio=audio)
+
+    def create_tiled_video(self, audio):
+        """Encode the intro and one pass of the body, then stream-copy the body for the whole audio."""
+        duration = audio.duration
+
+        # Both tiles share the intro's frame rate, just like the concat filter output does
+        frame_rate = self.get_timeline_frame_rate()
+        plan = self.analyze_video(frame_rate)
+
+        intro_tile = self.get_temp_path("intro_tile.mp4")
+        self.make_tile(plan, 0, intro_tile)
+        self.report_progress(12)
+
+        if self.is_cancelled:
+            return
+
+        # With a single video the intro doubles as the looping body
+        if len(self.video_paths) > 1:
+            body_tile = self.get_temp_path("body_tile.mp4")
+            self.make_tile(plan, 1, body_tile)
+        else:
+            body_tile = intro_tile
+        self.report_progress(15)
+
+        if self.is_cancelled:
+            return
+
+        # The concat demuxer can only copy tiles whose streams are identical
+        if self.get_frame_size(intro_tile) != self.get_frame_size(body_tile):
+            if debug:
+                print("Tile sizes differ, falling back to standard render")
+            self.create_final_video(audio)
+            return
+
+        intro_duration = self.get_video_duration(intro_tile)
+        body_duration = self.get_video_duration(body_tile)
+        repeats = max(1, math.ceil(max(0, duration - intro_duration) / body_duration) + 1)
+
+        tiles_path = self.get_temp_path("tiles.txt")
+        with open(tiles_path, "w") as f:
+            f.write("ffconcat version 1.0\n")
+            f.write(f"file '{self.escape_concat_path(intro_tile)}'\n")
+            for _ in range(repeats):
+                f.write(f"file '{self.escape_concat_path(body_tile)}'\n")
+
+        cmd = [
+            self.get_ffmpeg_path(),
+            "-f", "concat",
+            "-safe", "0",
+            "-i", tiles_path,
+            *audio.input_args,
+            "-map", "0:v",
+            "-map", "1:a",
+            "-c:v", "copy",
+            *audio.codec_args,
+            *self.get_muxer_args(duration),
+            "-y",
+            self.partial_path
+        ]
+
+        self.run_ffmpeg(cmd, duration, progress_start=15, audio=audio)
+
+    def create_parallel_video(self, audio):
+        """Split the output timeline into ranges, encode them side by side and join them losslessly."""
+        duration = audio.duration
+        frame_rate = self.get_timeline_frame_rate()
+        intro_duration = self.get_video_duration(self.video_paths[0])
+        body_duration = self.get_video_duration(self.get_body_path())
+
+        # One single threaded ffmpeg process per core keeps every core busy without oversubscribing them
+        num_workers = self.get_cpu_count()
+
+        # The plan must not depend on the machine, a restart elsewhere has to find the same segments
+        segment_count = max(PARALLEL_MIN_SEGMENTS, math.ceil(duration / RESUME_SEGMENT_SECONDS))
+        segments = self.plan_segments(duration, segment_count, frame_rate)
+        manifest = RenderManifest(get_parts_dir(self.output_path), self.get_resume_key(segments, frame_rate),
+                                  segments, frame_rate)
+        if manifest.load(self.resume):
+            self.report_message(f"Resuming: {len(manifest.done)} of {len(segments)} segments already rendered")
+
+        # Roll the progress of every segment up into the single progress signal
+        aggregator = ProgressAggregator(duration, lambda event: self.report_stage(event, 15, 90))
+        for index in manifest.done:
+            aggregator.update(index, ProgressEvent(out_time=segments[index][1], total=segments[index][1], done=True))
+
+        def encode(index):
+            start, length = segments[index]
+            cmd = self.build_segment_command(start, length, intro_duration, body_duration,
+                                             frame_rate, manifest.get_temp_segment_path(index))
+            self.run_ffmpeg(cmd, length, on_progress=lambda event: aggregator.update(index, event))
+
+            # A stopped ffmpeg leaves a cut off file, only a whole segment goes into the manifest
+            if not self.should_stop():
+                manifest.complete(index)
+
+        pending = [index for index in range(len(segments)) if index not in manifest.done]
+        self.run_pool(encode, pending, num_workers)
+
+        if self.should_stop():
+            return
+
+        segments_path = self.get_temp_path("segments.txt")
+        with open(segments_path, "w") as f:
+            f.write("ffconcat version 1.0\n")
+            for index in range(len(segments)):
+                f.write(f"file '{self.escape_concat_path(manifest.get_segment_path(index))}'\n")
+
+        cmd = [
+            self.get_ffmpeg_path(),
+            "-f", "concat",
+            "-safe", "0",
+            "-i", segments_path,
+            *audio.input_args,
+            "-map", "0:v",
+            "-map", "1:a",
+            "-c:v", "copy",
+            *audio.codec_args,
+            *self.get_muxer_args(duration),
+            "-y",
+            self.partial_path
+        ]
+
+        self.run_ffmpeg(cmd, duration, progress_start=90, audio=audio)
+
+        if not self.should_stop():
+            manifest.remove()
+
+    def get_resume_key(self, segments, frame_rate):
+        """Identity of a parallel render, segments of another attempt are only reused when it matches."""
+        import hashlib
+        input_hashes = [get_media_info_cache().get_content_hash(path) for path in (self.video_paths[0], self.get_body_path())]
+        description = json.dumps({
+            "inputs": input_hashes,
+            "segments": segments,
+            "params": self.get_tile_params(frame_rate),
+        }, sort_keys=True)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def plan_segments(self, duration, count, frame_rate):
+        # Boundaries land on whole frames so the joined segments keep a constant frame rate
+        total_frames = max(1, math.ceil(duration * frame_rate))
+        count = max(1, min(count, total_frames))
+        boundaries = [round(total_frames * i / count) for i in range(count + 1)]
+        return [(boundaries[i] / frame_rate, (boundaries[i + 1] - boundaries[i]) / frame_rate)
+                for i in range(count)]
+
+    def build_segment_command(self, start, length, intro_duration, body_duration, frame_rate, segment_path):
+        return [
+            self.get_ffmpeg_path(),
+            *self.get_timeline_video_args(start, intro_duration, body_duration, frame_rate),
+            "-map", "[v]",
+            "-an",
+            "-t", f"{length:.6f}",
+            *self.profile.get_video_args(frame_rate),
+            "-threads", "1",
+            "-video_track_timescale", str(TILE_TIMESCALE),
+            "-y",
+            segment_path
+        ]
+
+    def get_timeline_video_args(self, start, intro_duration, body_duration, frame_rate,
+                                video_filter=VIDEO_FILTER, input_options=()):
+        """Inputs and filter graph producing the output video from start onwards, labelled [v]."""
+        if start < intro_duration:
+            # Segment begins inside the intro and may run on into the body
+            return [
+                *input_options,
+                "-ss", f"{start:.6f}",
+                "-i", self.video_paths[0],
+                *input_options,
+                "-stream_loop", "-1",
+                "-i", self.get_body_path(),
+                "-filter_complex",
+                f"[0:v]{video_filter}[v0];[1:v]{video_filter}[v1];[v0][v1]concat=n=2:v=1:a=0,"
+                f"fps={frame_rate},format={TARGET_PIX_FMT}[v]",
+            ]
+
+        # Seek into the looping body; later loops restart from its beginning
+        offset = (start - intro_duration) % body_duration
+        return [
+            *input_options,
+            "-stream_loop", "-1",
+            "-ss", f"{offset:.6f}",
+            "-i", self.get_body_path(),
+            "-filter_complex",
+            f"[0:v]{video_filter},fps={frame_rate},format={TARGET_PIX_FMT}[v]",
+        ]
+
+    def analyze_video(self, frame_rate):
+        """Check which source clips already match the output and can skip the encode."""
+        video_paths = self.video_paths[:2]
+        plan = PassthroughPlan(video_paths, [self.get_media_info(path) for path in video_paths], frame_rate)
+        self.trace.metadata["video_plan"] = plan.describe()
+        for line in plan.describe():
+            self.report_message(line)
+        return plan
+
+    def make_tile(self, plan, index, tile_path):
+        video_path = plan.video_paths[index]
+        if plan.copy[index]:
+            self.cached_artifact("tile", [video_path], {"copy": True, "timescale": TILE_TIMESCALE}, tile_path,
+                                 lambda: self.remux_tile(video_path, tile_path))
+        else:
+            self.cached_artifact("tile", [video_path], self.get_tile_params(plan.frame_rate, plan.match), tile_path,
+                                 lambda: self.encode_tile(video_path, tile_path, plan.frame_rate, plan.match))
+
+    def get_tile_params(self, frame_rate, match=None):
+        params = {"filter": VIDEO_FILTER, "frame_rate": frame_rate, "codec": "libx264", "pix_fmt": TARGET_PIX_FMT,
+                  **self.profile.get_video_params()}
+        if match:
+            params["match"] = match
+        return params
+
+    def encode_tile(self, video_path, tile_path, frame_rate, match=None):
+        # Fixed GOP, frame rate and pixel format so every tile can be joined without re-encoding
+        cmd = [
+            self.get_ffmpeg_path(),
+            "-i", video_path,
+            "-an",
+            "-vf", f"{VIDEO_FILTER},fps={frame_rate},format={TARGET_PIX_FMT}",
+            *self.profile.get_video_args(frame_rate),
+            "-video_track_timescale", str(TILE_TIMESCALE),
+        ]
+
+        if match:
+            # Parameter sets repeated on every keyframe, the decoder switches over from the copied clip's
+            cmd += ["-profile:v", match["profile"], "-level", match["level"], "-x264-params", "repeat-headers=1"]
+
+        cmd += ["-y", tile_path]
+        self.run_ffmpeg(cmd)
+
+    def remux_tile(self, video_path, tile_path):
+        # Only the container changes; in-band parameter sets let the clip follow a re-encoded one
+        cmd = [
+            self.get_ffmpeg_path(),
+            "-i", video_path,
+            "-map", "0:v:0",
+            "-c:v", "copy",
+            "-bsf:v", "h264_mp4toannexb",
+            "-video_track_timescale", str(TILE_TIMESCALE),
+            "-y",
+            tile_path
+        ]
+
+        self.run_ffmpeg(cmd)
+
+    def run_ffmpeg(self, cmd, duration=None, progress_start=5, progress_end=100, on_progress=None, audio=None):
+        # Machine-readable progress on stdout, stderr is only kept for error messages
+        cmd = [cmd[0], "-hide_banner", "-nostats", "-progress", "pipe:1"] + cmd[1:]
+
+        if debug:
+            print(' '.join(cmd))
+
+        # Wait for a free process slot, shared by every render in this process
+        if not process_slots.acquire(self.should_stop):
+            return
+
+        try:
+            if audio is not None and audio.producer_cmd:
+                return self.run_streamed_ffmpeg(cmd, duration, progress_start, progress_end, audio)
+            return self.run_ffmpeg_process(cmd, duration, progress_start, progress_end, on_progress)
+        finally:
+            process_slots.release()
+
+    def run_streamed_ffmpeg(self, cmd, duration, progress_start, progress_end, audio):
+        """Run the final mux with its audio piped in from the producer, both processes at once."""
+        if debug:
+            print(' '.join(audio.producer_cmd) + " |")
+
+        # The producer rides along in the mux's process slot, it only handles audio
+        with open(audio.producer_log, "wb") as log:
+            producer = subprocess.Popen(audio.producer_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=log,
+                                        **get_process_group_args())
+
+        finished = False
+        try:
+            stderr_lines = self.run_ffmpeg_process(cmd, duration, progress_start, progress_end, None, stdin=producer.stdout)
+            finished = True
+        finally:
+            # Without a reader left the producer stops on a broken pipe
+            producer.stdout.close()
+            if not finished or self.should_stop():
+                stop_process(producer, CANCEL_KILL_GRACE)
+            producer.wait()
+
+        if producer.returncode != 0 and not self.should_stop():
+            with open(audio.producer_log, errors="replace") as log:
+                lines = [line.strip() for line in log if line.strip()]
+            last_line = lines[-1] if lines else f"exit status {producer.returncode}"
+            raise RuntimeError(f"ffmpeg audio stream failed: {last_line}")
+        return stderr_lines
+
+    def run_ffmpeg_process(self, cmd, duration, progress_start, progress_end, on_progress, stdin=subprocess.DEVNULL):
+        """Run ffmpeg until it exits or the render stops, returning the last lines it logged."""
+        process = subprocess.Popen(cmd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   **get_process_group_args())
+        reader = FFmpegProgressReader(duration)
+        stderr_tail = collections.deque(maxlen=20)
+        stderr_buffer = b""
+
+        # Resource usage for the trace, sampled while ffmpeg runs since /proc is gone once it exits
+        started = self.trace.now()
+        last_sample = None
+        peak_rss = 0
+        cpu = None
+        speed = None
+
+        # Last time the output position moved, a process that stops moving is hung
+        position = None
+        last_moved = time.monotonic()
+
+        # Both pipes without blocking, plus the cancel pipe so an abort wakes the loop straight away
+        selector = selectors.DefaultSelector()
+        streams = {process.stdout, process.stderr}
+        for stream in streams:
+            os.set_blocking(stream.fileno(), False)
+            selector.register(stream, selectors.EVENT_READ)
+        wakeup_fd = self.wakeup_fds[0] if self.wakeup_fds else None
+        if wakeup_fd is not None:
+            selector.register(wakeup_fd, selectors.EVENT_READ)
+
+        try:
+            while streams:
+                if self.should_stop():
+                    stop_process(process, CANCEL_KILL_GRACE)
+                    return
+
+                if time.monotonic() - last_moved > PROCESS_STALL_SECONDS:
+                    stop_process(process)
+                    raise RuntimeError(f"ffmpeg stalled, no progress for {PROCESS_STALL_SECONDS} seconds")
+
+                if last_sample is None or time.monotonic() - last_sample >= RESOURCE_SAMPLE_INTERVAL:
+                    last_sample = time.monotonic()
+                    sample = sample_process(process.pid)
+                    if sample:
+                        peak_rss = max(peak_rss, sample[0])
+                        cpu = sample[1]
+
+                for key, _ in selector.select(timeout=RESOURCE_SAMPLE_INTERVAL):
+                    if key.fd == wakeup_fd:
+                        continue
+
+                    try:
+                        data = os.read(key.fd, 65536)
+                    except BlockingIOError:
+                        continue
+
+                    if not data:
+                        selector.unregister(key.fileobj)
+                        streams.discard(key.fileobj)
+                    elif key.fileobj is process.stdout:
+                        for event in reader.feed(data):
+                            speed = event.speed or speed
+                            if (event.frame, event.out_time) != position:
+                                position = (event.frame, event.out_time)
+                                last_moved = time.monotonic()
+                            if on_progress:
+                                on_progress(event)
+                            elif duration:
+                                self.report_stage(event, progress_start, progress_end)
+                    else:
+                        stderr_buffer += data
+                        *lines, stderr_buffer = stderr_buffer.replace(b"\r", b"\n").split(b"\n")
+                        for line in lines:
+                            line = line.decode("utf-8", "replace").strip()
+                            if line:
+                                stderr_tail.append(line)
+                                if debug:
+                                    print(line)
+        finally:
+            selector.close()
+            process.stdout.close()
+            process.stderr.close()
+            # Also reached when the caller is interrupted, no ffmpeg is left running behind it
+            stop_process(process)
+            self.trace.add_process(os.path.basename(cmd[-1]), started, peak_rss, cpu, speed, process.returncode)
+
+        if process.returncode != 0 and not self.should_stop():
+            last_line = stderr_tail[-1] if stderr_tail else f"exit status {process.returncode}"
+            raise RuntimeError(f"ffmpeg failed: {last_line}")
+        return list(stderr_tail)
+
+    def report_stage(self, event, progress_start, progress_end):
+        # Map a stage-local event onto its slice of the overall progress bar
+        percent = progress_start + int(event.fraction * (progress_end - progress_start))
+        self.report_progress(percent, event)
+
+    def report_progress(self, percent, event=None):
+        """Forward progress to the callbacks, throttling the detailed events."""
+        with self.progress_lock:
+            if percent != self.last_percent:
+                self.last_percent = percent
+                if self.on_progress:
+                    self.on_progress(percent)
+
+            now = time.monotonic()
+            if event is not None and (event.done or now - self.last_event_time >= PROGRESS_EVENT_INTERVAL):
+                self.last_event_time = now
+                if self.on_event:
+                    self.on_event(event)
+
+    def report_message(self, message):
+        if debug:
+            print(message)
+        if self.on_message:
+            self.on_message(message)
+
+    def should_stop(self):
+        return self.is_cancelled or self.worker_error is not None
+
+    def get_body_path(self):
+        return self.video_paths[1] if len(self.video_paths) > 1 else self.video_paths[0]
+
+    def get_ffmpeg_path(self):
+        # Get the path to the embedded ffmpeg binary
+        return get_executable_path("ffmpeg")
+
+    def get_media_info(self, media_path):
+        # Intermediate files live in the temp dir and are never probed twice, keep them out of the cache
+        remember = not media_path.startswith(self.get_temp_path())
+        return get_media_info_cache().probe(media_path, remember=remember)
+
+    def get_timeline_frame_rate(self):
+        # The intro sets the output frame rate, capped by the encoding profile
+        return self.profile.get_frame_rate(self.get_frame_rate(self.video_paths[0]))
+
+    def get_frame_rate(self, video_path):
+        frame_rate = self.get_media_info(video_path)["frame_rate"]
+        if not frame_rate or frame_rate <= 0:
+            raise RuntimeError(f"Failed to get frame rate of {video_path}")
+        return frame_rate
+
+    def get_frame_size(self, video_path):
+        info = self.get_media_info(video_path)
+        return (info["width"], info["height"])
+
+    def get_video_duration(self, video_path):
+        duration = self.get_media_info(video_path)["duration"]
+        if not duration or duration <= 0:
+            raise RuntimeError("Failed to get video duration")
+        return duration
+
+    def cancel(self):
+        self.is_cancelled = True
+        with self.wakeup_lock:
+            if self.wakeup_fds:
+                os.write(self.wakeup_fds[1], b"x")
+
+class RenderJob:
+    """A queued render with its own priority, state and latest progress."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    ids = itertools.count(1)
+
+    def __init__(self, video_paths, audio_paths, output_path, render_mode="loop_tile", priority=0, audio_mode="cached",
+                 trace_path=None, profile=DEFAULT_PROFILE, resume=True, renditions=(), output_format="mp4"):
+        self.id = next(RenderJob.ids)
+        self.video_paths = list(video_paths)
+        self.audio_paths = list(audio_paths)
+        self.output_path = output_path
+        self.render_mode = render_mode
+        self.audio_mode = audio_mode
+        self.trace_path = trace_path
+        self.profile = profile
+        self.resume = resume
+        self.renditions = list(renditions)
+        self.output_format = output_format
+        self.priority = priority
+        self.state = RenderJob.QUEUED
+        self.percent = 0
+        self.event = None
+        self.error = None
+        self.renderer = None
+        self.cancel_requested = False
+
+    @property
+    def finished(self):
+        return self.state in (RenderJob.DONE, RenderJob.FAILED, RenderJob.CANCELLED)
+
+class JobScheduler:
+    """Runs queued jobs highest priority first, as many at once as the process slots allow."""
+
+    def __init__(self, max_jobs=None, on_update=None, scratch_root=None):
+        self.max_jobs = max_jobs or process_slots.capacity
+        self.on_update = on_update
+        self.scratch_root = scratch_root
+        self.jobs = {}
+        self.queue = []
+        self.running = set()
+        self.order = itertools.count()
+        self.condition = threading.Condition()
+
+    def submit(self, job):
+        with self.condition:
+            self.jobs[job.id] = job
+            heapq.heappush(self.queue, (-job.priority, next(self.order), job.id))
+        self.notify(job)
+        self.dispatch()
+        return job
+
+    def set_priority(self, job_id, priority):
+        with self.condition:
+            job = self.jobs[job_id]
+            job.priority = priority
+            if job.state == RenderJob.QUEUED:
+                # Rebuild the heap entry for the new priority
+                self.queue = [entry for entry in self.queue if entry[2] != job_id]
+                self.queue.append((-priority, next(self.order), job_id))
+                heapq.heapify(self.queue)
+        self.notify(job)
+
+    def cancel(self, job_id):
+        with self.condition:
+            job = self.jobs[job_id]
+            if job.state == RenderJob.QUEUED:
+                self.queue = [entry for entry in self.queue if entry[2] != job_id]
+                heapq.heapify(self.queue)
+                job.state = RenderJob.CANCELLED
+                self.condition.notify_all()
+            elif job.state == RenderJob.RUNNING:
+                job.cancel_requested = True
+                if job.renderer:
+                    job.renderer.cancel()
+        self.notify(job)
+
+    def cancel_all(self):
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+
+    def wait(self):
+        """Block until every submitted job has finished."""
+        with self.condition:
+            while self.queue or self.running:
+                self.condition.wait()
+
+    def dispatch(self):
+        started = []
+        with self.condition:
+            while self.queue and len(self.running) < self.max_jobs:
+                _, _, job_id = heapq.heappop(self.queue)
+                job = self.jobs[job_id]
+                job.state = RenderJob.RUNNING
+                self.running.add(job_id)
+                started.append(job)
+
+        for job in started:
+            threading.Thread(target=self.run_job, args=(job,), daemon=True).start()
+
+    def run_job(self, job):
+        def on_progress(percent):
+            job.percent = percent
+            self.notify(job)
+
+        def on_event(event):
+            job.event = event
+            self.notify(job)
+
+        try:
+            job.renderer = Renderer(job.video_paths, job.audio_paths, job.output_path, job.render_mode,
+                                    on_progress=on_progress, on_event=on_event, scratch_root=self.scratch_root,
+                                    audio_mode=job.audio_mode, trace_path=job.trace_path, profile=job.profile,
+                                    resume=job.resume, renditions=job.renditions, output_format=job.output_format)
+            if job.cancel_requested:
+                job.renderer.cancel()
+            job.state = RenderJob.DONE if job.renderer.run() else RenderJob.CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.state = RenderJob.FAILED
+
+        self.notify(job)
+        with self.condition:
+            self.running.discard(job.id)
+            self.condition.notify_all()
+        self.dispatch()
+
+    def notify(self, job):
+        if self.on_update:
+            self.on_update(job)
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}"
+
+def format_size(num_bytes):
+    for unit in ("bytes", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            break
+        num_bytes /= 1024
+    return f"{num_bytes:.0f} {unit}" if unit in ("bytes", "KB") else f"{num_bytes:.1f} {unit}"
+
+class ConsoleProgress:
+    """Single status line on stderr, rewritten in place when attached to a terminal."""
+
+    def __init__(self, label):
+        self.label = label
+        self.percent = 0
+        self.event = None
+
+    def update_percent(self, percent):
+        self.percent = percent
+        self.show()
+
+    def update_event(self, event):
+        self.event = event
+        self.show()
+
+    def message(self, text):
+        # Printed over the status line, which the next update draws again
+        print(text.ljust(60), file=sys.stderr, flush=True)
+
+    def show(self):
+        details = f"{self.label} {self.percent:3d}%"
+        if self.event is not None and self.event.speed:
+            details += f"  {self.event.speed:.1f}x"
+        if self.event is not None and self.event.eta is not None:
+            details += f"  {format_duration(self.event.eta)} left"
+        end = "\r" if sys.stderr.isatty() else "\n"
+        print(details.ljust(60), end=end, file=sys.stderr, flush=True)
+
+# Output seconds per wall second of a mode until this machine has finished a render with it, parallel is per core
+PLAN_DEFAULT_SPEED = {"loop_tile": 40.0, "parallel": 1.0, "standard": 2.0}
+
+# 720p video bitrate assumed when the looping clip reports none
+PLAN_DEFAULT_VIDEO_BITRATE = 2000000
+
+# Recent finished renders of the same settings the predictions are calibrated from
+PLAN_HISTORY_RUNS = 20
+
+# Predictions can be off, a filesystem with less than this times the predicted need left free gets a warning
+PLAN_DISK_HEADROOM = 1.5
+
+def get_device(path):
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
+
+class RenderPlan:
+    """Predicted wall time, output size and disk use of one render mode, with the reasons not to start it."""
+
+    def __init__(self, render_mode, wall, output_bytes, scratch_bytes, runs):
+        self.render_mode = render_mode
+        self.wall = wall
+        self.output_bytes = output_bytes
+        self.scratch_bytes = scratch_bytes
+        self.runs = runs
+        # (directory, bytes written there), directories on one filesystem are summed by the check
+        self.disk_needs = []
+        self.problems = []
+        self.warnings = []
+
+    def describe(self):
+        basis = f"calibrated from {self.runs} earlier renders" if self.runs else "rough guess, no earlier renders"
+        return (f"about {format_duration(self.wall)}, output {format_size(self.output_bytes)}, "
+                f"scratch {format_size(self.scratch_bytes)} ({basis})")
+
+class RenderPlanner:
+    """Predicts the cost of each render mode from the probed inputs and the render history of this machine."""
+
+    def __init__(self, video_paths, audio_paths, output_path, audio_mode="cached", profile=DEFAULT_PROFILE,
+                 renditions=(), scratch_root=None, history=None, output_format="mp4"):
+        self.output_path = output_path
+        self.audio_mode = audio_mode
+        self.output_format = output_format
+        self.profile = get_encoding_profile(profile)
+        self.renditions = list(renditions)
+        self.scratch_root = scratch_root or get_scratch_root()
+
+        media_info_cache = get_media_info_cache()
+        self.video_infos = [media_info_cache.probe(video_path) for video_path in video_paths]
+        self.duration = sum(media_info_cache.probe(audio_path)["duration"] or 0 for audio_path in audio_paths)
+
+        # Only renders with the same settings say anything about this one
+        rendition_names = [rendition.name for rendition in self.renditions]
+        self.history = [entry for entry in (read_history() if history is None else history)
+                        if entry.get("result") == "done" and entry.get("audio_duration") and entry.get("wall")
+                        and entry.get("audio_mode") == audio_mode and entry.get("profile") == self.profile.name
+                        and entry.get("renditions", []) == rendition_names
+                        and entry.get("output_format", "mp4") == output_format
+                        and entry.get("loudness") == self.profile.loudness]
+
+    def get_video_bitrate(self, info):
+        """Bits per second of a clip once scaled to the output height."""
+        if not info.get("bit_rate") or not info.get("height"):
+            return PLAN_DEFAULT_VIDEO_BITRATE
+        return info["bit_rate"] * (TARGET_HEIGHT / info["height"]) ** 2
+
+    def plan(self, render_mode):
+        import statistics
+        runs = [entry for entry in self.history if entry.get("render_mode") == render_mode][-PLAN_HISTORY_RUNS:]
+        audio_bytes = parse_bitrate(self.profile.audio_bitrate) / 8 * self.duration
+        # Pixels encoded relative to the 720p output, renditions encode every height in one pass
+        pixel_scale = 1 + sum((rendition.height / TARGET_HEIGHT) ** 2 for rendition in self.renditions if rendition.height)
+
+        if runs:
+            speed = statistics.median(entry["audio_duration"] / entry["wall"] for entry in runs)
+        else:
+            speed = PLAN_DEFAULT_SPEED["standard" if self.renditions else render_mode] / pixel_scale
+            if render_mode == "parallel" and not self.renditions:
+                speed *= os.cpu_count() or 1
+
+        sized = [entry for entry in runs if entry.get("output_bytes")]
+        if sized:
+            output_bytes = statistics.median(entry["output_bytes"] / entry["audio_duration"] for entry in sized) * self.duration
+        else:
+            # The loop plays for the whole book, so its bitrate is the output's
+            video_bytes = self.get_video_bitrate(self.video_infos[-1]) / 8 * self.duration
+            output_bytes = video_bytes * pixel_scale + audio_bytes * (1 + len(self.renditions))
+
+        scratch_bytes = 0
+        if self.audio_mode == "cached":
+            # The transcoded chapters plus the merged track joined from them
+            scratch_bytes += 2 * audio_bytes
+        if render_mode == "loop_tile" and not self.renditions:
+            scratch_bytes += sum(self.get_video_bitrate(info) / 8 * (info["duration"] or 0) for info in self.video_infos)
+
+        plan = RenderPlan(render_mode, self.duration / speed if speed else 0, output_bytes, scratch_bytes, len(runs))
+
+        output_dir = os.path.dirname(os.path.abspath(self.output_path))
+        output_disk_bytes = output_bytes
+        if render_mode == "parallel" and not self.renditions:
+            # Finished segments stay next to the output until the final join has copied them
+            output_disk_bytes += output_bytes - audio_bytes
+        plan.disk_needs = [(self.scratch_root, scratch_bytes), (output_dir, output_disk_bytes)]
+
+        # Scratch artifacts are hard linked into the cache, they only take space again on another filesystem
+        artifact_cache = get_artifact_cache()
+        if artifact_cache and scratch_bytes and get_device(artifact_cache.cache_dir) != get_device(self.scratch_root):
+            plan.disk_needs.append((artifact_cache.cache_dir, scratch_bytes))
+
+        self.check(plan)
+        return plan
+
+    def plan_all(self):
+        return {render_mode: self.plan(render_mode) for render_mode in RENDER_MODES}
+
+    def check(self, plan):
+        """Refuse a plan whose writes do not fit on a filesystem, warn when they barely do."""
+        filesystems = {}
+        for path, need in plan.disk_needs:
+            device = get_device(path)
+            # A missing output folder fails the render anyway, with a clearer error
+            if device is not None:
+                filesystems.setdefault(device, [path, 0])[1] += need
+
+        for path, need in filesystems.values():
+            free = shutil.disk_usage(path).free
+            if free < need:
+                plan.problems.append(f"Not enough space in {path}: about {format_size(need)} needed, "
+                                     f"{format_size(free)} free")
+            elif free < need * PLAN_DISK_HEADROOM:
+                plan.warnings.append(f"{path} will be nearly full: about {format_size(need)} needed, "
+                                     f"{format_size(free)} free")
+
+def plan_job(job):
+    """Plans of every render mode for a job from job_from_args."""
+    return RenderPlanner(job["video_paths"], job["audio_paths"], job["output_path"], job["audio_mode"],
+                         job["profile"], job["renditions"], output_format=job["output_format"]).plan_all()
+
+def job_from_args(args, base_dir=None):
+    """Resolve the intro, body and audio of a job given on the command line or in a manifest."""
+    def resolve(path):
+        path = os.path.expanduser(path)
+        if base_dir and not os.path.isabs(path):
+            path = os.path.join(base_dir, path)
+        return os.path.abspath(path)
+
+    video_paths = [resolve(args["intro"])]
+    if args.get("body"):
+        video_paths.append(resolve(args["body"]))
+
+    audio_paths = [resolve(path) for path in args.get("audio") or []]
+    if args.get("audio_dir"):
+        audio_paths += list_media_files(resolve(args["audio_dir"]), "mp3")
+    if not audio_paths:
+        raise ValueError("No audio files given")
+
+    if not args.get("output"):
+        raise ValueError("No output path given")
+
+    for path in video_paths + audio_paths:
+        if not os.path.isfile(path):
+            raise ValueError(f"Input file not found: {path}")
+
+    # Single settings given next to the profile name override it
+    profile = get_encoding_profile(args.get("profile") or DEFAULT_PROFILE).with_overrides(
+        preset=args.get("preset"), crf=args.get("crf"), tune=args.get("tune"), keyint_seconds=args.get("keyint"),
+        max_frame_rate=args.get("max_fps"), audio_bitrate=args.get("audio_bitrate"), loudness=args.get("loudness"))
+
+    renditions = [parse_rendition(spec, profile) for spec in args.get("renditions") or []]
+    output_format = args.get("output_format") or "mp4"
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format} (choose from {', '.join(OUTPUT_FORMATS)})")
+    if output_format == "hls" and renditions:
+        raise ValueError("HLS output cannot be combined with renditions")
+
+    return {
+        "video_paths": video_paths,
+        "audio_paths": audio_paths,
+        "output_path": resolve(args["output"]),
+        "render_mode": args.get("mode") or "loop_tile",
+        "audio_mode": args.get("audio_mode") or "cached",
+        "trace_path": resolve(args["trace"]) if args.get("trace") else None,
+        "profile": profile,
+        "resume": not args.get("restart"),
+        "renditions": renditions,
+        "output_format": output_format,
+    }
+
+def render_job(job, quiet=False, preview_window=None):
+    label = os.path.basename(job["output_path"])
+    console = ConsoleProgress(label)
+    renderer = Renderer(job["video_paths"], job["audio_paths"], job["output_path"], job["render_mode"],
+                        on_progress=None if quiet else console.update_percent,
+                        on_event=None if quiet else console.update_event, audio_mode=job["audio_mode"],
+                        trace_path=job["trace_path"], on_message=None if quiet else console.message,
+                        profile=job["profile"], resume=job["resume"], renditions=job["renditions"],
+                        output_format=job["output_format"])
+    try:
+        completed = renderer.run_preview(preview_window) if preview_window else renderer.run()
+    except KeyboardInterrupt:
+        renderer.cancel()
+        raise
+
+    if not quiet:
+        print(f"{label}: {'done' if completed else 'stopped'}".ljust(60), file=sys.stderr)
+    return completed
+
+def command_render(args):
+    job = job_from_args(vars(args))
+    plan = plan_job(job)[job["render_mode"]]
+    if plan.problems and not args.force:
+        raise ValueError("; ".join(plan.problems) + " (--force renders anyway)")
+    if not args.quiet:
+        for warning in plan.problems + plan.warnings:
+            print(f"Warning: {warning}", file=sys.stderr)
+    # Scripts read the output paths from stdout, a render that did not complete prints none
+    if not render_job(job, args.quiet):
+        return 1
+    print(get_final_output_path(job["output_path"], job["output_format"]))
+    for rendition in job["renditions"]:
+        print(rendition.get_output_path(job["output_path"]))
+    return 0
+
+def command_plan(args):
+    """Predicted time, output size and disk use of every render mode, exits 1 if the chosen one will not fit."""
+    job = job_from_args(vars(args))
+    plans = plan_job(job)
+    print(f"{os.path.basename(job['output_path'])}: scratch files in {get_scratch_root()}")
+    for render_mode, plan in plans.items():
+        marker = "*" if render_mode == job["render_mode"] else " "
+        print(f"{marker} {render_mode:10s} {plan.describe()}")
+        for problem in plan.problems:
+            print(f"      refused: {problem}")
+        for warning in plan.warnings:
+            print(f"      warning: {warning}")
+    return 1 if plans[job["render_mode"]].problems else 0
+
+def command_preview(args):
+    job = job_from_args(vars(args))
+    if not render_job(job, args.quiet, preview_window=args.window):
+        return 1
+    print(job["output_path"])
+    return 0
+
+def command_batch(args):
+    """Render every job of a JSON manifest, a list of objects with the same keys as the render options."""
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(args.manifest))
+    failures = 0
+    reported = {}
+
+    def on_update(job):
+        # One line per state change and per tenth of progress, jobs interleave
+        label = os.path.basename(job.output_path)
+        step = (job.state, job.percent // 10)
+        if args.quiet or reported.get(job.id) == step:
+            return
+        reported[job.id] = step
+        if job.state == RenderJob.FAILED:
+            print(f"{label}: failed: {job.error}", file=sys.stderr)
+        elif job.state == RenderJob.RUNNING:
+            print(f"{label}: {job.percent}%", file=sys.stderr)
+        else:
+            print(f"{label}: {job.state}", file=sys.stderr)
+
+    if args.trace_dir:
+        os.makedirs(args.trace_dir, exist_ok=True)
+
+    scheduler = JobScheduler(max_jobs=args.jobs, on_update=on_update)
+    for entry in manifest:
+        try:
+            job = job_from_args(entry, base_dir)
+        except ValueError as e:
+            failures += 1
+            print(f"Failed: {entry.get('output')}: {e}", file=sys.stderr)
+            continue
+        if args.trace_dir:
+            name = os.path.splitext(os.path.basename(job["output_path"]))[0]
+            job["trace_path"] = os.path.join(args.trace_dir, f"{name}.trace.json")
+        scheduler.submit(RenderJob(job["video_paths"], job["audio_paths"], job["output_path"],
+                                   job["render_mode"], entry.get("priority", 0), job["audio_mode"],
+                                   job["trace_path"], job["profile"], job["resume"], job["renditions"],
+                                   job["output_format"]))
+
+    try:
+        scheduler.wait()
+    except KeyboardInterrupt:
+        scheduler.cancel_all()
+        scheduler.wait()
+        raise
+
+    for job in scheduler.jobs.values():
+        if job.state == RenderJob.DONE:
+            print(get_final_output_path(job.output_path, job.output_format))
+        else:
+            failures += 1
+
+    return 1 if failures else 0
+
+# Seconds a book folder has to stay unchanged before it is rendered, uploads arrive a file at a time
+WATCH_SETTLE_SECONDS = 30
+
+# How often book folders are rescanned when inotify is not available
+WATCH_POLL_SECONDS = 5
+
+# Completed books per watched directory, so a restarted watcher skips them
+WATCH_STATE_NAME = ".videothing-watch.json"
+
+class InotifyWatcher:
+    """Directory change notifications from Linux inotify, loaded through ctypes."""
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+    def __init__(self):
+        # Imported here like sqlite3 and hashlib, the app must not pay for them before its first paint
+        import ctypes
+        import ctypes.util
+        import struct
+        self.event_header = struct.Struct("iIII")
+        # Raises OSError or AttributeError where there is no inotify, the caller falls back to polling
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+
+    def add(self, path):
+        import ctypes
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {path}")
+        self.watches[wd] = path
+
+    def read(self, timeout):
+        """Wait up to timeout seconds. Returns the changed paths, or None if events were lost."""
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.fd, selectors.EVENT_READ)
+            if not selector.select(timeout):
+                return set()
+
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.event_header.unpack_from(data, offset)
+                name = data[offset + self.event_header.size:offset + self.event_header.size + length].rstrip(b"\0")
+                offset += self.event_header.size + length
+
+                if mask & self.IN_Q_OVERFLOW:
+                    return None
+                path = self.watches.get(wd)
+                if path is None:
+                    continue
+                if mask & self.IN_IGNORED:
+                    del self.watches[wd]
+                    continue
+                changed.add(os.path.join(path, os.fsdecode(name)) if name else path)
+
+    def close(self):
+        os.close(self.fd)
+
+def get_book_snapshot(book_dir):
+    """Names, sizes and modification times of the media in a book folder, any upload in progress changes it."""
+    snapshot = []
+    try:
+        for entry in os.scandir(book_dir):
+            if entry.name.lower().endswith((".mp3", ".mp4")) and not entry.name.startswith(".") and entry.is_file():
+                stat = entry.stat()
+                snapshot.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    except OSError:
+        return None
+    return sorted(snapshot)
+
+def find_book_videos(book_dir, default_intro=None, default_body=None):
+    """Intro and body of a book folder: intro.mp4 and body.mp4, else its clips in natural order, else the defaults."""
+    names = {name.lower(): name for name in os.listdir(book_dir) if not name.startswith(".")}
+    if "intro.mp4" in names:
+        intro = os.path.join(book_dir, names["intro.mp4"])
+        body = os.path.join(book_dir, names["body.mp4"]) if "body.mp4" in names else default_body
+        return intro, body
+
+    clips = list_media_files(book_dir, "mp4")
+    if clips:
+        return clips[0], clips[1] if len(clips) > 1 else default_body
+    return default_intro, default_body
+
+class BookWatcher:
+    """Renders every book folder under a root directory once it has stopped changing."""
+
+    def __init__(self, root, output_dir, scheduler, job_options, settle=WATCH_SETTLE_SECONDS,
+                 poll_interval=WATCH_POLL_SECONDS, use_inotify=True, on_message=None):
+        self.root = os.path.abspath(root)
+        self.output_dir = os.path.abspath(output_dir)
+        self.scheduler = scheduler
+        self.job_options = job_options
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.on_message = on_message
+        self.state_path = os.path.join(self.root, WATCH_STATE_NAME)
+        self.state = self.load_state()
+        self.state_lock = threading.Lock()
+        self.books = {}
+        self.pending = set()
+        self.submitted = {}
+        self.notes = {}
+        self.failures = 0
+
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = InotifyWatcher()
+                self.inotify.add(self.root)
+            except (OSError, AttributeError) as e:
+                self.inotify = None
+                self.report(f"inotify not available ({e}), polling every {poll_interval:g}s")
+
+    def load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f).get("books", {})
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"version": 1, "books": self.state}, f, indent=1)
+        os.replace(temp_path, self.state_path)
+
+    def report(self, message):
+        if self.on_message:
+            self.on_message(message)
+
+    def note(self, name, message):
+        # Books are checked again on every change or poll, say why one is skipped only once
+        if self.notes.get(name) != message:
+            self.notes[name] = message
+            self.report(f"{name}: {message}")
+
+    def list_books(self):
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return []
+        # Hidden folders include the segment folders of resumable renders written next to the output
+        return [entry.path for entry in entries if entry.is_dir() and not entry.name.startswith(".")]
+
+    def rescan(self):
+        """Find every book folder, watching the new ones. Used at start and whenever events were lost."""
+        for book_dir in self.list_books():
+            if book_dir not in self.books:
+                self.books[book_dir] = {"snapshot": None, "changed": time.monotonic()}
+                if self.inotify:
+                    try:
+                        self.inotify.add(book_dir)
+                    except OSError as e:
+                        self.report(f"{os.path.basename(book_dir)}: cannot watch, {e}")
+            self.pending.add(book_dir)
+
+    def wait_for_changes(self):
+        # Wake up often while a book is settling, otherwise only on events or the poll interval
+        timeout = min(1.0, self.settle) if self.pending else self.poll_interval
+        if self.inotify is None:
+            time.sleep(min(timeout, self.poll_interval))
+            self.rescan()
+            return
+
+        changed = self.inotify.read(timeout)
+        if changed is None:
+            self.rescan()
+            return
+
+        for path in changed:
+            if os.path.dirname(path) == self.root:
+                # Outputs and the state file are written next to the book folders, only new folders matter
+                if path not in self.books and os.path.isdir(path) and not os.path.basename(path).startswith("."):
+                    self.rescan()
+                elif path in self.books:
+                    self.pending.add(path)
+            elif os.path.dirname(os.path.dirname(path)) == self.root and os.path.dirname(path) in self.books:
+                self.pending.add(os.path.dirname(path))
+
+    def check_books(self):
+        now = time.monotonic()
+        for book_dir in list(self.pending):
+            book = self.books.get(book_dir)
+            snapshot = get_book_snapshot(book_dir)
+            if book is None or snapshot is None:
+                # Folder removed or renamed away
+                self.books.pop(book_dir, None)
+                self.pending.discard(book_dir)
+                continue
+
+            if snapshot != book["snapshot"]:
+                book["snapshot"] = snapshot
+                book["changed"] = now
+            elif now - book["changed"] >= self.settle:
+                self.pending.discard(book_dir)
+                self.submit(book_dir, snapshot)
+
+    def submit(self, book_dir, snapshot):
+        import hashlib
+        name = os.path.basename(book_dir)
+        fingerprint = hashlib.sha256(json.dumps(snapshot).encode()).hexdigest()
+        with self.state_lock:
+            previous = self.state.get(name)
+            # A book that failed is only retried once its files change
+            if previous and previous["fingerprint"] == fingerprint:
+                return
+            if (name, fingerprint) in self.submitted.values():
+                return
+
+        intro, body = find_book_videos(book_dir, self.job_options.get("intro"), self.job_options.get("body"))
+        audio = list_media_files(book_dir, "mp3")
+        if not audio or not intro:
+            self.note(name, f"waiting for {'chapters' if not audio else 'an intro video'}")
+            return
+
+        try:
+            job = job_from_args({**self.job_options, "intro": intro, "body": body, "audio": audio, "audio_dir": None,
+                                 "output": os.path.join(self.output_dir, f"{name}.mp4")})
+        except ValueError as e:
+            self.note(name, str(e))
+            return
+
+        render_job = RenderJob(job["video_paths"], job["audio_paths"], job["output_path"], job["render_mode"],
+                               audio_mode=job["audio_mode"], trace_path=job["trace_path"], profile=job["profile"],
+                               resume=job["resume"], renditions=job["renditions"], output_format=job["output_format"])
+        with self.state_lock:
+            self.submitted[render_job.id] = (name, fingerprint)
+        self.note(name, f"queued, {len(audio)} chapters")
+        self.scheduler.submit(render_job)
+
+    def job_finished(self, job):
+        """Scheduler callback, records finished books. Cancelled ones are left to the next run."""
+        if job.state not in (RenderJob.DONE, RenderJob.FAILED):
+            return
+
+        with self.state_lock:
+            if job.id not in self.submitted:
+                return
+            name, fingerprint = self.submitted.pop(job.id)
+            self.state[name] = {
+                "fingerprint": fingerprint,
+                "state": job.state,
+                "output": job.output_path,
+                "error": job.error,
+                "time": time.time(),
+            }
+            self.save_state()
+
+        if job.state == RenderJob.DONE:
+            self.note(name, f"done, {job.output_path}")
+        else:
+            self.failures += 1
+            self.note(name, f"failed: {job.error}")
+
+    def run(self, once=False):
+        """Watch until interrupted. With once, render what is there when it settles and return."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.rescan()
+        try:
+            while True:
+                self.check_books()
+                if once and not self.pending:
+                    self.scheduler.wait()
+                    return
+                self.wait_for_changes()
+        finally:
+            if self.inotify:
+                self.inotify.close()
+
+def command_watch(args):
+    """Render book folders as they land under a directory, until interrupted."""
+    import datetime
+    def on_message(message):
+        if not args.quiet:
+            print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} {message}", file=sys.stderr)
+
+    watcher = None
+    scheduler = JobScheduler(max_jobs=args.jobs, on_update=lambda job: watcher.job_finished(job))
+    watcher = BookWatcher(args.root, args.output_dir or args.root, scheduler, vars(args), args.settle,
+                          args.poll_interval, not args.polling, on_message)
+    on_message(f"Watching {watcher.root} ({'polling' if watcher.inotify is None else 'inotify'})")
+
+    try:
+        watcher.run(args.once)
+    except KeyboardInterrupt:
+        scheduler.cancel_all()
+        scheduler.wait()
+        raise
+
+    return 1 if watcher.failures else 0
+
+# Where the render server listens unless told otherwise, this machine only
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+
+# A claimed job goes back to the queue when its worker has not checked in for this long
+JOB_LEASE_SECONDS = 30
+
+# How often a worker renews its lease and reports progress, well inside the lease
+WORKER_HEARTBEAT_SECONDS = 2
+
+# How long an idle worker, or one that cannot reach the server, waits before asking again
+WORKER_POLL_SECONDS = 2
+
+# Claims of one job before it is failed, so a job that takes its worker down does not loop forever
+JOB_MAX_ATTEMPTS = 3
+
+SERVER_TIMEOUT_SECONDS = 10
+
+# Options of a render that job_from_args reads, what a submitted job carries
+RENDER_JOB_KEYS = ["intro", "body", "audio", "audio_dir", "output", "mode", "audio_mode", "trace", "profile", "preset",
+                   "crf", "tune", "keyint", "max_fps", "audio_bitrate", "loudness", "restart", "renditions",
+                   "output_format"]
+
+# Job keys that are paths, resolved before a job is sent since the workers run elsewhere
+JOB_PATH_KEYS = ["intro", "body", "audio_dir", "output", "trace"]
+
+def get_server_url(host=SERVER_HOST, port=SERVER_PORT):
+    return f"http://{host}:{port}"
+
+class JobStore:
+    """Render jobs in SQLite, leased to one worker at a time and renewed by its heartbeats.
+
+    A job whose lease runs out is handed to the next worker that asks, so a worker that crashes
+    or loses its machine only delays the job. Parallel renders resume from their finished segments."""
+
+    FIELDS = ["id", "spec", "priority", "state", "worker", "attempts", "cancel_requested", "percent", "event",
+              "error", "created", "updated"]
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+
+        with self.connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY,
+                    spec TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    state TEXT NOT NULL,
+                    worker TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    percent INTEGER NOT NULL DEFAULT 0,
+                    event TEXT,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    lease_expires REAL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, priority)")
+
+    @contextlib.contextmanager
+    def connect(self):
+        """Connection for one transaction, committed on success and always closed."""
+        import sqlite3
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=30)) as db, db:
+            yield db
+
+    def to_dict(self, row):
+        job = dict(zip(JobStore.FIELDS, row))
+        job["spec"] = json.loads(job["spec"])
+        job["event"] = json.loads(job["event"]) if job["event"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def submit(self, spec, priority=0):
+        now = time.time()
+        with self.lock, self.connect() as db:
+            cursor = db.execute("INSERT INTO jobs (spec, priority, state, created, updated) VALUES (?, ?, ?, ?, ?)",
+                                (json.dumps(spec), priority, RenderJob.QUEUED, now, now))
+        return cursor.lastrowid
+
+    def get(self, job_id):
+        with self.lock, self.connect() as db:
+            row = db.execute(f"SELECT {', '.join(JobStore.FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self.to_dict(row) if row else None
+
+    def list_jobs(self):
+        with self.lock, self.connect() as db:
+            self.expire(db)
+            rows = db.execute(f"SELECT {', '.join(JobStore.FIELDS)} FROM jobs ORDER BY id DESC").fetchall()
+        return [self.to_dict(row) for row in rows]
+
+    def expire(self, db):
+        # Jobs of workers that stopped checking in: cancelled ones are done with, the rest retried a few times
+        now = time.time()
+        lost = "state = ? AND lease_expires < ?"
+        db.execute(f"UPDATE jobs SET state = ?, worker = NULL, updated = ? WHERE {lost} AND cancel_requested",
+                   (RenderJob.CANCELLED, now, RenderJob.RUNNING, now))
+        db.execute(f"UPDATE jobs SET state = ?, error = ?, worker = NULL, updated = ? WHERE {lost} AND attempts >= ?",
+                   (RenderJob.FAILED, "Its worker stopped responding", now, RenderJob.RUNNING, now, JOB_MAX_ATTEMPTS))
+        db.execute(f"UPDATE jobs SET state = ?, worker = NULL, updated = ? WHERE {lost}",
+                   (RenderJob.QUEUED, now, RenderJob.RUNNING, now))
+
+    def claim(self, worker):
+        """Lease the next job to worker, highest priority first. Returns None when nothing is queued."""
+        now = time.time()
+        with self.lock, self.connect() as db:
+            self.expire(db)
+            row = db.execute("SELECT id, spec FROM jobs WHERE state = ? ORDER BY priority DESC, id LIMIT 1",
+                             (RenderJob.QUEUED,)).fetchone()
+            if row is None:
+                return None
+            # Only the first attempt starts over, a retried or handed back job resumes from the segments it has
+            spec = json.loads(row[1])
+            restart = spec.pop("restart", False)
+            db.execute("UPDATE jobs SET state = ?, worker = ?, attempts = attempts + 1, percent = 0, event = NULL, "
+                       "error = NULL, lease_expires = ?, updated = ?, spec = ? WHERE id = ?",
+                       (RenderJob.RUNNING, worker, now + JOB_LEASE_SECONDS, now, json.dumps(spec), row[0]))
+        job = self.get(row[0])
+        if restart:
+            job["spec"]["restart"] = True
+        return job
+
+    def heartbeat(self, job_id, worker, percent=None, event=None):
+        """Renew the lease and record progress. Returns whether the job should stop, None once the lease is lost."""
+        now = time.time()
+        with self.lock, self.connect() as db:
+            cursor = db.execute("UPDATE jobs SET lease_expires = ?, percent = COALESCE(?, percent), "
+                                "event = COALESCE(?, event), updated = ? WHERE id = ? AND worker = ? AND state = ?",
+                                (now + JOB_LEASE_SECONDS, percent, json.dumps(event) if event else None, now,
+                                 job_id, worker, RenderJob.RUNNING))
+            if cursor.rowcount == 0:
+                return None
+            return bool(db.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()[0])
+
+    def finish(self, job_id, worker, state, error=None):
+        """Record how the worker's render ended, a queued state hands the job back. False once the lease is lost."""
+        if state not in (RenderJob.DONE, RenderJob.FAILED, RenderJob.CANCELLED, RenderJob.QUEUED):
+            raise ValueError(f"Unknown job state: {state}")
+
+        with self.lock, self.connect() as db:
+            # A job handed back by a worker that was stopped is not held against the retry limit
+            cursor = db.execute("UPDATE jobs SET state = ?, error = ?, worker = NULL, lease_expires = NULL, "
+                                "percent = CASE WHEN ? = ? THEN 100 ELSE percent END, "
+                                "attempts = CASE WHEN ? = ? THEN attempts - 1 ELSE attempts END, updated = ? "
+                                "WHERE id = ? AND worker = ? AND state = ?",
+                                (state, error, state, RenderJob.DONE, state, RenderJob.QUEUED, time.time(),
+                                 job_id, worker, RenderJob.RUNNING))
+        return cursor.rowcount > 0
+
+    def cancel(self, job_id):
+        """Cancel a queued job at once, a running one when its worker next checks in."""
+        with self.lock, self.connect() as db:
+            db.execute("UPDATE jobs SET state = ?, updated = ? WHERE id = ? AND state = ?",
+                       (RenderJob.CANCELLED, time.time(), job_id, RenderJob.QUEUED))
+            db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state = ?", (job_id, RenderJob.RUNNING))
+
+    def set_priority(self, job_id, priority):
+        with self.lock, self.connect() as db:
+            db.execute("UPDATE jobs SET priority = ?, updated = ? WHERE id = ?", (priority, time.time(), job_id))
+
+def check_job_spec(spec):
+    """Reject a submitted job that no worker could render, before it is queued."""
+    if not isinstance(spec, dict):
+        raise ValueError("A job is a JSON object with the same keys as a batch manifest entry")
+    if not spec.get("intro") or not spec.get("output"):
+        raise ValueError("A job needs an intro and an output")
+    if not spec.get("audio") and not spec.get("audio_dir"):
+        raise ValueError("A job needs audio or an audio_dir")
+    if spec.get("audio") and not isinstance(spec["audio"], list):
+        raise ValueError("A job's audio is a list of chapter paths in playing order")
+
+    # Workers do not share the submitter's working directory
+    paths = [spec[key] for key in JOB_PATH_KEYS if spec.get(key)] + list(spec.get("audio") or [])
+    for path in paths:
+        if not isinstance(path, str):
+            raise ValueError(f"Job paths must be strings: {json.dumps(path)}")
+        if not os.path.isabs(path):
+            raise ValueError(f"Job paths must be absolute: {path}")
+
+class RenderServer:
+    """HTTP/JSON API over a JobStore, for clients that submit jobs and workers that render them.
+
+    GET  /jobs                  every job, newest first
+    POST /jobs                  queue a job, a batch manifest entry with absolute paths
+    GET  /jobs/<id>             one job
+    POST /jobs/<id>/cancel      cancel a queued job or stop a running one
+    POST /jobs/<id>/priority    {"priority": n}
+    POST /claim                 {"worker": name}, the leased job, or 204 when the queue is empty
+    POST /jobs/<id>/heartbeat   {"worker", "percent", "event"}, answers {"cancel": bool}, 409 once the lease is lost
+    POST /jobs/<id>/finish      {"worker", "state", "error"}"""
+
+    def __init__(self, store, host=SERVER_HOST, port=SERVER_PORT):
+        # Imported here like urllib, the app never serves
+        import http.server
+
+        self.store = store
+        render_server = self
+
+        class RequestHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.respond("GET")
+
+            def do_POST(self):
+                self.respond("POST")
+
+            def respond(self, method):
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    body = json.loads(self.rfile.read(length)) if length else {}
+                    status, result = render_server.route(method, self.path.strip("/").split("/"), body)
+                except ValueError as e:
+                    status, result = 400, {"error": str(e)}
+
+                payload = b"" if result is None else json.dumps(result).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                if debug:
+                    super().log_message(format, *args)
+
+        self.httpd = http.server.ThreadingHTTPServer((host, port), RequestHandler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return get_server_url(host, port)
+
+    def route(self, method, parts, body):
+        """Status and JSON result of a request, parts is the path split at slashes."""
+        if not isinstance(body, dict):
+            raise ValueError("The request body must be a JSON object")
+
+        if parts == ["jobs"] and method == "GET":
+            return 200, self.store.list_jobs()
+
+        if parts == ["jobs"] and method == "POST":
+            spec = dict(body)
+            priority = self.get_priority(spec)
+            spec.pop("priority", None)
+            check_job_spec(spec)
+            return 201, self.store.get(self.store.submit(spec, priority))
+
+        if parts == ["claim"] and method == "POST":
+            job = self.store.claim(self.get_worker(body))
+            return (200, job) if job else (204, None)
+
+        if len(parts) in (2, 3) and parts[0] == "jobs" and parts[1].isdigit():
+            job_id = int(parts[1])
+            if self.store.get(job_id) is None:
+                return 404, {"error": f"No job {job_id}"}
+            action = parts[2] if len(parts) == 3 else None
+
+            if action is None and method == "GET":
+                return 200, self.store.get(job_id)
+            if action == "cancel" and method == "POST":
+                self.store.cancel(job_id)
+                return 200, self.store.get(job_id)
+            if action == "priority" and method == "POST":
+                self.store.set_priority(job_id, self.get_priority(body))
+                return 200, self.store.get(job_id)
+            if action == "heartbeat" and method == "POST":
+                cancel = self.store.heartbeat(job_id, self.get_worker(body), body.get("percent"), body.get("event"))
+                if cancel is None:
+                    return 409, {"error": f"Job {job_id} is no longer leased to this worker"}
+                return 200, {"cancel": cancel}
+            if action == "finish" and method == "POST":
+                if not self.store.finish(job_id, self.get_worker(body), body.get("state"), body.get("error")):
+                    return 409, {"error": f"Job {job_id} is no longer leased to this worker"}
+                return 200, self.store.get(job_id)
+
+        return 404, {"error": f"Unknown request {method} /{'/'.join(parts)}"}
+
+    def get_priority(self, body):
+        # bool is an int too, but true is no priority anyone meant to send
+        priority = body.get("priority") or 0
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            raise ValueError(f"The priority must be a whole number, not {json.dumps(priority)}")
+        return priority
+
+    def get_worker(self, body):
+        if not body.get("worker"):
+            raise ValueError("The request does not name its worker")
+        return str(body["worker"])
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class ServerClient:
+    """JSON requests to a render server, raising RuntimeError when it cannot be reached."""
+
+    def __init__(self, url=None):
+        self.url = (url or get_server_url()).rstrip("/")
+
+    def request(self, method, path, body=None, allowed=()):
+        """Status and decoded answer. Statuses in allowed are returned, other errors raise."""
+        import urllib.request
+        import urllib.error
+
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json", "User-Agent": "Video-Thing"})
+        try:
+            with urllib.request.urlopen(request, timeout=SERVER_TIMEOUT_SECONDS) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+            if status not in allowed:
+                try:
+                    message = json.loads(payload)["error"]
+                except (ValueError, KeyError, TypeError):
+                    message = f"status {status}"
+                if status == 400:
+                    raise ValueError(message)
+                raise RuntimeError(f"The render server refused {method} {path}: {message}")
+        except (urllib.error.URLError, OSError) as e:
+            raise RuntimeError(f"Could not reach the render server at {self.url}: {getattr(e, 'reason', e)}")
+
+        return status, json.loads(payload) if payload else None
+
+    def submit(self, spec, priority=0):
+        return self.request("POST", "/jobs", {**spec, "priority": priority})[1]
+
+    def list_jobs(self):
+        return self.request("GET", "/jobs")[1]
+
+    def get_job(self, job_id):
+        return self.request("GET", f"/jobs/{job_id}")[1]
+
+    def cancel(self, job_id):
+        return self.request("POST", f"/jobs/{job_id}/cancel", {})[1]
+
+    def set_priority(self, job_id, priority):
+        return self.request("POST", f"/jobs/{job_id}/priority", {"priority": priority})[1]
+
+    def claim(self, worker):
+        return self.request("POST", "/claim", {"worker": worker})[1]
+
+    def heartbeat(self, job_id, worker, percent, event):
+        """True when the worker should stop the render, because it was cancelled or the job went to another worker."""
+        status, result = self.request("POST", f"/jobs/{job_id}/heartbeat",
+                                      {"worker": worker, "percent": percent, "event": event}, allowed=(409,))
+        return status == 409 or result["cancel"]
+
+    def finish(self, job_id, worker, state, error=None):
+        self.request("POST", f"/jobs/{job_id}/finish", {"worker": worker, "state": state, "error": error},
+                     allowed=(409,))
+
+class RenderWorker:
+    """Takes jobs from a render server one at a time and renders them, sending progress with every heartbeat."""
+
+    def __init__(self, client, name=None, on_message=None):
+        import socket
+        self.client = client
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.on_message = on_message
+
+    def message(self, text):
+        if self.on_message:
+            self.on_message(text)
+
+    def run(self, once=False):
+        """Render jobs until interrupted, or with once until the queue is empty."""
+        while True:
+            try:
+                job = self.client.claim(self.name)
+            except RuntimeError as e:
+                # The server restarting is no reason for its workers to exit
+                self.message(str(e))
+                time.sleep(WORKER_POLL_SECONDS)
+                continue
+
+            if job is not None:
+                self.render(job)
+            elif once:
+                return
+            else:
+                time.sleep(WORKER_POLL_SECONDS)
+
+    def render(self, job):
+        label = f"job {job['id']} ({os.path.basename(job['spec']['output'])})"
+        self.message(f"Rendering {label}")
+        progress = {"percent": 0, "event": None}
+        try:
+            # Inputs are checked here, they only have to exist where the job is rendered
+            spec = job_from_args(job["spec"])
+            renderer = Renderer(spec["video_paths"], spec["audio_paths"], spec["output_path"], spec["render_mode"],
+                                on_progress=lambda percent: progress.update(percent=percent),
+                                on_event=lambda event: progress.update(event=vars(event)),
+                                audio_mode=spec["audio_mode"], trace_path=spec["trace_path"], profile=spec["profile"],
+                                resume=spec["resume"], renditions=spec["renditions"],
+                                output_format=spec["output_format"])
+        except ValueError as e:
+            self.finish(job, label, RenderJob.FAILED, str(e))
+            return
+
+        stopped = threading.Event()
+
+        def send_heartbeats():
+            while not stopped.wait(WORKER_HEARTBEAT_SECONDS):
+                try:
+                    if self.client.heartbeat(job["id"], self.name, progress["percent"], progress["event"]):
+                        renderer.cancel()
+                except RuntimeError as e:
+                    # Keep rendering, the lease only runs out if the server stays away
+                    self.message(str(e))
+
+        heartbeat_thread = threading.Thread(target=send_heartbeats, daemon=True)
+        heartbeat_thread.start()
+
+        state, error = RenderJob.FAILED, None
+        try:
+            state = RenderJob.DONE if renderer.run() else RenderJob.CANCELLED
+        except KeyboardInterrupt:
+            # Stopped, not failed: another worker picks the job up
+            renderer.cancel()
+            state = RenderJob.QUEUED
+            raise
+        except Exception as e:
+            error = str(e)
+        finally:
+            stopped.set()
+            heartbeat_thread.join()
+            self.finish(job, label, state, error)
+
+    def finish(self, job, label, state, error=None):
+        self.message(f"Finished {label}: {error or state}")
+        try:
+            self.client.finish(job["id"], self.name, state, error)
+        except RuntimeError as e:
+            # The lease runs out and the job is retried, or failed once it has been tried enough
+            self.message(str(e))
+
+def get_job_spec(args):
+    """Batch manifest entry for the render options in args, with the paths made absolute for the workers."""
+    spec = {key: value for key, value in args.items() if value is not None and key in RENDER_JOB_KEYS}
+    for key in JOB_PATH_KEYS:
+        if key in spec:
+            spec[key] = os.path.abspath(os.path.expanduser(spec[key]))
+    if "audio" in spec:
+        spec["audio"] = [os.path.abspath(os.path.expanduser(path)) for path in spec["audio"]]
+    return spec
+
+def format_server_job(job):
+    text = f"{job['id']:>5}  {job['state']:9s} {job['percent']:3d}%  {os.path.basename(job['spec'].get('output', ''))}"
+    if job["worker"]:
+        text += f"  on {job['worker']}"
+    if job["error"]:
+        text += f"  ({job['error']})"
+    return text
+
+def command_serve(args):
+    """Run the render server, with local worker processes when asked, until interrupted."""
+    store = JobStore(args.db or os.path.join(get_cache_dir(), "jobs.sqlite"))
+    server = RenderServer(store, args.host, args.port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Render server at {server.url}, jobs in {store.db_path}", file=sys.stderr)
+
+    # Workers on this machine talk to the server over HTTP like remote ones, each renders one job at a time
+    worker_cmd = [sys.executable, os.path.abspath(__file__)] + (["--debug"] if debug else [])
+    if scratch_root_override:
+        worker_cmd += ["--scratch-dir", scratch_root_override]
+    if not artifact_cache_enabled:
+        worker_cmd += ["--no-cache"]
+    worker_cmd += ["worker", "--server", get_server_url("127.0.0.1", server.httpd.server_address[1])]
+    workers = [subprocess.Popen(worker_cmd, stdin=subprocess.DEVNULL, **get_process_group_args())
+               for _ in range(args.workers)]
+
+    try:
+        while True:
+            time.sleep(1)
+    finally:
+        # Workers hand their jobs back over HTTP, so they stop before the server does
+        for worker in workers:
+            if worker.poll() is None:
+                signal_process_group(worker)
+        for worker in workers:
+            try:
+                worker.wait(JOB_LEASE_SECONDS)
+            except subprocess.TimeoutExpired:
+                signal_process_group(worker, kill=True)
+                worker.wait()
+        server.shutdown()
+
+def command_worker(args):
+    import datetime
+    def on_message(message):
+        if not args.quiet:
+            print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} {message}", file=sys.stderr)
+
+    RenderWorker(ServerClient(args.server), args.name, on_message).run(args.once)
+    return 0
+
+def command_submit(args):
+    client = ServerClient(args.server)
+    job = client.submit(get_job_spec(vars(args)), args.priority)
+    print(job["id"])
+    if not args.wait:
+        return 0
+
+    last = None
+    while job["state"] not in (RenderJob.DONE, RenderJob.FAILED, RenderJob.CANCELLED):
+        time.sleep(WORKER_HEARTBEAT_SECONDS)
+        job = client.get_job(job["id"])
+        if not args.quiet and (job["state"], job["percent"]) != last:
+            last = (job["state"], job["percent"])
+            print(format_server_job(job), file=sys.stderr)
+    return 0 if job["state"] == RenderJob.DONE else 1
+
+def command_jobs(args):
+    client = ServerClient(args.server)
+    for job_id in args.cancel or []:
+        client.cancel(job_id)
+    for job in client.list_jobs():
+        print(format_server_job(job))
+    return 0
+
+def command_analyze(args):
+    """Show which clips a loop tile render would copy and which it would re-encode."""
+    video_paths = [os.path.abspath(args.intro)]
+    if args.body:
+        video_paths.append(os.path.abspath(args.body))
+
+    cache = get_media_info_cache()
+    infos = [cache.probe(path) for path in video_paths]
+    if not infos[0]["frame_rate"]:
+        raise RuntimeError(f"Failed to get frame rate of {video_paths[0]}")
+
+    plan = PassthroughPlan(video_paths, infos, infos[0]["frame_rate"])
+    for line in plan.describe():
+        print(line)
+    return 0
+
+def parse_bitrate(bitrate):
+    """Bits per second of an ffmpeg bitrate such as 128k."""
+    bitrate = str(bitrate).strip().lower()
+    multiplier = {"k": 1000, "m": 1000 ** 2}.get(bitrate[-1:], 1)
+    return float(bitrate.rstrip("km")) * multiplier
+
+def measure_ssim(encoded_path, reference_path):
+    cmd = [get_executable_path("ffmpeg"), "-hide_banner", "-i", encoded_path, "-i", reference_path,
+           "-lavfi", "[0:v][1:v]ssim", "-f", "null", "-"]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    match = re.search(r"SSIM .*All:([0-9.]+)", result.stderr)
+    if not match:
+        raise RuntimeError(f"Failed to measure SSIM of {encoded_path}")
+    return float(match.group(1))
+
+def calibrate_profile(video_path, base_profile, seconds=20, target_ssim=None, target_mb_per_hour=None, on_result=None):
+    """Trial-encode a sample of video_path with every x264 preset, fastest first, until one meets the targets.
+
+    Returns the list of trial results, the last one is the pick if its "meets" is true.
+    """
+    info = get_media_info_cache().probe(video_path)
+    if not info["frame_rate"]:
+        raise RuntimeError(f"Failed to get frame rate of {video_path}")
+    frame_rate = base_profile.get_frame_rate(info["frame_rate"])
+    audio_mb_per_hour = parse_bitrate(base_profile.audio_bitrate) / 8 * 3600 / 1024 ** 2
+
+    work_dir = tempfile.mkdtemp(prefix="videothing-calibrate-")
+    try:
+        # Lossless reference at the output size and rate, looped if the clip is shorter than the sample
+        reference_path = os.path.join(work_dir, "reference.mkv")
+        cmd = [
+            get_executable_path("ffmpeg"), "-hide_banner", "-loglevel", "error",
+            "-stream_loop", "-1",
+            "-i", video_path,
+            "-t", str(seconds),
+            "-an",
+            "-vf", f"{VIDEO_FILTER},fps={frame_rate},format={TARGET_PIX_FMT}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-qp", "0",
+            "-y", reference_path
+        ]
+        subprocess.run(cmd, check=True)
+
+        results = []
+        for preset in X264_PRESETS:
+            profile = base_profile.with_overrides(preset=preset)
+            trial_path = os.path.join(work_dir, f"{preset}.mp4")
+            cmd = [get_executable_path("ffmpeg"), "-hide_banner", "-loglevel", "error", "-i", reference_path,
+                   *profile.get_video_args(frame_rate), "-y", trial_path]
+            if debug:
+                print(' '.join(cmd))
+
+            started = time.monotonic()
+            subprocess.run(cmd, check=True)
+            wall = time.monotonic() - started
+
+            ssim = measure_ssim(trial_path, reference_path)
+            mb_per_hour = os.path.getsize(trial_path) / 1024 ** 2 * 3600 / seconds + audio_mb_per_hour
+            result = {
+                "preset": preset,
+                "speed": seconds / wall,
+                "ssim": ssim,
+                "mb_per_hour": mb_per_hour,
+                "meets": (target_ssim is None or ssim >= target_ssim)
+                         and (target_mb_per_hour is None or mb_per_hour <= target_mb_per_hour),
+            }
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+            # Presets only get slower from here, the first one that is good enough is the pick
+            if result["meets"]:
+                break
+
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def command_calibrate(args):
+    """Find the fastest x264 preset that reaches the quality or size target on this machine."""
+    video_path = os.path.abspath(args.body or args.intro)
+    if not os.path.isfile(video_path):
+        raise ValueError(f"Input file not found: {video_path}")
+
+    base_profile = get_encoding_profile(args.profile).with_overrides(crf=args.crf, tune=args.tune)
+    target_ssim = args.target_ssim
+    if target_ssim is None and args.target_size is None:
+        target_ssim = 0.97
+
+    def on_result(result):
+        verdict = "meets target" if result["meets"] else ""
+        print(f"{result['preset']:10s} {result['speed']:7.1f}x  SSIM {result['ssim']:.4f}  "
+              f"{result['mb_per_hour']:7.0f} MB/hour  {verdict}", file=sys.stderr)
+
+    results = calibrate_profile(video_path, base_profile, args.seconds, target_ssim, args.target_size, on_result)
+    pick = results[-1]
+    if not pick["meets"]:
+        print("No preset meets the target, try a lower CRF or a looser target", file=sys.stderr)
+        return 1
+
+    profile = base_profile.with_overrides(preset=pick["preset"],
+                                          label=f"Calibrated ({pick['preset']}, CRF {base_profile.crf})")
+    profile.name = args.save_as
+    save_profile(profile, {"calibrated_at": time.time(), "calibrated_on": os.path.basename(video_path),
+                           "target_ssim": target_ssim, "target_mb_per_hour": args.target_size,
+                           "ssim": pick["ssim"], "speed": pick["speed"]})
+    print(f"Saved profile '{profile.name}': preset {pick['preset']}, CRF {profile.crf}. Use it with --profile {profile.name}")
+    return 0
+
+def command_history(args):
+    """Median speed and memory of finished renders per build, oldest build first, to spot regressions."""
+    import statistics
+    entries = [entry for entry in read_history()
+               if entry.get("result") == "done" and entry.get("audio_duration") and entry.get("wall")]
+    if args.limit:
+        entries = entries[-args.limit:]
+    if not entries:
+        print("No finished renders recorded yet", file=sys.stderr)
+        return 0
+
+    # Group by render settings first, then by build in the order builds first appeared
+    groups = {}
+    for entry in entries:
+        settings = (entry.get("render_mode"), entry.get("audio_mode"))
+        build = (entry.get("engine"), entry.get("ffmpeg"))
+        groups.setdefault(settings, {}).setdefault(build, []).append(entry)
+
+    for (render_mode, audio_mode), builds in groups.items():
+        print(f"{render_mode} / {audio_mode}")
+        previous_speed = None
+        for (engine, ffmpeg), runs in builds.items():
+            speed = statistics.median(run["audio_duration"] / run["wall"] for run in runs)
+            peak_rss = statistics.median(run.get("peak_rss") or 0 for run in runs)
+            stage_walls = []
+            for name in runs[-1]["stages"]:
+                wall = statistics.median(run["stages"][name]["wall"] for run in runs if name in run["stages"])
+                stage_walls.append(f"{name} {wall:.1f}s")
+            stages = "  ".join(stage_walls)
+            line = f"  {engine}  {len(runs):3d} runs  {speed:7.1f}x  {peak_rss / 1024 ** 2:6.0f} MB  {stages}"
+            if previous_speed:
+                change = (speed - previous_speed) / previous_speed * 100
+                line += f"  {change:+.0f}%"
+                if change <= -args.threshold:
+                    line += "  slower"
+            print(line)
+            if args.verbose:
+                print(f"      {ffmpeg}")
+            previous_speed = speed
+
+    return 0
+
+# Release assets the app updates itself from, override to test against a local server
+UPDATE_URL = os.environ.get("VIDEOTHING_UPDATE_URL") or "https://github.com/corecoding/Video-Thing/releases/latest/download/"
+UPDATE_MANIFEST = "update.json"
+UPDATE_FILES = ["app.py", "videothing.py"]
+
+# Seconds between scheduled checks, and before the first retry after a failed one, doubled per failure
+UPDATE_CHECK_INTERVAL = 24 * 3600
+UPDATE_RETRY_SECONDS = 5 * 60
+UPDATE_TIMEOUT_SECONDS = 30
+
+class Updater:
+    """Keeps the application files in app_dir at the published release.
+
+    The release manifest lists the SHA-256 of every file and is fetched with If-None-Match and
+    If-Modified-Since, so an unchanged release costs one request that returns no body. Files are
+    only swapped in once every download matched its hash."""
+
+    def __init__(self, app_dir, base_url=UPDATE_URL, file_names=UPDATE_FILES, state_path=None):
+        self.app_dir = app_dir
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.file_names = file_names
+        self.state_path = state_path or os.path.join(get_cache_dir(), "update_state.json")
+        self.state = self.load_state()
+
+    def load_state(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Validators of another server say nothing about this one
+        return state if state.get("base_url") == self.base_url else {}
+
+    def save_state(self):
+        self.state["base_url"] = self.base_url
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(temp_path, self.state_path)
+
+    def fetch(self, file_name, conditional=False):
+        """Body and headers of a release file, the body is None when the server says it has not changed."""
+        # Imported here, http.client and email are a good part of the app's startup time otherwise
+        import urllib.request
+        import urllib.error
+
+        request = urllib.request.Request(self.base_url + file_name, headers={"User-Agent": "Video-Thing"})
+        if conditional and self.state.get("etag"):
+            request.add_header("If-None-Match", self.state["etag"])
+        if conditional and self.state.get("last_modified"):
+            request.add_header("If-Modified-Since", self.state["last_modified"])
+
+        try:
+            with urllib.request.urlopen(request, timeout=UPDATE_TIMEOUT_SECONDS) as response:
+                return response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None, e.headers
+            raise RuntimeError(f"The update server returned {e.code} for {file_name}")
+        except (urllib.error.URLError, OSError) as e:
+            raise RuntimeError(f"Could not reach the update server: {getattr(e, 'reason', e)}")
+
+    def is_due(self):
+        return time.time() >= self.state.get("next_check", 0)
+
+    def check(self):
+        """Names of the files whose published version differs from the one in app_dir.
+
+        Schedules the next check, backing off after failures."""
+        try:
+            manifest = self.fetch_manifest()
+        except (RuntimeError, ValueError):
+            failures = self.state.get("failures", 0) + 1
+            self.state.update(failures=failures,
+                              next_check=time.time() + min(UPDATE_CHECK_INTERVAL, UPDATE_RETRY_SECONDS * 2 ** (failures - 1)))
+            self.try_save_state()
+            raise
+
+        self.state.update(failures=0, next_check=time.time() + UPDATE_CHECK_INTERVAL)
+        self.try_save_state()
+
+        changed = []
+        for file_name in self.file_names:
+            published = manifest["files"].get(file_name)
+            local_path = os.path.join(self.app_dir, file_name)
+            if published and (not os.path.exists(local_path) or hash_file(local_path) != published["sha256"]):
+                changed.append(file_name)
+        return changed
+
+    def fetch_manifest(self):
+        manifest = self.state.get("manifest")
+        body, headers = self.fetch(UPDATE_MANIFEST, conditional=manifest is not None)
+        if body is None:
+            return manifest
+
+        manifest = json.loads(body)
+        if not isinstance(manifest.get("files"), dict):
+            raise ValueError("The update manifest lists no files")
+        self.state.update(manifest=manifest, etag=headers.get("ETag"), last_modified=headers.get("Last-Modified"))
+        return manifest
+
+    def try_save_state(self):
+        # Losing the schedule only means checking again sooner
+        try:
+            self.save_state()
+        except OSError as e:
+            if debug:
+                print(f"Could not save the update state: {e}")
+
+    @property
+    def version(self):
+        return (self.state.get("manifest") or {}).get("version")
+
+    def apply(self, file_names):
+        """Download, verify and swap in file_names from the last checked manifest. Nothing changes unless all verify."""
+        import hashlib
+        if not os.access(self.app_dir, os.W_OK):
+            raise RuntimeError(f"The application folder is not writable: {self.app_dir}")
+
+        published = self.state["manifest"]["files"]
+        staged = []
+        try:
+            for file_name in file_names:
+                body, _ = self.fetch(file_name)
+                if hashlib.sha256(body).hexdigest() != published[file_name]["sha256"]:
+                    raise RuntimeError(f"The download of {file_name} does not match the published hash")
+
+                # Staged next to the target so the swap is a rename on one filesystem
+                fd, temp_path = tempfile.mkstemp(prefix=f".{file_name}.", suffix=".tmp", dir=self.app_dir)
+                staged.append((temp_path, os.path.join(self.app_dir, file_name)))
+                with os.fdopen(fd, "wb") as f:
+                    f.write(body)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if sys.platform != 'win32':
+                    os.chmod(temp_path, 0o755)
+
+            # Every file verified, each rename replaces one file atomically
+            while staged:
+                temp_path, target_path = staged.pop(0)
+                os.replace(temp_path, target_path)
+        finally:
+            for temp_path, _ in staged:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+def write_update_manifest(paths, output_path, version=None):
+    """Manifest of the release files the updater checks against, written by the release build."""
+    manifest = {"version": version, "files": {}}
+    for path in paths:
+        manifest["files"][os.path.basename(path)] = {"sha256": hash_file(path), "size": os.path.getsize(path)}
+    with open(output_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+
+def command_update(args):
+    updater = Updater(os.path.abspath(args.app_dir), args.url)
+    changed = updater.check()
+    if not changed:
+        print("Already up to date", file=sys.stderr)
+        return 0
+
+    print(f"Update available{f' ({updater.version})' if updater.version else ''}: {', '.join(changed)}", file=sys.stderr)
+    if args.check:
+        return 1
+    updater.apply(changed)
+    print("Updated, restart to use the new version", file=sys.stderr)
+    return 0
+
+def command_update_manifest(args):
+    write_update_manifest(args.files, args.output, args.version)
+    return 0
+
+def main(argv=None):
+    global debug
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="videothing", description="Combine video and audio files into a single video.")
+    parser.add_argument("--debug", action="store_true", help="print ffmpeg command lines and output")
+    parser.add_argument("--no-cache", action="store_true", help="do not reuse or store intermediate artifacts")
+    parser.add_argument("--cache-limit", type=float, metavar="GB",
+                        help=f"size limit of the artifact cache (default {ARTIFACT_CACHE_MAX_BYTES // 1024 ** 3} GB)")
+    parser.add_argument("--scratch-dir", metavar="DIR",
+                        help="where renders write temporary files (default: the app's scratch folder or the system temp dir)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Inputs and output of one book, shared by render, submit, plan and preview
+    input_options = argparse.ArgumentParser(add_help=False)
+    input_options.add_argument("--intro", required=True, help="video that plays once at the start")
+    input_options.add_argument("--body", help="video that loops for the rest of the audio (defaults to the intro)")
+    input_options.add_argument("--audio-dir", help="directory of MP3 chapters, ordered like the drop zone")
+    input_options.add_argument("--audio", nargs="+", help="MP3 chapters in playing order")
+    input_options.add_argument("-o", "--output", required=True, help="output MP4 path")
+
+    # Encoder settings, also used by preview and watch
+    encoding_options = argparse.ArgumentParser(add_help=False)
+    encoding_options.add_argument("--profile", default=DEFAULT_PROFILE,
+                                  help=f"encoding profile: {', '.join(ENCODING_PROFILES)} or a calibrated one")
+    encoding_options.add_argument("--preset", choices=X264_PRESETS, help="x264 preset, overrides the profile")
+    encoding_options.add_argument("--crf", type=int, help="x264 CRF, overrides the profile")
+    encoding_options.add_argument("--tune", help="x264 tune such as stillimage, overrides the profile")
+    encoding_options.add_argument("--keyint", type=float, metavar="SECONDS", help="keyframe interval, overrides the profile")
+    encoding_options.add_argument("--max-fps", type=float, help="cap the output frame rate, overrides the profile")
+    encoding_options.add_argument("--audio-bitrate", help="AAC bitrate such as 96k, overrides the profile")
+    encoding_options.add_argument("--loudness", type=float, metavar="LUFS",
+                                  help="normalize every chapter to this integrated loudness, such as -16")
+
+    # How a full render runs and what it writes, a preview has none of these
+    render_options = argparse.ArgumentParser(add_help=False)
+    render_options.add_argument("--mode", choices=list(RENDER_MODES), default="loop_tile", help="render mode")
+    render_options.add_argument("--audio-mode", choices=list(AUDIO_MODES), default="cached",
+                                help="merge the chapters to a cached file first, or stream them into the final mux")
+    render_options.add_argument("--rendition", dest="renditions", action="append", metavar="SPEC",
+                                help="extra output from the same pass: a height such as 1080p or 480p:draft, "
+                                     "or audio for an M4A; repeatable")
+    render_options.add_argument("--output-format", choices=list(OUTPUT_FORMATS), default="mp4",
+                                help="fragmented MP4 or HLS segments can be played and uploaded while rendering, "
+                                     "and stay valid if the render is aborted")
+    render_options.add_argument("--restart", action="store_true",
+                                help="discard the segments of an earlier, unfinished parallel render of the same output")
+
+    # Options of one render, shared by render and submit
+    job_options = argparse.ArgumentParser(add_help=False, parents=[input_options, encoding_options, render_options])
+    job_options.add_argument("--trace", metavar="FILE", help="write a Chrome trace of the render stages to FILE")
+
+    render_parser = subparsers.add_parser("render", parents=[job_options], help="render a single video")
+    render_parser.add_argument("--force", action="store_true", help="render even when the disk space check fails")
+    render_parser.add_argument("-q", "--quiet", action="store_true", help="do not print progress")
+    render_parser.set_defaults(func=command_render)
+
+    submit_parser = subparsers.add_parser("submit", parents=[job_options], help="queue a render on a render server")
+    submit_parser.add_argument("--server", default=get_server_url(), help=f"render server URL (default {get_server_url()})")
+    submit_parser.add_argument("--priority", type=int, default=0, help="higher priority jobs are claimed first")
+    submit_parser.add_argument("--wait", action="store_true", help="follow the job until it ends, exit 1 unless it is done")
+    submit_parser.add_argument("-q", "--quiet", action="store_true", help="do not print progress while waiting")
+    submit_parser.set_defaults(func=command_submit)
+
+    plan_parser = subparsers.add_parser("plan", parents=[input_options, encoding_options, render_options],
+                                        help="predict render time, output size and disk use without rendering")
+    plan_parser.set_defaults(func=command_plan)
+
+    preview_parser = subparsers.add_parser("preview", parents=[input_options, encoding_options],
+                                           help="render a short low resolution preview in a few seconds")
+    preview_parser.add_argument("--window", type=float, default=PREVIEW_WINDOW_SECONDS,
+                                help=f"seconds shown around the intro to body cut and from the middle (default {PREVIEW_WINDOW_SECONDS})")
+    preview_parser.add_argument("--trace", metavar="FILE", help="write a Chrome trace of the preview to FILE")
+    preview_parser.add_argument("-q", "--quiet", action="store_true", help="do not print progress")
+    preview_parser.set_defaults(func=command_preview)
+
+    batch_parser = subparsers.add_parser("batch", help="render every job listed in a JSON manifest")
+    batch_parser.add_argument("manifest", help="JSON list of jobs with intro, body, audio_dir or audio, output, mode and audio_mode")
+    batch_parser.add_argument("-j", "--jobs", type=int, help="books rendered at once (default: one per free ffmpeg slot)")
+    batch_parser.add_argument("--trace-dir", metavar="DIR", help="write a Chrome trace per job to DIR")
+    batch_parser.add_argument("-q", "--quiet", action="store_true", help="do not print progress")
+    batch_parser.set_defaults(func=command_batch)
+
+    watch_parser = subparsers.add_parser("watch", parents=[encoding_options, render_options], help="render book folders automatically as they land in a directory")
+    watch_parser.add_argument("root", help="directory whose subfolders are books: chapter MP3s plus intro.mp4 and body.mp4")
+    watch_parser.add_argument("--output-dir", help="where <book>.mp4 is written (default: the watched directory)")
+    watch_parser.add_argument("--intro", help="intro for book folders without videos")
+    watch_parser.add_argument("--body", help="looping video for book folders without one")
+    watch_parser.add_argument("--settle", type=float, default=WATCH_SETTLE_SECONDS,
+                              help=f"seconds a folder must stay unchanged before it is rendered (default {WATCH_SETTLE_SECONDS})")
+    watch_parser.add_argument("--poll-interval", type=float, default=WATCH_POLL_SECONDS,
+                              help=f"seconds between rescans without inotify (default {WATCH_POLL_SECONDS})")
+    watch_parser.add_argument("--polling", action="store_true", help="rescan the folders instead of using inotify")
+    watch_parser.add_argument("--once", action="store_true", help="render the books that are there and exit")
+    watch_parser.add_argument("-j", "--jobs", type=int, help="books rendered at once (default: one per free ffmpeg slot)")
+    watch_parser.add_argument("-q", "--quiet", action="store_true", help="do not print progress")
+    watch_parser.set_defaults(func=command_watch)
+
+    serve_parser = subparsers.add_parser("serve", help="run a render server that workers take jobs from")
+    serve_parser.add_argument("--host", default=SERVER_HOST,
+                              help=f"address to listen on, 0.0.0.0 for the LAN (default {SERVER_HOST})")
+    serve_parser.add_argument("--port", type=int, default=SERVER_PORT, help=f"port to listen on (default {SERVER_PORT})")
+    serve_parser.add_argument("--db", help="job database (default jobs.sqlite in the cache directory)")
+    serve_parser.add_argument("--workers", type=int, default=0, help="worker processes to start on this machine")
+    serve_parser.set_defaults(func=command_serve)
+
+    worker_parser = subparsers.add_parser("worker", help="render jobs from a render server")
+    worker_parser.add_argument("--server", default=get_server_url(), help=f"render server URL (default {get_server_url()})")
+    worker_parser.add_argument("--name", help="worker name shown in the job list (default host and process id)")
+    worker_parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+    worker_parser.add_argument("-q", "--quiet", action="store_true", help="do not log jobs")
+    worker_parser.set_defaults(func=command_worker)
+
+    jobs_parser = subparsers.add_parser("jobs", help="list the jobs of a render server")
+    jobs_parser.add_argument("--server", default=get_server_url(), help=f"render server URL (default {get_server_url()})")
+    jobs_parser.add_argument("--cancel", type=int, action="append", metavar="ID", help="cancel a job first, repeatable")
+    jobs_parser.set_defaults(func=command_jobs)
+
+    analyze_parser = subparsers.add_parser("analyze", help="show which clips can skip the video encode")
+    analyze_parser.add_argument("--intro", required=True, help="video that plays once at the start")
+    analyze_parser.add_argument("--body", help="video that loops for the rest of the audio")
+    analyze_parser.set_defaults(func=command_analyze)
+
+    calibrate_parser = subparsers.add_parser("calibrate", help="pick the fastest preset that meets a quality or size target")
+    calibrate_parser.add_argument("--intro", required=True, help="video that plays once at the start")
+    calibrate_parser.add_argument("--body", help="looping video, used for the trial encodes when given")
+    calibrate_parser.add_argument("--profile", default=DEFAULT_PROFILE, help="profile whose CRF, tune and frame rate are kept")
+    calibrate_parser.add_argument("--crf", type=int, help="CRF for the trial encodes, overrides the profile")
+    calibrate_parser.add_argument("--tune", help="x264 tune for the trial encodes, overrides the profile")
+    calibrate_parser.add_argument("--target-ssim", type=float, help="minimum SSIM against the source (default 0.97)")
+    calibrate_parser.add_argument("--target-size", type=float, metavar="MB", help="maximum output size per hour")
+    calibrate_parser.add_argument("--seconds", type=float, default=20, help="length of the trial sample (default 20)")
+    calibrate_parser.add_argument("--save-as", default="calibrated", help="name of the saved profile (default calibrated)")
+    calibrate_parser.set_defaults(func=command_calibrate)
+
+    history_parser = subparsers.add_parser("history", help="compare render speed across versions")
+    history_parser.add_argument("-n", "--limit", type=int, help="only look at the last N renders")
+    history_parser.add_argument("--threshold", type=float, default=10,
+                                help="percent slowdown against the previous build that is flagged (default 10)")
+    history_parser.add_argument("-v", "--verbose", action="store_true", help="show the ffmpeg version of every build")
+    history_parser.set_defaults(func=command_history)
+
+    update_parser = subparsers.add_parser("update", help="update the application files from the latest release")
+    update_parser.add_argument("--check", action="store_true", help="only report whether an update exists, exit 1 if so")
+    update_parser.add_argument("--url", default=UPDATE_URL, help="where the release files are published")
+    update_parser.add_argument("--app-dir", default=os.path.dirname(os.path.abspath(__file__)),
+                               help="folder of the files to update (default: next to this script)")
+    update_parser.set_defaults(func=command_update)
+
+    manifest_parser = subparsers.add_parser("update-manifest", help="write the hash manifest published with a release")
+    manifest_parser.add_argument("files", nargs="+", help="release files")
+    manifest_parser.add_argument("-o", "--output", required=True, help="manifest path")
+    manifest_parser.add_argument("--version", help="release version shown to users")
+    manifest_parser.set_defaults(func=command_update_manifest)
+
+    args = parser.parse_args(argv)
+    debug = args.debug
+    configure_artifact_cache(not args.no_cache, args.cache_limit)
+    if args.scratch_dir:
+        if not os.path.isdir(args.scratch_dir):
+            parser.error(f"scratch directory {args.scratch_dir} does not exist")
+        configure_scratch_root(os.path.abspath(args.scratch_dir))
+
+    # A service manager stopping the watcher or a render gets the same cleanup as Ctrl-C
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return 130
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())